@@ -20,16 +20,23 @@ import smtplib
 import csv
 import xmltodict 
 import threading
+import multiprocessing
 import queue
 import configparser 
 import re
+import argparse
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
 
+from nfe.nfe_parser import NFeParser
+from nfe.nfe_filtro import interpretar_filtro
+from config.config_settings import ConfigManager, OPCOES_AVANCADAS_PADRAO, OPCOES_INTERFACE
+from services.backup_service import BackupService, ler_opcoes_avancadas
+
 class App(tk.Tk):
-    def __init__(self):
+    def __init__(self, filtro_chaves=None):
         super().__init__()
         self.title("Agendador e Trabalhador de NFEs")
         self.geometry("800x650")
@@ -39,6 +46,9 @@ class App(tk.Tk):
         self.after(200, self.iconify) # Minimiza novamente (truque para funcionar em todos os sistemas)
         
         self.log_queue = queue.Queue() 
+        self.nfe_parser = NFeParser()
+        self.opcoes_avancadas = dict(OPCOES_AVANCADAS_PADRAO) # Opções de [Options] sem campo na tela
+        self.filtro_chaves_cli = filtro_chaves # Filtro de chaves passado com --filtro (não é salvo)
         self.create_widgets()
         self.process_log_queue() 
 
@@ -51,79 +61,6 @@ class App(tk.Tk):
         # --- NOVO: Inicia a contagem regressiva ---
         self._start_countdown()
 
-    # ========================================
-    # NOVA FUNÇÃO: EXTRAÇÃO DA CHAVE DE ACESSO
-    # ========================================
-    def extrair_chave_de_acesso_do_xml(self, caminho_arquivo_xml):
-        """
-        Extrai a chave de acesso do arquivo XML da NFe.
-        A chave está no atributo Id do elemento infNFe.
-        Retorna a chave de 44 dígitos ou None se não encontrar.
-        """
-        try:
-            with open(caminho_arquivo_xml, 'r', encoding='utf-8') as arquivo:
-                xml_content = arquivo.read()
-                
-            # Procura pelo padrão: <infNFe Id="NFe{44 dígitos}">
-            pattern = r'<infNFe\s+Id="NFe(\d{44})"'
-            match = re.search(pattern, xml_content)
-            
-            if match:
-                return match.group(1)
-            
-            # Procura em outros formatos possíveis
-            pattern2 = r'Id="NFe(\d{44})"'
-            match2 = re.search(pattern2, xml_content)
-            if match2:
-                return match2.group(1)
-                
-            return None
-            
-        except Exception as e:
-            self.log_message(f"ERRO ao extrair chave de acesso de {os.path.basename(caminho_arquivo_xml)}: {e}")
-            return None
-
-    # ========================================
-    # NOVA FUNÇÃO: VALIDAÇÃO POR CHAVE DE ACESSO
-    # ========================================
-    def pertence_ao_mes_referencia_por_chave(self, chave_acesso, mes_referencia_datetime):
-        """
-        Verifica se a NFe pertence ao mês de referência baseado na chave de acesso.
-        A chave de acesso possui 44 dígitos: nas posições 3-6 estão AAMM (Ano e Mês).
-        
-        Args:
-            chave_acesso (str): Chave de 44 dígitos da NFe
-            mes_referencia_datetime (datetime): Data do mês de referência
-            
-        Returns:
-            bool: True se a NFe pertence ao mês de referência
-        """
-        if not chave_acesso or len(chave_acesso) != 44:
-            return False
-        
-        try:
-            # Extrai AAMM das posições 3-6 (índices 2-5)
-            aamm = chave_acesso[2:6]
-            
-            # AA (ano de 2 dígitos) + MM (mês)
-            ano_2_digitos = aamm[:2]
-            mes_str = aamm[2:4]
-            
-            # Converte ano de 2 dígitos para 4 dígitos (assumindo 20XX)
-            ano_nfe = int("20" + ano_2_digitos)
-            mes_nfe = int(mes_str)
-            
-            # Valida se o mês está no range correto
-            if mes_nfe < 1 or mes_nfe > 12:
-                return False
-            
-            # Verifica se ano e mês da NFe coincidem com o mês de referência
-            return (ano_nfe == mes_referencia_datetime.year and 
-                    mes_nfe == mes_referencia_datetime.month)
-                    
-        except (ValueError, IndexError):
-            return False
-
     def create_widgets(self):
         print("DEBUG: Entrou em create_widgets. Criando as abas...")
         # Notebook para abas
@@ -214,7 +151,8 @@ class App(tk.Tk):
         config['Options'] = {
             'enable_email': str(self.enable_email_var.get()),
             'enable_rclone_upload': str(self.enable_rclone_upload_var.get()),
-            'enable_prerequisites_check': str(self.enable_prerequisites_check_var.get())
+            'enable_prerequisites_check': str(self.enable_prerequisites_check_var.get()),
+            **self.opcoes_avancadas # Preserva as opções sem campo na tela
         }
         
         try:
@@ -269,124 +207,15 @@ class App(tk.Tk):
         self.enable_email_var.set(config.getboolean('Options', 'enable_email', fallback=True))
         self.enable_rclone_upload_var.set(config.getboolean('Options', 'enable_rclone_upload', fallback=True))
         self.enable_prerequisites_check_var.set(config.getboolean('Options', 'enable_prerequisites_check', fallback=True))
+
+        # Guarda as opções avançadas (sem campo na tela) para usar e preservar ao salvar
+        if config.has_section('Options'):
+            for opcao, valor in config.items('Options'):
+                if opcao not in OPCOES_INTERFACE:
+                    self.opcoes_avancadas[opcao] = valor
         
         self.log_message("Configurações carregadas de config.ini")
 
-# ================================================================================
-# ================================= COLE ESTA NOVA VERSÃO NO LUGAR DA SUA FUNÇÃO extrair_dados_de_xml
-# ================================================================================
-    def extrair_dados_de_xml(self, caminho_arquivo_xml, canceled_keys_set):
-        """
-        Lê um arquivo XML de NFe e retorna uma LISTA de dicionários, 
-        um para cada item/produto na nota.
-        """
-        # Dicionário para traduzir os códigos de pagamento
-        pagamento_map = {
-            '01': 'Dinheiro', '02': 'Cheque', '03': 'Cartão de Crédito', '04': 'Cartão de Débito',
-            '05': 'Crédito Loja', '10': 'Vale Alimentação', '11': 'Vale Refeição',
-            '15': 'Boleto Bancário', '16': 'Depósito Bancário', '17': 'PIX',
-            '90': 'Sem Pagamento', '99': 'Outros'
-        }
-
-        try:
-            with open(caminho_arquivo_xml, 'r', encoding='utf-8') as arquivo:
-                nfe_dict = xmltodict.parse(arquivo.read())
-            
-            infNFe = nfe_dict.get('nfeProc', {}).get('NFe', {}).get('infNFe', {})
-            if not infNFe:
-                infNFe = nfe_dict.get('NFe', {}).get('infNFe', {})
-            if not infNFe:
-                self.log_message(f"AVISO: Estrutura XML não reconhecida em {os.path.basename(caminho_arquivo_xml)}")
-                return []
-            
-# ============================= NOVAS EXTRAÇÕES ==============================
-
-            chave_acesso = infNFe.get('@Id', 'NFe').replace('NFe', '')
-            status = 'Cancelada' if chave_acesso in canceled_keys_set else 'Autorizada'
-            
-            pagamento_info = infNFe.get('pag', {}).get('detPag', {})
-            # Se houver múltiplos pagamentos, pegamos o primeiro
-            if isinstance(pagamento_info, list):
-                pagamento_info = pagamento_info[0]
-            
-            cod_pagamento = pagamento_info.get('tPag', '99')
-            forma_pagamento = pagamento_map.get(cod_pagamento, 'Outros') 
-
-            # 1. Pega os dados gerais da nota (que se repetem para cada produto)
-            dados_gerais = {
-                'arquivo': os.path.basename(caminho_arquivo_xml),
-                'data_emissao': infNFe.get('ide', {}).get('dhEmi', 'N/A'),
-                'numero_nfe': infNFe.get('ide', {}).get('nNF', 'N/A'),
-                'emitente_nome': infNFe.get('emit', {}).get('xNome', 'N/A'),
-                'emitente_cnpj': infNFe.get('emit', {}).get('CNPJ', 'N/A'),
-                'destinatario_nome': infNFe.get('dest', {}).get('xNome', 'N/A'),
-                'valor_total_nota': infNFe.get('total', {}).get('ICMSTot', {}).get('vNF', '0.00'),
-                'status': status, # <-- NOVO CAMPO
-                'forma_pagamento': forma_pagamento # <-- NOVO CAMPO
-            }
-
-            lista_produtos = []
-            itens_nfe = infNFe.get('det', [])
-
-            # Garante que 'itens_nfe' seja sempre uma lista, mesmo que haja um só produto
-            if not isinstance(itens_nfe, list):
-                itens_nfe = [itens_nfe]
-
-            # 2. Itera sobre cada produto da nota
-            for item in itens_nfe:
-                prod = item.get('prod', {})
-                
-                dados_produto_especifico = {
-                    'codigo_produto': prod.get('cProd', 'N/A'),
-                    'descricao_produto': prod.get('xProd', 'N/A'),
-                    'ncm': prod.get('NCM', 'N/A'),
-                    'quantidade': prod.get('qCom', '0'),
-                    'valor_unitario': prod.get('vUnCom', '0.00'),
-                    'valor_total_produto': prod.get('vProd', '0.00'),
-                }
-                
-                # 3. Junta os dados gerais com os dados do produto específico
-                linha_completa = {**dados_gerais, **dados_produto_especifico}
-                lista_produtos.append(linha_completa)
-            
-            return lista_produtos
-
-        except Exception as e:
-            self.log_message(f"ERRO ao processar o arquivo XML {os.path.basename(caminho_arquivo_xml)}: {e}")
-            return [] # Retorna uma lista vazia em caso de erro 
-
-    def salvar_dados_em_csv(self, lista_de_dados, caminho_arquivo_csv, total_geral):
-        """
-        Salva uma lista de dados de produtos (uma linha por produto) em um arquivo CSV.
-        """
-        if not lista_de_dados:
-            self.log_message("Nenhum dado de NFe para salvar no resumo CSV.")
-            return
-        try:
-            # --- NOVO CABEÇALHO PARA O RELATÓRIO DETALHADO ---
-            cabecalho = [
-                'status', 'arquivo', 'data_emissao', 'numero_nfe', 'emitente_nome', 'emitente_cnpj', 
-                'destinatario_nome', 'forma_pagamento', 'codigo_produto', 'descricao_produto', 'ncm', 
-                'quantidade', 'valor_unitario', 'valor_total_produto', 'valor_total_nota'
-            ]
-            
-            with open(caminho_arquivo_csv, 'w', newline='', encoding='utf-8-sig') as arquivo_csv:
-                escritor = csv.DictWriter(arquivo_csv, fieldnames=cabecalho, delimiter=';')
-                escritor.writeheader()
-                escritor.writerows(lista_de_dados)
-                
-                # Escreve a linha de total com o valor que já foi calculado antes
-                escritor.writerow({})
-                linha_total = {
-                    'valor_total_produto': 'TOTAL GERAL DAS NOTAS:',
-                    'valor_total_nota': f'{total_geral:.2f}'.replace('.', ',')
-                }
-                escritor.writerow(linha_total)
-
-            self.log_message(f"SUCESSO: Resumo detalhado salvo em '{caminho_arquivo_csv}'")
-        except Exception as e:
-            self.log_message(f"ERRO ao salvar o arquivo CSV detalhado: {e}") 
-        
     def create_settings_tab(self, parent_frame):
         # Exemplo de campo de configuração
         ttk.Label(parent_frame, text="Pasta Origem:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
@@ -605,7 +434,12 @@ class App(tk.Tk):
             "enable_email": self.enable_email_var.get(),
             "enable_rclone_upload": self.enable_rclone_upload_var.get(),
             "enable_prerequisites_check": self.enable_prerequisites_check_var.get(),
+            # Opções de [Options] convertidas pelo serviço de backup
+            **ler_opcoes_avancadas(self.opcoes_avancadas),
         }
+        # O filtro passado na linha de comando (--filtro) tem prioridade sobre o config.ini
+        if self.filtro_chaves_cli is not None:
+            settings["filtro_chaves"] = self.filtro_chaves_cli
         return settings
 
     def send_script_email(self, subject, body, attachment_path=None):
@@ -689,119 +523,32 @@ class App(tk.Tk):
                     raise Exception("Pré-requisitos não atendidos. Verifique o log para detalhes.")
                 self.log_message("Pré-requisitos verificados com sucesso.")
 
-            # 2. LÓGICA DE DATAS E PASTAS
+            # Nomes dos meses em português (pastas e arquivos do backup)
             try:
                 locale.setlocale(locale.LC_ALL, 'pt_BR.UTF-8')
             except locale.Error:
                 locale.setlocale(locale.LC_ALL, 'Portuguese_Brazil.1252')
-            hoje = datetime.now()
-            primeiro_dia_mes_atual = hoje.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            mes_de_referencia = (primeiro_dia_mes_atual - timedelta(days=1)).replace(day=1)
-            
-            self.log_message(f"NOVA LÓGICA: Buscando NFes do mês {mes_de_referencia.strftime('%m/%Y')} baseado na CHAVE DE ACESSO")
-            
-            nome_mes_referencia = mes_de_referencia.strftime('%B').upper()
-            nome_pasta_destino_local = f"{mes_de_referencia.strftime('%Y-%m')}_{nome_mes_referencia}"
-            pasta_destino_completa = os.path.join(settings["pasta_destino_base"], nome_pasta_destino_local)
-            if not os.path.exists(pasta_destino_completa):
-                os.makedirs(pasta_destino_completa)
-
-            # ========================================
-            # 3. NOVA LÓGICA DE BUSCA DE ARQUIVOS
-            # ========================================
-            self.log_message(f"Procurando arquivos .xml em '{settings['pasta_origem']}'...")
-            self.log_message("ATENÇÃO: Agora filtrando por CHAVE DE ACESSO (mês/ano da emissão) em vez de data do arquivo!")
-            
-            canceled_keys = self._find_canceled_invoices(settings['pasta_origem'])
-            
-            # Busca TODOS os arquivos XML
-            todos_arquivos_xml = [
-                os.path.join(root, file)
-                for root, _, files in os.walk(settings["pasta_origem"])
-                for file in files
-                if file.endswith(".xml")
-            ]
-            
-            self.log_message(f"Encontrados {len(todos_arquivos_xml)} arquivos XML no total. Verificando chaves de acesso...")
-            
-            # Filtra apenas os arquivos que pertencem ao mês de referência
-            arquivos_para_copiar = []
-            arquivos_verificados = 0
-            
-            for arquivo_xml in todos_arquivos_xml:
-                arquivos_verificados += 1
-                if arquivos_verificados % 100 == 0:  # Log a cada 100 arquivos
-                    self.log_message(f"Verificados {arquivos_verificados}/{len(todos_arquivos_xml)} arquivos...")
-                
-                try:
-                    chave_acesso = self.extrair_chave_de_acesso_do_xml(arquivo_xml)
-                    if chave_acesso and self.pertence_ao_mes_referencia_por_chave(chave_acesso, mes_de_referencia):
-                        arquivos_para_copiar.append(arquivo_xml)
-                        # Log individual para debugar
-                        aamm = chave_acesso[2:6]
-                        self.log_message(f"✅ INCLUÍDO: {os.path.basename(arquivo_xml)} (AAMM: {aamm})")
-                except Exception as e:
-                    # Se der erro ao ler o XML, pula o arquivo
-                    self.log_message(f"AVISO: Erro ao verificar {os.path.basename(arquivo_xml)}: {e}")
-                    continue
-
-            # 4. PROCESSO PRINCIPAL
-            if arquivos_para_copiar:
-                # Configura a barra de progresso
-                self.log_message(f"🎯 RESULTADO: {len(arquivos_para_copiar)} arquivos do mês {mes_de_referencia.strftime('%m/%Y')} serão copiados!")
-                total_steps = 1 + len(arquivos_para_copiar) + 1 + 1 
-                if settings["enable_rclone_upload"]:
-                    total_steps += 2
-                self.log_message(("__PROGRESS_SETUP_DETERMINATE__", total_steps))
-                self.log_message(("__PROGRESS_STEP__", 1))
 
-                # Cópia dos Arquivos
-                caminhos_arquivos_copiados = []
-                for arquivo in arquivos_para_copiar:
-                    try:
-                        shutil.copy(arquivo, pasta_destino_completa)
-                        caminhos_arquivos_copiados.append(os.path.join(pasta_destino_completa, os.path.basename(arquivo)))
-                        self.log_message(("__PROGRESS_STEP__", 1))
-                    except Exception as e:
-                        error_messages.append(f"Erro ao copiar '{os.path.basename(arquivo)}': {e}")
-                
-                # Geração do CSV
-                lista_dados_extraidos = []
-                total_geral_notas = 0.0
-                notas_ja_somadas = set()
-                if caminhos_arquivos_copiados:
-                    self.log_message("Iniciando extração de dados das NFes...")
-                    for caminho_nfe in caminhos_arquivos_copiados:
-                        produtos_da_nota = self.extrair_dados_de_xml(caminho_nfe, canceled_keys)
-                        if produtos_da_nota:
-                            lista_dados_extraidos.extend(produtos_da_nota)
-                            info_nota = produtos_da_nota[0]
-                            if info_nota['arquivo'] not in notas_ja_somadas and info_nota['status'] == 'Autorizada':
-                                try:
-                                    total_geral_notas += float(info_nota['valor_total_nota'].replace(',', '.'))
-                                    notas_ja_somadas.add(info_nota['arquivo'])
-                                except (ValueError, TypeError):
-                                    pass
-                    nome_resumo_csv = f"Resumo_Detalhado_NFEs_{nome_pasta_destino_local}.csv"
-                    caminho_resumo_csv = os.path.join(settings["pasta_destino_base"], nome_resumo_csv)
-                    self.salvar_dados_em_csv(lista_dados_extraidos, caminho_resumo_csv, total_geral_notas)
-                    self.log_message(("__PROGRESS_STEP__", 1))
-
-                # Compactação
-                nome_arquivo_zip = f"NFEs_{mes_de_referencia.strftime('%b').upper()}_{mes_de_referencia.strftime('%Y')}.zip"
-                caminho_arquivo_zip = os.path.join(settings["pasta_destino_base"], nome_arquivo_zip)
-                if os.path.exists(caminho_arquivo_zip): os.remove(caminho_arquivo_zip)
-                self.log_message(f"Iniciando a compactação para '{caminho_arquivo_zip}'...")
-                with zipfile.ZipFile(caminho_arquivo_zip, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                    for f in caminhos_arquivos_copiados:
-                        zipf.write(f, os.path.basename(f))
-                self.log_message("Compactação concluída com sucesso.")
-                self.log_message(("__PROGRESS_STEP__", 1))
+            # 2. VARREDURA, SELEÇÃO DOS MESES E GERAÇÃO DOS ARQUIVOS
+            backup_service = BackupService.das_configuracoes(
+                self.nfe_parser, settings, self.log_message,
+                lambda passos: self.log_message(("__PROGRESS_STEP__", passos))
+            )
+            execucao = backup_service.executar(
+                settings, lambda total_steps: self.log_message(("__PROGRESS_SETUP_DETERMINATE__", total_steps)),
+                2 if settings["enable_rclone_upload"] else 0
+            )
+            error_messages.extend(execucao.erros)
+
+            # 3. UPLOAD DE CADA MÊS
+            for resultado_mes in execucao.resultados:
+                caminho_arquivo_zip = resultado_mes.caminho_zip
+                caminho_resumo_csv = resultado_mes.caminho_csv
 
                 # Upload com Rclone
                 if settings["enable_rclone_upload"]:
                     self.log_message("Iniciando upload para o Google Drive...")
-                    caminho_destino_drive = f"{settings['pasta_base_drive']}/{settings['nome_cliente_especifico']}/{nome_pasta_destino_local}/"
+                    caminho_destino_drive = f"{settings['pasta_base_drive']}/{settings['nome_cliente_especifico']}/{resultado_mes.nome_pasta}/"
                     config_path = os.path.join(os.path.dirname(settings["rclone_path"]), "rclone.conf")
                     try:
                         args_zip = ["copy", caminho_arquivo_zip, f"{settings['rclone_remote_name']}:{caminho_destino_drive}", "--config", config_path, "--progress"]
@@ -811,7 +558,7 @@ class App(tk.Tk):
                     except subprocess.CalledProcessError as e:
                         error_messages.append(f"Upload do ZIP falhou: {e.stderr}")
                     
-                    if os.path.exists(caminho_resumo_csv):
+                    if caminho_resumo_csv and os.path.exists(caminho_resumo_csv):
                         try:
                             args_csv = ["copy", caminho_resumo_csv, f"{settings['rclone_remote_name']}:{caminho_destino_drive}", "--config", config_path, "--progress"]
                             subprocess.run([settings["rclone_path"]] + args_csv, check=True, capture_output=True, text=True)
@@ -819,8 +566,15 @@ class App(tk.Tk):
                             self.log_message(("__PROGRESS_STEP__", 1))
                         except subprocess.CalledProcessError as e:
                             error_messages.append(f"Upload do CSV falhou: {e.stderr}")
-            else:
-                self.log_message(f"⚠️  Nenhum arquivo XML do mês {mes_de_referencia.strftime('%m/%Y')} foi encontrado com base na chave de acesso.")
+
+                    # Totais do mês e, no formato normalizado, tabelas e manifesto
+                    for caminho_relatorio in resultado_mes.relatorios_adicionais:
+                        try:
+                            args_relatorio = ["copy", caminho_relatorio, f"{settings['rclone_remote_name']}:{caminho_destino_drive}", "--config", config_path, "--progress"]
+                            subprocess.run([settings["rclone_path"]] + args_relatorio, check=True, capture_output=True, text=True)
+                            self.log_message(f"SUCESSO: Upload do arquivo '{os.path.basename(caminho_relatorio)}' concluído.")
+                        except subprocess.CalledProcessError as e:
+                            error_messages.append(f"Upload de '{os.path.basename(caminho_relatorio)}' falhou: {e.stderr}")
 
         except Exception as e:
             script_status = "FALHA"
@@ -852,32 +606,46 @@ class App(tk.Tk):
             self.log_message(f"Duração total da execução: {duration}")
             self.log_message("__TASK_COMPLETE__")
 
-    def _find_canceled_invoices(self, folder_path):
-        """
-        Varre uma pasta para encontrar todos os XMLs de evento de cancelamento
-        e retorna um conjunto com as Chaves de Acesso das notas canceladas.
-        """
-        canceled_keys = set()
-        self.log_message("Iniciando verificação de notas canceladas...")
-        for root, _, files in os.walk(folder_path):
-            for file in files:
-                if file.endswith(".xml"):
-                    file_path = os.path.join(root, file)
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            xml_content = f.read()
-                        # O XML de evento é diferente do XML da nota
-                        if '<evento' in xml_content.lower() and '<tpevento>110111</tpevento>' in xml_content:
-                            # Extrai a chave de acesso do evento de cancelamento
-                            chave_match = re.search(r'<chNFe>(\d{44})</chNFe>', xml_content)
-                            if chave_match:
-                                canceled_keys.add(chave_match.group(1))
-                    except Exception as e:
-                        continue  # Ignora arquivos com problemas
-        
-        self.log_message(f"Encontradas {len(canceled_keys)} notas canceladas.")
-        return canceled_keys
+def executar_vigia(config_file='config.ini'):
+    """
+    Modo vigia (sem interface): mantém o índice da pasta de origem atualizado
+    à medida que os XMLs chegam, para que a execução mensal só consulte o índice.
+    """
+    # Importado só aqui: a interface e a execução agendada não dependem do vigia
+    from services.watcher_service import WatcherService
+
+    config = ConfigManager(config_file).load_config()
+    opcoes = ler_opcoes_avancadas({**OPCOES_AVANCADAS_PADRAO, **config.get('Options', {})})
+    nfe_parser = NFeParser(workers_varredura=opcoes["workers_varredura"])
+    vigia = WatcherService(
+        nfe_parser, config['Paths']['pasta_origem'], config['Paths']['pasta_destino_base'],
+        modo=opcoes["vigia_modo"], debounce=opcoes["vigia_debounce"],
+        intervalo_polling=opcoes["vigia_intervalo_polling"]
+    )
+    try:
+        vigia.executar()
+    except KeyboardInterrupt:
+        print("Modo vigia interrompido pelo usuário.")
 
 if __name__ == "__main__":
-    app = App()
-    app.mainloop()
\ No newline at end of file
+    # No executável congelado (PyInstaller/Windows) os processos de extração
+    # reiniciam o programa; freeze_support os desvia para o pool
+    multiprocessing.freeze_support()
+    argumentos = argparse.ArgumentParser(description="Agendador e Trabalhador de NFEs")
+    argumentos.add_argument("--vigiar", action="store_true",
+                            help="vigia a pasta de origem e mantém o índice atualizado (sem interface)")
+    argumentos.add_argument("--filtro", metavar="CRITERIOS",
+                            help="filtro pela chave de acesso, ex.: \"meses=2401-2406; cnpj=12345678000155; modelo=55\" "
+                                 "(substitui a opção filtro_chaves do config.ini)")
+    args = argumentos.parse_args()
+    if args.filtro is not None:
+        try:
+            interpretar_filtro(args.filtro)
+        except ValueError as e:
+            argumentos.error(str(e))
+
+    if args.vigiar:
+        executar_vigia()
+    else:
+        app = App(filtro_chaves=args.filtro)
+        app.mainloop()
\ No newline at end of file
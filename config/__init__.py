@@ -3,6 +3,6 @@
 Módulo de configurações da aplicação NFe
 """
 
-from .settings import ConfigManager
+from .config_settings import ConfigManager
 
 __all__ = ['ConfigManager']
\ No newline at end of file
@@ -8,6 +8,33 @@ import os
 import configparser
 from typing import Dict, Any
 
+
+# Opções de [Options] sem campo na interface (ajustes de desempenho).
+# As janelas preservam esses valores ao salvar as configurações.
+OPCOES_AVANCADAS_PADRAO = {
+    'workers_varredura': '8',
+    'workers_extracao': '0',  # 0 = quantidade de CPUs
+    'motor_xml': 'auto',  # auto, lxml, iterparse ou xmltodict
+    'modo_backup': 'mensal',  # mensal, retroativo ou incremental
+    'meses_retroativos': '12',  # 0 = todos os meses encontrados
+    'meses_simultaneos': '4',
+    'workers_copia': '8',
+    'estrategia_copia': 'copia',  # copia ou link (reflink/hardlink quando origem e destino estão no mesmo volume)
+    'copia_compara_conteudo': 'False',  # True = compara o conteúdo de arquivos com mesmo tamanho e outra data
+    'pasta_do_mes': 'True',  # False = relatórios e ZIP direto da pasta de origem, sem a cópia dos XMLs
+    'workers_compressao': '0',  # 0 = quantidade de CPUs
+    'formato_relatorio': 'detalhado',  # detalhado, normalizado (notas + itens + manifesto) ou ambos
+    'armazem_notas': 'False',  # True = grava notas, itens e cancelamentos em armazem_notas.sqlite3
+    'vigia_modo': 'auto',  # auto, inotify ou polling
+    'vigia_debounce': '2',  # segundos sem mudanças antes de ler um arquivo novo
+    'vigia_intervalo_polling': '10',
+    'filtro_chaves': ''  # ex.: meses=2401-2406; cnpj=12345678000155; modelo=55; serie=1; uf=SP
+}
+
+# Opções de [Options] controladas pelas caixas de seleção da interface
+OPCOES_INTERFACE = ('enable_email', 'enable_rclone_upload', 'enable_prerequisites_check')
+
+
 class ConfigManager:
     """Gerencia as configurações da aplicação"""
     
@@ -39,7 +66,8 @@ class ConfigManager:
             'Options': {
                 'enable_email': 'True',
                 'enable_rclone_upload': 'True',
-                'enable_prerequisites_check': 'True'
+                'enable_prerequisites_check': 'True',
+                **OPCOES_AVANCADAS_PADRAO
             }
         }
     
@@ -8,12 +8,11 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import filedialog
 import os
-import shutil
-import zipfile
 import threading
+import multiprocessing
 import queue
 import locale
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Dict, Any, Optional
 
 
@@ -21,11 +20,12 @@ from typing import Dict, Any, Optional
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config.settings import ConfigManager
-from nfe.parser import NFeParser
+from config.config_settings import ConfigManager, OPCOES_AVANCADAS_PADRAO, OPCOES_INTERFACE
+from nfe.nfe_parser import NFeParser
 from services.email_service import EmailService
 from services.rclone_service import RcloneService
 from services.scheduler_service import SchedulerService
+from services.backup_service import BackupService, ler_opcoes_avancadas
 
 class NFeMainWindow(tk.Tk):
     """Janela principal da aplicação NFe"""
@@ -52,6 +52,9 @@ class NFeMainWindow(tk.Tk):
         # Fila de comunicação para logs
         self.log_queue = queue.Queue()
         
+        # Opções de [Options] sem campo na interface
+        self.opcoes_avancadas = dict(OPCOES_AVANCADAS_PADRAO)
+        
         # Variáveis de controle
         self.countdown_job = None
         self.remaining_time = 10
@@ -294,6 +297,11 @@ class NFeMainWindow(tk.Tk):
         self.enable_rclone_upload_var.set(settings.get('Options', {}).get('enable_rclone_upload', 'True') == 'True')
         self.enable_prerequisites_check_var.set(settings.get('Options', {}).get('enable_prerequisites_check', 'True') == 'True')
         
+        # Preenche opções avançadas (preservadas ao salvar)
+        for opcao, valor in settings.get('Options', {}).items():
+            if opcao not in OPCOES_INTERFACE:
+                self.opcoes_avancadas[opcao] = valor
+        
         self.log_message("Configurações carregadas com sucesso")
     
     def save_config(self):
@@ -320,7 +328,8 @@ class NFeMainWindow(tk.Tk):
             'Options': {
                 'enable_email': str(self.enable_email_var.get()),
                 'enable_rclone_upload': str(self.enable_rclone_upload_var.get()),
-                'enable_prerequisites_check': str(self.enable_prerequisites_check_var.get())
+                'enable_prerequisites_check': str(self.enable_prerequisites_check_var.get()),
+                **self.opcoes_avancadas
             }
         }
         
@@ -347,6 +356,8 @@ class NFeMainWindow(tk.Tk):
             "enable_email": self.enable_email_var.get(),
             "enable_rclone_upload": self.enable_rclone_upload_var.get(),
             "enable_prerequisites_check": self.enable_prerequisites_check_var.get(),
+            # Opções de [Options] convertidas pelo serviço de backup
+            **ler_opcoes_avancadas(self.opcoes_avancadas),
         }
     
     def create_scheduled_task(self):
@@ -435,106 +446,35 @@ class NFeMainWindow(tk.Tk):
                 
                 self.log_message("Pré-requisitos verificados com sucesso.")
 
-            # 2. Configuração de datas e pastas
+            # Nomes dos meses em português (pastas e arquivos do backup)
             try:
                 locale.setlocale(locale.LC_ALL, 'pt_BR.UTF-8')
             except locale.Error:
                 locale.setlocale(locale.LC_ALL, 'Portuguese_Brazil.1252')
-            
-            hoje = datetime.now()
-            primeiro_dia_mes_atual = hoje.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            mes_de_referencia = (primeiro_dia_mes_atual - timedelta(days=1)).replace(day=1)
-            
-            self.log_message(f"NOVA LÓGICA: Buscando NFes do mês {mes_de_referencia.strftime('%m/%Y')} baseado na CHAVE DE ACESSO")
-            
-            nome_mes_referencia = mes_de_referencia.strftime('%B').upper()
-            nome_pasta_destino_local = f"{mes_de_referencia.strftime('%Y-%m')}_{nome_mes_referencia}"
-            pasta_destino_completa = os.path.join(settings["pasta_destino_base"], nome_pasta_destino_local)
-            
-            if not os.path.exists(pasta_destino_completa):
-                os.makedirs(pasta_destino_completa)
 
-            # 3. Busca e filtragem de arquivos
-            arquivos_para_copiar = self.nfe_parser.filtrar_arquivos_por_chave(
-                settings["pasta_origem"], mes_de_referencia, self.log_message
+            # 2. Varredura, seleção dos meses e geração dos arquivos
+            backup_service = BackupService.das_configuracoes(
+                self.nfe_parser, settings, self.log_message,
+                lambda passos: self.log_message(("__PROGRESS_STEP__", passos))
             )
+            execucao = backup_service.executar(
+                settings, lambda total_steps: self.log_message(("__PROGRESS_SETUP_DETERMINATE__", total_steps)),
+                2 if settings["enable_rclone_upload"] else 0
+            )
+            error_messages.extend(execucao.erros)
 
-            # 4. Processamento principal
-            if arquivos_para_copiar:
-                self.log_message(f"🎯 RESULTADO: {len(arquivos_para_copiar)} arquivos do mês {mes_de_referencia.strftime('%m/%Y')} serão copiados!")
-                
-                # Configura barra de progresso
-                total_steps = 1 + len(arquivos_para_copiar) + 1 + 1
-                if settings["enable_rclone_upload"]:
-                    total_steps += 2
-                self.log_message(("__PROGRESS_SETUP_DETERMINATE__", total_steps))
-                self.log_message(("__PROGRESS_STEP__", 1))
-
-                # Cópia dos arquivos
-                caminhos_arquivos_copiados = []
-                for arquivo in arquivos_para_copiar:
-                    try:
-                        shutil.copy(arquivo, pasta_destino_completa)
-                        caminhos_arquivos_copiados.append(
-                            os.path.join(pasta_destino_completa, os.path.basename(arquivo))
-                        )
-                        self.log_message(("__PROGRESS_STEP__", 1))
-                    except Exception as e:
-                        error_messages.append(f"Erro ao copiar '{os.path.basename(arquivo)}': {e}")
-
-                # Geração do CSV
-                lista_dados_extraidos = []
-                total_geral_notas = 0.0
-                notas_ja_somadas = set()
-                
-                if caminhos_arquivos_copiados:
-                    self.log_message("Iniciando extração de dados das NFes...")
-                    
-                    # Busca notas canceladas
-                    canceled_keys = self.nfe_parser.encontrar_notas_canceladas(settings["pasta_origem"])
-                    
-                    for caminho_nfe in caminhos_arquivos_copiados:
-                        produtos_da_nota = self.nfe_parser.extrair_dados_de_xml(caminho_nfe, canceled_keys)
-                        if produtos_da_nota:
-                            lista_dados_extraidos.extend(produtos_da_nota)
-                            info_nota = produtos_da_nota[0]
-                            
-                            if info_nota['arquivo'] not in notas_ja_somadas and info_nota['status'] == 'Autorizada':
-                                try:
-                                    total_geral_notas += float(info_nota['valor_total_nota'].replace(',', '.'))
-                                    notas_ja_somadas.add(info_nota['arquivo'])
-                                except (ValueError, TypeError):
-                                    pass
-                    
-                    # Salva CSV
-                    nome_resumo_csv = f"Resumo_Detalhado_NFEs_{nome_pasta_destino_local}.csv"
-                    caminho_resumo_csv = os.path.join(settings["pasta_destino_base"], nome_resumo_csv)
-                    self.nfe_parser.salvar_dados_em_csv(lista_dados_extraidos, caminho_resumo_csv, total_geral_notas)
-                    self.log_message(("__PROGRESS_STEP__", 1))
-
-                # Compactação
-                nome_arquivo_zip = f"NFEs_{mes_de_referencia.strftime('%b').upper()}_{mes_de_referencia.strftime('%Y')}.zip"
-                caminho_arquivo_zip = os.path.join(settings["pasta_destino_base"], nome_arquivo_zip)
-                
-                if os.path.exists(caminho_arquivo_zip):
-                    os.remove(caminho_arquivo_zip)
-                
-                self.log_message(f"Iniciando a compactação para '{caminho_arquivo_zip}'...")
-                with zipfile.ZipFile(caminho_arquivo_zip, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                    for f in caminhos_arquivos_copiados:
-                        zipf.write(f, os.path.basename(f))
-                
-                self.log_message("Compactação concluída com sucesso.")
-                self.log_message(("__PROGRESS_STEP__", 1))
+            # 3. Upload de cada mês
+            for resultado_mes in execucao.resultados:
+                caminho_resumo_csv = resultado_mes.caminho_csv
 
                 # Upload com Rclone
                 if settings["enable_rclone_upload"]:
                     self.log_message("Iniciando upload para o Google Drive...")
-                    caminho_destino_drive = f"{settings['pasta_base_drive']}/{settings['nome_cliente_especifico']}/{nome_pasta_destino_local}/"
+                    caminho_destino_drive = f"{settings['pasta_base_drive']}/{settings['nome_cliente_especifico']}/{resultado_mes.nome_pasta}/"
                     
                     # Upload do ZIP
                     success_zip = self.rclone_service.upload_file(
-                        settings["rclone_path"], caminho_arquivo_zip,
+                        settings["rclone_path"], resultado_mes.caminho_zip,
                         settings["rclone_remote_name"], caminho_destino_drive
                     )
                     if not success_zip:
@@ -543,7 +483,7 @@ class NFeMainWindow(tk.Tk):
                     self.log_message(("__PROGRESS_STEP__", 1))
                     
                     # Upload do CSV
-                    if os.path.exists(caminho_resumo_csv):
+                    if caminho_resumo_csv and os.path.exists(caminho_resumo_csv):
                         success_csv = self.rclone_service.upload_file(
                             settings["rclone_path"], caminho_resumo_csv,
                             settings["rclone_remote_name"], caminho_destino_drive
@@ -551,9 +491,17 @@ class NFeMainWindow(tk.Tk):
                         if not success_csv:
                             error_messages.append("Upload do CSV falhou")
                     
+                    # Totais do mês e, no formato normalizado, tabelas e manifesto
+                    if resultado_mes.relatorios_adicionais:
+                        resultados_upload = self.rclone_service.upload_files(
+                            settings["rclone_path"], list(resultado_mes.relatorios_adicionais),
+                            settings["rclone_remote_name"], caminho_destino_drive
+                        )
+                        for caminho_relatorio, sucesso in resultados_upload.items():
+                            if not sucesso:
+                                error_messages.append(f"Upload de '{os.path.basename(caminho_relatorio)}' falhou")
+                    
                     self.log_message(("__PROGRESS_STEP__", 1))
-            else:
-                self.log_message(f"⚠️  Nenhum arquivo XML do mês {mes_de_referencia.strftime('%m/%Y')} foi encontrado com base na chave de acesso.")
 
         except Exception as e:
             script_status = "FALHA"
@@ -596,4 +544,11 @@ class NFeMainWindow(tk.Tk):
                     self.email_service.send_notification_email(email_config, subject, body, log_file)
             
             self.log_message(f"Duração total da execução: {duration}")
-            self.log_message("__TASK_COMPLETE__")
\ No newline at end of file
+            self.log_message("__TASK_COMPLETE__")
+
+
+if __name__ == "__main__":
+    # No executável congelado (PyInstaller/Windows) os processos de extração
+    # reiniciam o programa; freeze_support os desvia para o pool
+    multiprocessing.freeze_support()
+    NFeMainWindow().mainloop()
@@ -3,6 +3,8 @@
 Módulo de processamento de arquivos NFe
 """
 
-from .parser import NFeParser
+from .nfe_parser import NFeParser
+from .nfe_indice import IndiceVarredura
+from .nfe_armazem import ArmazemNotas
 
-__all__ = ['NFeParser']
\ No newline at end of file
+__all__ = ['NFeParser', 'IndiceVarredura', 'ArmazemNotas']
\ No newline at end of file
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Totais das NFes do mês
+O AgregadorNotas recebe os itens extraídos (a mesma interface dos escritores
+de relatório) e soma, em uma única passada e com Decimal, o total geral e os
+totais por CNPJ do emitente, forma de pagamento, dia de emissão e NCM.
+Cada chave de acesso é somada uma única vez e notas canceladas ficam de fora.
+"""
+
+import csv
+import os
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, List, Optional, Set
+
+from .nfe_registros import ItemNota
+
+# Colunas do arquivo de totais
+COLUNAS_TOTAIS = ['agrupamento', 'valor_agrupamento', 'quantidade', 'valor_total']
+
+# Agrupamentos do arquivo de totais
+AGRUPAMENTO_GERAL = 'geral'
+AGRUPAMENTO_CNPJ = 'emitente_cnpj'
+AGRUPAMENTO_PAGAMENTO = 'forma_pagamento'
+AGRUPAMENTO_DIA = 'dia_emissao'
+AGRUPAMENTO_NCM = 'ncm'  # Quantidade de itens e soma do valor dos produtos
+
+# Linhas do agrupamento geral
+GERAL_AUTORIZADAS = 'notas_autorizadas'
+GERAL_CANCELADAS = 'notas_canceladas'
+GERAL_DUPLICADAS = 'notas_duplicadas'
+
+CENTAVOS = Decimal('0.01')
+
+
+def valor_decimal(texto) -> Optional[Decimal]:
+    """Converte um valor do XML ('31.50') ou do CSV ('31,50') em Decimal (None se inválido)"""
+    if not texto:
+        return None
+    try:
+        valor = Decimal(str(texto).strip().replace(',', '.'))
+    except InvalidOperation:
+        return None
+    return valor if valor.is_finite() else None
+
+
+def formatar_valor(valor: Decimal) -> str:
+    """Valor com duas casas e vírgula decimal, como no rodapé do resumo CSV"""
+    return f'{valor.quantize(CENTAVOS):f}'.replace('.', ',')
+
+
+class AgregadorNotas:
+    """
+    Soma as notas autorizadas do mês e, ao fechar, grava o arquivo de totais
+    (se um caminho for informado).
+
+    No modo anexar, os totais de um arquivo existente são o ponto de partida
+    (o modo incremental nunca repete uma chave já incluída no backup).
+    """
+
+    def __init__(self, caminho_totais: Optional[str] = None, anexar: bool = False):
+        self.caminho = caminho_totais
+        self.anexar = anexar
+        self.total_geral = Decimal(0)
+        self.notas_autorizadas = 0
+        self.notas_canceladas = 0
+        self.notas_duplicadas = 0
+        self.linhas_escritas = 0
+        # Agrupamento -> valor -> [quantidade, total]
+        self.totais: Dict[str, Dict[str, List]] = {
+            AGRUPAMENTO_CNPJ: {}, AGRUPAMENTO_PAGAMENTO: {}, AGRUPAMENTO_DIA: {}, AGRUPAMENTO_NCM: {},
+        }
+        self._chaves_vistas: Set[str] = set()
+        if anexar and caminho_totais and os.path.exists(caminho_totais):
+            self._carregar(caminho_totais)
+
+    def __enter__(self) -> 'AgregadorNotas':
+        return self
+
+    def __exit__(self, tipo_excecao, excecao, rastreamento) -> None:
+        self.fechar()
+
+    def _somar(self, agrupamento: str, valor_agrupamento: str, quantidade: int, valor: Decimal) -> None:
+        acumulado = self.totais[agrupamento].setdefault(valor_agrupamento, [0, Decimal(0)])
+        acumulado[0] += quantidade
+        acumulado[1] += valor
+
+    def escrever_nota(self, itens: Iterable[ItemNota]) -> None:
+        """
+        Soma os itens de uma nota (ou de várias notas, em sequência).
+
+        Args:
+            itens: Itens extraídos (ver NFeParser.extrair_dados_de_xml)
+        """
+        nota_atual = None
+        incluir_itens = False
+        for item in itens:
+            self.linhas_escritas += 1
+            nota = item.nota
+            if nota is not nota_atual:
+                nota_atual = nota
+                incluir_itens = self._incluir_nota(nota)
+            if incluir_itens:
+                valor_item = valor_decimal(item.valor_total_produto) or Decimal(0)
+                self._somar(AGRUPAMENTO_NCM, item.ncm or '', 1, valor_item)
+
+    def _incluir_nota(self, nota) -> bool:
+        """Soma a nota se for autorizada e ainda não vista; diz se os itens entram nos totais"""
+        identificador = nota.chave_acesso or nota.arquivo
+        if identificador in self._chaves_vistas:
+            self.notas_duplicadas += 1
+            return False
+        self._chaves_vistas.add(identificador)
+
+        if not nota.autorizada:
+            self.notas_canceladas += 1
+            return False
+
+        valor = valor_decimal(nota.valor_total_nota) or Decimal(0)
+        self.notas_autorizadas += 1
+        self.total_geral += valor
+        self._somar(AGRUPAMENTO_CNPJ, nota.emitente_cnpj or '', 1, valor)
+        self._somar(AGRUPAMENTO_PAGAMENTO, nota.forma_pagamento or '', 1, valor)
+        self._somar(AGRUPAMENTO_DIA, (nota.data_emissao or '')[:10], 1, valor)
+        return True
+
+    def _carregar(self, caminho_totais: str) -> None:
+        """Lê os totais de uma execução anterior"""
+        with open(caminho_totais, newline='', encoding='utf-8-sig') as arquivo:
+            for linha in csv.DictReader(arquivo, delimiter=';'):
+                quantidade = int(linha['quantidade'] or 0)
+                valor = valor_decimal(linha['valor_total']) or Decimal(0)
+                agrupamento = linha['agrupamento']
+                if agrupamento == AGRUPAMENTO_GERAL:
+                    if linha['valor_agrupamento'] == GERAL_AUTORIZADAS:
+                        self.notas_autorizadas += quantidade
+                        self.total_geral += valor
+                    elif linha['valor_agrupamento'] == GERAL_CANCELADAS:
+                        self.notas_canceladas += quantidade
+                    elif linha['valor_agrupamento'] == GERAL_DUPLICADAS:
+                        self.notas_duplicadas += quantidade
+                elif agrupamento in self.totais:
+                    self._somar(agrupamento, linha['valor_agrupamento'], quantidade, valor)
+
+    def fechar(self) -> None:
+        """Grava o arquivo de totais (uma linha por agrupamento e valor)"""
+        if not self.caminho or not (self.notas_autorizadas or self.notas_canceladas):
+            return
+        with open(self.caminho, 'w', newline='', encoding='utf-8-sig') as arquivo:
+            escritor = csv.writer(arquivo, delimiter=';')
+            escritor.writerow(COLUNAS_TOTAIS)
+            escritor.writerow([AGRUPAMENTO_GERAL, GERAL_AUTORIZADAS, self.notas_autorizadas,
+                               formatar_valor(self.total_geral)])
+            escritor.writerow([AGRUPAMENTO_GERAL, GERAL_CANCELADAS, self.notas_canceladas, ''])
+            escritor.writerow([AGRUPAMENTO_GERAL, GERAL_DUPLICADAS, self.notas_duplicadas, ''])
+            for agrupamento, valores in self.totais.items():
+                for valor_agrupamento in sorted(valores):
+                    quantidade, valor = valores[valor_agrupamento]
+                    escritor.writerow([agrupamento, valor_agrupamento, quantidade, formatar_valor(valor)])
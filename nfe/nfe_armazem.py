@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Armazém SQLite das notas extraídas
+Guarda as notas, os itens e os cancelamentos de todos os meses já processados,
+para que relatórios entre meses (ex.: comparação ano a ano) sejam consultas
+SQL em vez de uma nova leitura dos XMLs arquivados nos ZIPs. As notas são
+gravadas em lote (executemany dentro de uma transação) e atualizadas pela
+chave de acesso; valores ficam em centavos para que as somas sejam exatas.
+"""
+
+import os
+import sqlite3
+import time
+from decimal import Decimal
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from .nfe_agregacao import valor_decimal
+from .nfe_registros import CabecalhoNota, ItemNota, STATUS_AUTORIZADA, STATUS_CANCELADA
+
+
+# Nome do banco criado dentro da pasta destino base
+NOME_ARQUIVO_ARMAZEM = 'armazem_notas.sqlite3'
+
+# Quantidade de notas acumuladas antes de cada gravação em lote
+TAMANHO_LOTE_ARMAZEM = 500
+
+
+class TotalAgrupado(NamedTuple):
+    """Resultado das consultas de totais do armazém"""
+    grupo: str
+    notas: int
+    valor_total: Decimal
+
+
+def _centavos(texto) -> int:
+    """Valor do XML em centavos (0 se ausente ou inválido)"""
+    valor = valor_decimal(texto)
+    return int((valor * 100).to_integral_value()) if valor is not None else 0
+
+
+def _aamm_da_chave(chave: str) -> Optional[str]:
+    return chave[2:6] if len(chave) == 44 and chave.isdigit() else None
+
+
+def _linha_nota(nota: CabecalhoNota, agora_ns: int) -> Tuple:
+    """Valores da nota na ordem das colunas da tabela notas"""
+    chave = nota.chave_acesso or nota.arquivo
+    return (chave, _aamm_da_chave(chave), nota.arquivo, nota.data_emissao,
+            (nota.data_emissao or '')[:10] or None, nota.numero_nfe, nota.emitente_nome,
+            nota.emitente_cnpj, nota.destinatario_nome, nota.forma_pagamento,
+            _centavos(nota.valor_total_nota), nota.status, agora_ns)
+
+
+class ArmazemNotas:
+    """Banco SQLite com as notas, os itens e os cancelamentos extraídos"""
+
+    def __init__(self, caminho_banco: str):
+        self.caminho_banco = caminho_banco
+        # Vários meses podem ser gravados ao mesmo tempo (uma conexão por mês)
+        self.conexao = sqlite3.connect(caminho_banco, timeout=30)
+        self.conexao.execute('PRAGMA journal_mode=WAL')
+        self.conexao.execute('PRAGMA foreign_keys=ON')
+        self.linhas_escritas = 0
+        self._notas_pendentes = []
+        self._itens_pendentes = []
+        self._criar_tabelas()
+
+    @classmethod
+    def na_pasta(cls, pasta_destino_base: str) -> 'ArmazemNotas':
+        """
+        Abre (ou cria) o armazém padrão dentro da pasta destino base.
+
+        Args:
+            pasta_destino_base: Pasta onde ficam os backups
+
+        Returns:
+            Instância do armazém
+        """
+        if not os.path.exists(pasta_destino_base):
+            os.makedirs(pasta_destino_base)
+        return cls(os.path.join(pasta_destino_base, NOME_ARQUIVO_ARMAZEM))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.fechar()
+
+    def _criar_tabelas(self):
+        """Cria as tabelas e os índices do armazém se ainda não existirem"""
+        with self.conexao:
+            self.conexao.execute('''
+                CREATE TABLE IF NOT EXISTS notas (
+                    chave TEXT PRIMARY KEY,
+                    aamm TEXT,
+                    arquivo TEXT NOT NULL,
+                    data_emissao TEXT,
+                    dia_emissao TEXT,
+                    numero_nfe TEXT,
+                    emitente_nome TEXT,
+                    emitente_cnpj TEXT,
+                    destinatario_nome TEXT,
+                    forma_pagamento TEXT,
+                    valor_total_centavos INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    atualizado_ns INTEGER NOT NULL
+                )
+            ''')
+            self.conexao.execute('''
+                CREATE TABLE IF NOT EXISTS itens (
+                    chave TEXT NOT NULL REFERENCES notas (chave) ON DELETE CASCADE,
+                    item INTEGER NOT NULL,
+                    codigo_produto TEXT,
+                    descricao_produto TEXT,
+                    ncm TEXT,
+                    quantidade TEXT,
+                    valor_unitario TEXT,
+                    valor_total_centavos INTEGER NOT NULL,
+                    PRIMARY KEY (chave, item)
+                ) WITHOUT ROWID
+            ''')
+            self.conexao.execute('''
+                CREATE TABLE IF NOT EXISTS cancelamentos (
+                    chave TEXT PRIMARY KEY,
+                    registrado_ns INTEGER NOT NULL
+                )
+            ''')
+            self.conexao.execute('CREATE INDEX IF NOT EXISTS idx_notas_aamm ON notas (aamm, status)')
+            self.conexao.execute('CREATE INDEX IF NOT EXISTS idx_notas_emitente ON notas (emitente_cnpj, aamm)')
+            self.conexao.execute('CREATE INDEX IF NOT EXISTS idx_notas_dia ON notas (dia_emissao)')
+            self.conexao.execute('CREATE INDEX IF NOT EXISTS idx_itens_ncm ON itens (ncm)')
+
+    def escrever_nota(self, itens: Iterable[ItemNota], nota: Optional[CabecalhoNota] = None) -> None:
+        """
+        Acumula as notas e os itens para a próxima gravação em lote (mesma
+        interface dos escritores de relatório).
+
+        Args:
+            itens: Itens de uma nota (ou de várias notas, em sequência)
+            nota: Cabeçalho da nota, para gravá-la mesmo sem itens (opcional)
+        """
+        nota_atual = None
+        numero_item = 0
+        agora_ns = time.time_ns()
+        for item in itens:
+            if item.nota is not nota_atual:
+                nota_atual = item.nota
+                numero_item = 0
+                linha_nota = _linha_nota(nota_atual, agora_ns)
+                chave = linha_nota[0]
+                self._notas_pendentes.append(linha_nota)
+            numero_item += 1
+            # A posição da nota no lote identifica a ocorrência (a mesma chave pode vir duas vezes)
+            self._itens_pendentes.append((
+                len(self._notas_pendentes) - 1, chave, numero_item, item.codigo_produto,
+                item.descricao_produto, item.ncm, item.quantidade, item.valor_unitario,
+                _centavos(item.valor_total_produto)
+            ))
+            self.linhas_escritas += 1
+        if nota_atual is None and nota is not None:
+            # Nota sem itens: só o cabeçalho
+            self._notas_pendentes.append(_linha_nota(nota, agora_ns))
+        if len(self._notas_pendentes) >= TAMANHO_LOTE_ARMAZEM:
+            self.gravar()
+
+    def gravar(self) -> int:
+        """
+        Grava as notas acumuladas em uma única transação. Notas já existentes
+        são atualizadas pela chave e têm os itens substituídos; notas com
+        cancelamento registrado ficam canceladas.
+
+        Returns:
+            Quantidade de notas gravadas
+        """
+        notas, itens = self._notas_pendentes, self._itens_pendentes
+        self._notas_pendentes, self._itens_pendentes = [], []
+        if not notas:
+            return 0
+        # Chave repetida no lote (ex.: -nfe.xml e -procNFe.xml): vale a última ocorrência
+        ultima_ocorrencia = {nota[0]: posicao for posicao, nota in enumerate(notas)}
+        if len(ultima_ocorrencia) < len(notas):
+            posicoes = set(ultima_ocorrencia.values())
+            notas = [nota for posicao, nota in enumerate(notas) if posicao in posicoes]
+            itens = [item for item in itens if item[0] in posicoes]
+        with self.conexao:
+            self.conexao.executemany(
+                'DELETE FROM itens WHERE chave = ?', ((nota[0],) for nota in notas)
+            )
+            self.conexao.executemany('''
+                INSERT INTO notas (chave, aamm, arquivo, data_emissao, dia_emissao, numero_nfe,
+                                   emitente_nome, emitente_cnpj, destinatario_nome, forma_pagamento,
+                                   valor_total_centavos, status, atualizado_ns)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (chave) DO UPDATE SET
+                    aamm = excluded.aamm, arquivo = excluded.arquivo,
+                    data_emissao = excluded.data_emissao, dia_emissao = excluded.dia_emissao,
+                    numero_nfe = excluded.numero_nfe, emitente_nome = excluded.emitente_nome,
+                    emitente_cnpj = excluded.emitente_cnpj, destinatario_nome = excluded.destinatario_nome,
+                    forma_pagamento = excluded.forma_pagamento,
+                    valor_total_centavos = excluded.valor_total_centavos,
+                    status = CASE WHEN notas.status = ? THEN notas.status ELSE excluded.status END,
+                    atualizado_ns = excluded.atualizado_ns
+            ''', (nota + (STATUS_CANCELADA,) for nota in notas))
+            self.conexao.executemany('''
+                INSERT INTO itens (chave, item, codigo_produto, descricao_produto, ncm,
+                                   quantidade, valor_unitario, valor_total_centavos)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (item[1:] for item in itens))
+            self._aplicar_cancelamentos(nota[0] for nota in notas)
+        return len(notas)
+
+    def registrar_cancelamentos(self, chaves: Iterable[str]) -> None:
+        """
+        Grava as chaves canceladas e marca as notas correspondentes como
+        canceladas, em uma única transação.
+
+        Args:
+            chaves: Chaves de acesso com evento de cancelamento
+        """
+        agora_ns = time.time_ns()
+        with self.conexao:
+            # Só os cancelamentos novos podem mudar notas já gravadas (as demais
+            # foram conferidas ao serem gravadas)
+            novas = [
+                chave for chave in chaves
+                if self.conexao.execute(
+                    'INSERT OR IGNORE INTO cancelamentos (chave, registrado_ns) VALUES (?, ?)',
+                    (chave, agora_ns)
+                ).rowcount
+            ]
+            self._aplicar_cancelamentos(novas)
+
+    def _aplicar_cancelamentos(self, chaves: Iterable[str]) -> None:
+        """
+        Marca como canceladas as notas das chaves informadas que têm
+        cancelamento registrado (dentro da transação atual).
+
+        Args:
+            chaves: Chaves a conferir (notas do lote ou cancelamentos novos)
+        """
+        self.conexao.executemany(
+            'UPDATE notas SET status = ? WHERE chave = ? AND status != ? '
+            'AND chave IN (SELECT chave FROM cancelamentos)',
+            ((STATUS_CANCELADA, chave, STATUS_CANCELADA) for chave in chaves)
+        )
+
+    def consultar(self, sql: str, parametros: Sequence = ()) -> List[Tuple]:
+        """
+        Executa uma consulta SQL livre sobre o armazém.
+
+        Args:
+            sql: Consulta (tabelas notas, itens e cancelamentos)
+            parametros: Parâmetros da consulta
+
+        Returns:
+            Linhas do resultado
+        """
+        return self.conexao.execute(sql, parametros).fetchall()
+
+    def _totais(self, coluna_grupo: str, aamm_inicio: Optional[str], aamm_fim: Optional[str],
+                tabela_itens: bool = False) -> List[TotalAgrupado]:
+        """Soma as notas autorizadas (ou seus itens) agrupadas por uma coluna"""
+        if tabela_itens:
+            sql = (f'SELECT {coluna_grupo}, COUNT(*), SUM(itens.valor_total_centavos) '
+                   'FROM itens JOIN notas ON notas.chave = itens.chave ')
+        else:
+            sql = f'SELECT {coluna_grupo}, COUNT(*), SUM(notas.valor_total_centavos) FROM notas '
+        sql += 'WHERE notas.status = ? AND notas.aamm BETWEEN ? AND ? '
+        sql += f'GROUP BY {coluna_grupo} ORDER BY {coluna_grupo}'
+        cursor = self.conexao.execute(
+            sql, (STATUS_AUTORIZADA, aamm_inicio or '0000', aamm_fim or '9999')
+        )
+        return [TotalAgrupado(grupo or '', notas, Decimal(centavos or 0).scaleb(-2))
+                for grupo, notas, centavos in cursor]
+
+    def totais_por_mes(self, aamm_inicio: Optional[str] = None,
+                       aamm_fim: Optional[str] = None) -> List[TotalAgrupado]:
+        """
+        Total das notas autorizadas por mês (AAMM), para comparações ano a ano.
+
+        Args:
+            aamm_inicio: Primeiro mês (padrão: todos)
+            aamm_fim: Último mês (padrão: todos)
+
+        Returns:
+            Lista de TotalAgrupado por AAMM
+        """
+        return self._totais('notas.aamm', aamm_inicio, aamm_fim)
+
+    def totais_por_emitente(self, aamm_inicio: Optional[str] = None,
+                            aamm_fim: Optional[str] = None) -> List[TotalAgrupado]:
+        """Total das notas autorizadas por CNPJ do emitente no período"""
+        return self._totais('notas.emitente_cnpj', aamm_inicio, aamm_fim)
+
+    def totais_por_ncm(self, aamm_inicio: Optional[str] = None,
+                       aamm_fim: Optional[str] = None) -> List[TotalAgrupado]:
+        """Quantidade de itens e valor dos produtos das notas autorizadas por NCM no período"""
+        return self._totais('itens.ncm', aamm_inicio, aamm_fim, tabela_itens=True)
+
+    def fechar(self) -> None:
+        """Grava as notas pendentes e fecha a conexão com o banco"""
+        try:
+            self.gravar()
+        finally:
+            self.conexao.close()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Decodificação em lote das chaves de acesso da NFe
+Converte listas de chaves de 44 dígitos em um array estruturado do NumPy,
+com um campo por parte da chave. Os filtros por mês, CNPJ ou modelo viram
+operações de máscara sobre o array, sem laços em Python por chave.
+"""
+
+from typing import Iterable, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # numpy é opcional
+    np = None
+
+
+TAMANHO_CHAVE = 44
+
+# Partes da chave de acesso: nome do campo -> (início, fim) na chave
+POSICOES_CHAVE = {
+    'cuf': (0, 2),
+    'aamm': (2, 6),
+    'cnpj': (6, 20),
+    'modelo': (20, 22),
+    'serie': (22, 25),
+    'nnf': (25, 34),
+    'tpemis': (34, 35),
+    'cnf': (35, 43),
+    'dv': (43, 44),
+}
+
+# Pesos do módulo 11 para os 43 primeiros dígitos (2 a 9, da direita para a esquerda)
+PESOS_DV = [2 + (TAMANHO_CHAVE - 2 - posicao) % 8 for posicao in range(TAMANHO_CHAVE - 1)]
+
+if np is not None:
+    # O CNPJ fica em bytes para preservar os zeros à esquerda
+    DTYPE_CHAVE = np.dtype([
+        ('cuf', np.uint8),
+        ('aamm', np.uint16),
+        ('cnpj', 'S14'),
+        ('modelo', np.uint8),
+        ('serie', np.uint16),
+        ('nnf', np.uint32),
+        ('tpemis', np.uint8),
+        ('cnf', np.uint32),
+        ('dv', np.uint8),
+        ('valida', np.bool_),     # 44 dígitos numéricos
+        ('dv_valido', np.bool_),  # Dígito verificador confere com o módulo 11
+    ])
+else:
+    DTYPE_CHAVE = None
+
+
+def numpy_disponivel() -> bool:
+    """Indica se o NumPy está instalado"""
+    return np is not None
+
+
+def calcular_dv(chave_sem_dv: str) -> Optional[int]:
+    """
+    Calcula o dígito verificador (módulo 11) de uma chave de acesso.
+
+    Args:
+        chave_sem_dv: Os 43 primeiros dígitos da chave
+
+    Returns:
+        Dígito verificador, ou None se a entrada não tiver 43 dígitos
+    """
+    if len(chave_sem_dv) != TAMANHO_CHAVE - 1 or not chave_sem_dv.isdigit():
+        return None
+    resto = sum(int(digito) * peso for digito, peso in zip(chave_sem_dv, PESOS_DV)) % 11
+    return 0 if resto < 2 else 11 - resto
+
+
+def _numero(digitos: 'np.ndarray', inicio: int, fim: int) -> 'np.ndarray':
+    """Converte as colunas [inicio, fim) da matriz de dígitos em números"""
+    potencias = 10 ** np.arange(fim - inicio - 1, -1, -1, dtype=np.int64)
+    return digitos[:, inicio:fim] @ potencias
+
+
+def decodificar_chaves(chaves: Sequence[str]) -> 'np.ndarray':
+    """
+    Decodifica um lote de chaves de acesso em um array estruturado (DTYPE_CHAVE).
+
+    Chaves com tamanho errado ou caracteres não numéricos ficam com
+    valida=False e os campos numéricos zerados, mantendo a posição no array
+    alinhada com a lista de entrada.
+
+    Args:
+        chaves: Chaves de acesso de 44 dígitos
+
+    Returns:
+        Array estruturado com uma linha por chave
+    """
+    if np is None:
+        raise RuntimeError("NumPy não está instalado")
+
+    resultado = np.zeros(len(chaves), dtype=DTYPE_CHAVE)
+    if not len(chaves):
+        return resultado
+
+    # Um byte a mais que a chave para detectar entradas maiores que 44 caracteres
+    try:
+        brutas = np.asarray(chaves, dtype=f'S{TAMANHO_CHAVE + 1}')
+    except UnicodeEncodeError:
+        brutas = np.asarray([chave.encode('ascii', 'replace') for chave in chaves],
+                            dtype=f'S{TAMANHO_CHAVE + 1}')
+    matriz = brutas.view(np.uint8).reshape(len(chaves), TAMANHO_CHAVE + 1)
+    digitos = matriz[:, :TAMANHO_CHAVE].astype(np.int64) - ord('0')
+
+    valida = ((matriz[:, TAMANHO_CHAVE] == 0)
+              & ((digitos >= 0) & (digitos <= 9)).all(axis=1))
+    digitos[~valida] = 0
+
+    for campo, (inicio, fim) in POSICOES_CHAVE.items():
+        if campo != 'cnpj':
+            resultado[campo] = _numero(digitos, inicio, fim)
+    inicio_cnpj, fim_cnpj = POSICOES_CHAVE['cnpj']
+    cnpj = np.ascontiguousarray(matriz[:, inicio_cnpj:fim_cnpj])
+    resultado['cnpj'] = np.where(valida, cnpj.view('S14').ravel(), b'')
+
+    # Módulo 11 de todas as chaves de uma vez
+    resto = (digitos[:, :TAMANHO_CHAVE - 1] @ np.array(PESOS_DV, dtype=np.int64)) % 11
+    dv_calculado = np.where(resto < 2, 0, 11 - resto)
+    resultado['valida'] = valida
+    resultado['dv_valido'] = valida & (dv_calculado == digitos[:, TAMANHO_CHAVE - 1])
+    return resultado
+
+
+def mascara_meses(chaves: 'np.ndarray', meses: Iterable) -> 'np.ndarray':
+    """
+    Máscara das chaves emitidas nos meses informados.
+
+    Args:
+        chaves: Array retornado por decodificar_chaves
+        meses: AAMMs desejados, como texto ('2407') ou número (2407)
+
+    Returns:
+        Array booleano alinhado com as chaves
+    """
+    return chaves['valida'] & np.isin(chaves['aamm'], [int(aamm) for aamm in meses])
+
+
+def mascara_cnpjs(chaves: 'np.ndarray', cnpjs: Iterable[str]) -> 'np.ndarray':
+    """Máscara das chaves cujo emitente está na lista de CNPJs (somente dígitos)"""
+    return chaves['valida'] & np.isin(chaves['cnpj'], [cnpj.encode('ascii') for cnpj in cnpjs])
+
+
+def mascara_modelos(chaves: 'np.ndarray', modelos: Iterable) -> 'np.ndarray':
+    """Máscara das chaves dos modelos informados (55 = NF-e, 65 = NFC-e)"""
+    return chaves['valida'] & np.isin(chaves['modelo'], [int(modelo) for modelo in modelos])
+
+
+def indices_da_mascara(mascara: 'np.ndarray') -> List[int]:
+    """Posições verdadeiras da máscara, para indexar a lista original de arquivos"""
+    return np.flatnonzero(mascara).tolist()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Detecção de eventos da NFe direto nos bytes do arquivo
+O elemento raiz, lido de um pequeno prefixo, diz se o documento é um evento
+(evento ou procEventoNFe, com ou sem prefixo de namespace). Só os eventos são
+lidos por inteiro, e tpEvento e chNFe saem de padrões pré-compilados em bytes,
+sem decodificar nem copiar o documento em minúsculas.
+"""
+
+import re
+from typing import NamedTuple, Optional
+
+# Elementos raiz de eventos: o evento assinado e o evento com o retorno da SEFAZ
+RAIZES_EVENTO = frozenset((b'evento', b'procEventoNFe'))
+
+# Elementos raiz de NFes: a nota assinada e a nota com o protocolo de autorização
+RAIZES_NFE = frozenset((b'NFe', b'nfeProc'))
+
+# Tipo do evento de cancelamento
+TIPOS_EVENTO_CANCELAMENTO = frozenset((b'110111',))
+
+# Primeiro elemento do documento, ignorando a declaração XML, comentários e o BOM
+PADRAO_RAIZ = re.compile(rb'<(?![?!])(?:[\w.-]+:)?([\w.-]+)[\s/>]')
+
+# Campos do evento (com ou sem prefixo de namespace)
+PADRAO_TP_EVENTO = re.compile(rb'<(?:[\w.-]+:)?tpEvento>\s*(\d{6})\s*</')
+PADRAO_CH_NFE = re.compile(rb'<(?:[\w.-]+:)?chNFe>\s*(\d{44})\s*</')
+PADRAO_NPROT_EVENTO = re.compile(rb'<(?:[\w.-]+:)?nProt>\s*(\d+)\s*</')
+PADRAO_DH_EVENTO = re.compile(rb'<(?:[\w.-]+:)?dhEvento>([^<]+)</')
+
+
+class EventoLocalizado(NamedTuple):
+    """Tipo do evento e chave da nota a que ele se refere"""
+    tp_evento: str
+    chave: Optional[str]
+
+    @property
+    def cancelamento(self) -> bool:
+        return self.tp_evento.encode('ascii') in TIPOS_EVENTO_CANCELAMENTO
+
+
+def elemento_raiz(prefixo: bytes) -> Optional[bytes]:
+    """
+    Nome local do elemento raiz (sem prefixo de namespace).
+
+    Args:
+        prefixo: Início do arquivo (alguns KB bastam)
+
+    Returns:
+        Nome do elemento ou None se ele não aparecer no prefixo
+    """
+    match = PADRAO_RAIZ.search(prefixo)
+    return match.group(1) if match else None
+
+
+def localizar_evento(conteudo: bytes) -> Optional[EventoLocalizado]:
+    """
+    Lê o tipo do evento e a chave da nota de um evento completo.
+
+    Args:
+        conteudo: Bytes do arquivo XML completo
+
+    Returns:
+        EventoLocalizado ou None se o documento não for um evento
+    """
+    if elemento_raiz(conteudo) not in RAIZES_EVENTO:
+        return None
+    match_tipo = PADRAO_TP_EVENTO.search(conteudo)
+    if not match_tipo:
+        return None
+    match_chave = PADRAO_CH_NFE.search(conteudo)
+    return EventoLocalizado(match_tipo.group(1).decode('ascii'),
+                            match_chave.group(1).decode('ascii') if match_chave else None)
+
+
+def localizar_cancelamento(conteudo: bytes) -> Optional[str]:
+    """
+    Verifica se o conteúdo é um evento de cancelamento.
+
+    Args:
+        conteudo: Bytes do arquivo XML completo
+
+    Returns:
+        Chave da nota cancelada ou None se não for evento de cancelamento
+    """
+    evento = localizar_evento(conteudo)
+    if evento and evento.cancelamento:
+        return evento.chave
+    return None
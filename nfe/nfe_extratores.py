@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Motores de leitura dos XMLs de NFe
+Cada motor lê o arquivo e devolve apenas os campos usados no relatório,
+deixando a montagem das linhas para o NFeParser. Os caminhos dos campos são
+compilados uma única vez por motor e reaproveitados em todos os arquivos.
+Os motores aceitam o caminho do arquivo ou o conteúdo já lido (bytes), para
+que o mesmo conteúdo possa ir para o ZIP sem uma segunda leitura do disco.
+"""
+
+import abc
+import io
+import threading
+import xml.etree.ElementTree as ET
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Tuple, Union
+
+import xmltodict
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # lxml é opcional
+    lxml_etree = None
+
+
+# Nomes dos motores disponíveis
+MOTOR_AUTOMATICO = 'auto'
+MOTOR_XMLTODICT = 'xmltodict'
+MOTOR_ITERPARSE = 'iterparse'
+MOTOR_LXML = 'lxml'
+
+# Ordem de preferência usada no modo automático e como alternativa
+# quando o motor configurado não está instalado
+ORDEM_PREFERENCIA_MOTORES = (MOTOR_LXML, MOTOR_ITERPARSE, MOTOR_XMLTODICT)
+
+# Campos da nota: nome do campo -> caminho de tags a partir do infNFe
+CAMPOS_NOTA = {
+    'dhEmi': ('ide', 'dhEmi'),
+    'nNF': ('ide', 'nNF'),
+    'emit_xNome': ('emit', 'xNome'),
+    'emit_CNPJ': ('emit', 'CNPJ'),
+    'dest_xNome': ('dest', 'xNome'),
+    'vNF': ('total', 'ICMSTot', 'vNF'),
+    'tPag': ('pag', 'detPag', 'tPag'),
+}
+
+# Campos de cada item: nome do campo -> caminho de tags a partir do det
+CAMPOS_ITEM = {
+    'cProd': ('prod', 'cProd'),
+    'xProd': ('prod', 'xProd'),
+    'NCM': ('prod', 'NCM'),
+    'qCom': ('prod', 'qCom'),
+    'vUnCom': ('prod', 'vUnCom'),
+    'vProd': ('prod', 'vProd'),
+}
+
+# Caminhos aceitos até o infNFe (nota com ou sem protocolo)
+CAMINHOS_INFNFE = (('nfeProc', 'NFe', 'infNFe'), ('NFe', 'infNFe'))
+
+
+class DadosNota(NamedTuple):
+    """
+    Campos lidos de uma NFe. Campos ausentes no XML não aparecem nos
+    dicionários; elementos presentes mas vazios aparecem com valor None.
+    """
+    id_infnfe: Optional[str]
+    campos: Dict[str, Optional[str]]
+    itens: List[Dict[str, Optional[str]]]
+
+
+def _abrir_binario(origem: Union[str, bytes]) -> BinaryIO:
+    """Abre o arquivo (caminho) ou envolve o conteúdo já lido (bytes)"""
+    if isinstance(origem, bytes):
+        return io.BytesIO(origem)
+    return open(origem, 'rb')
+
+
+def _texto(texto: Optional[str]) -> Optional[str]:
+    """Mesmo tratamento do xmltodict: espaços removidos e vazio vira None"""
+    if texto:
+        texto = texto.strip()
+    return texto or None
+
+
+class ExtratorXml(abc.ABC):
+    """Base dos motores de leitura; subclasses compilam os campos em __init__"""
+
+    nome = ''
+
+    @classmethod
+    def disponivel(cls) -> bool:
+        """Indica se as dependências do motor estão instaladas"""
+        return True
+
+    @abc.abstractmethod
+    def extrair(self, caminho_arquivo_xml: Union[str, bytes]) -> Optional[DadosNota]:
+        """
+        Lê os campos do relatório de um arquivo XML.
+
+        Args:
+            caminho_arquivo_xml: Caminho para o arquivo XML ou o conteúdo já lido
+
+        Returns:
+            DadosNota ou None se a estrutura não for de uma NFe
+        """
+
+    def __reduce__(self):
+        # Objetos compilados (ex.: XPath do lxml) não são serializáveis:
+        # o processo que recebe o motor compila os campos de novo
+        return (self.__class__, ())
+
+
+class ExtratorXmltodict(ExtratorXml):
+    """Lê o XML inteiro com xmltodict (comportamento original)"""
+
+    nome = MOTOR_XMLTODICT
+
+    def extrair(self, caminho_arquivo_xml: Union[str, bytes]) -> Optional[DadosNota]:
+        if isinstance(caminho_arquivo_xml, bytes):
+            nfe_dict = xmltodict.parse(caminho_arquivo_xml)
+        else:
+            with open(caminho_arquivo_xml, 'r', encoding='utf-8') as arquivo:
+                nfe_dict = xmltodict.parse(arquivo.read())
+
+        infNFe = nfe_dict.get('nfeProc', {}).get('NFe', {}).get('infNFe', {})
+        if not infNFe:
+            infNFe = nfe_dict.get('NFe', {}).get('infNFe', {})
+        if not infNFe:
+            return None
+
+        # Se houver múltiplos pagamentos, vale o primeiro
+        pagamento_info = infNFe.get('pag', {}).get('detPag', {})
+        if isinstance(pagamento_info, list):
+            pagamento_info = pagamento_info[0]
+
+        campos = {}
+        for nome_campo, caminho in CAMPOS_NOTA.items():
+            if nome_campo == 'tPag':
+                if 'tPag' in pagamento_info:
+                    campos['tPag'] = pagamento_info['tPag']
+                continue
+            valor = infNFe
+            for tag in caminho[:-1]:
+                valor = valor.get(tag, {})
+            if caminho[-1] in valor:
+                campos[nome_campo] = valor[caminho[-1]]
+
+        itens_nfe = infNFe.get('det', [])
+        if not isinstance(itens_nfe, list):
+            itens_nfe = [itens_nfe]
+
+        itens = []
+        for item in itens_nfe:
+            prod = item.get('prod', {})
+            itens.append({
+                nome_campo: prod[caminho[-1]]
+                for nome_campo, caminho in CAMPOS_ITEM.items()
+                if caminho[-1] in prod
+            })
+
+        return DadosNota(infNFe.get('@Id'), campos, itens)
+
+
+class ExtratorIterparse(ExtratorXml):
+    """
+    Lê o XML em fluxo com ElementTree.iterparse, sem montar a árvore inteira.
+
+    As tags são comparadas pelo nome local (com ou sem namespace), cada
+    item é descartado da memória assim que seus campos são lidos e a
+    leitura termina no fechamento do infNFe (assinatura e protocolo não
+    são processados).
+    """
+
+    nome = MOTOR_ITERPARSE
+
+    def __init__(self):
+        # Índices invertidos (caminho -> nome do campo)
+        self.campos_nota_por_caminho = {caminho: nome for nome, caminho in CAMPOS_NOTA.items()}
+        self.campos_item_por_caminho = {caminho: nome for nome, caminho in CAMPOS_ITEM.items()}
+        self.caminhos_infnfe = [list(caminho) for caminho in CAMINHOS_INFNFE]
+
+    def extrair(self, caminho_arquivo_xml: Union[str, bytes]) -> Optional[DadosNota]:
+        pilha = []             # Nomes locais dos elementos abertos
+        inicio_infnfe = None   # Profundidade do infNFe na pilha
+        id_infnfe = None
+        campos = {}
+        itens = []
+        item_atual = None
+
+        with _abrir_binario(caminho_arquivo_xml) as arquivo:
+            for evento, elemento in ET.iterparse(arquivo, events=('start', 'end')):
+                nome = elemento.tag.rpartition('}')[2]
+
+                if evento == 'start':
+                    pilha.append(nome)
+                    if inicio_infnfe is None:
+                        if pilha in self.caminhos_infnfe:
+                            inicio_infnfe = len(pilha)
+                            id_infnfe = elemento.get('Id')
+                    elif nome == 'det' and len(pilha) == inicio_infnfe + 1:
+                        item_atual = {}
+                    continue
+
+                if inicio_infnfe is not None and len(pilha) > inicio_infnfe:
+                    relativo = tuple(pilha[inicio_infnfe:])
+                    if item_atual is not None and relativo[0] == 'det':
+                        if len(relativo) == 1:
+                            # Fim do item: guarda os campos e libera o elemento
+                            itens.append(item_atual)
+                            item_atual = None
+                            elemento.clear()
+                        else:
+                            self._guardar_campo(relativo[1:], self.campos_item_por_caminho,
+                                                item_atual, elemento)
+                    else:
+                        self._guardar_campo(relativo, self.campos_nota_por_caminho, campos, elemento)
+                        if len(relativo) == 1:
+                            elemento.clear()
+
+                pilha.pop()
+                if inicio_infnfe is not None and len(pilha) < inicio_infnfe:
+                    break  # Fim do infNFe: o restante do arquivo não é necessário
+
+        if inicio_infnfe is None:
+            return None
+        return DadosNota(id_infnfe, campos, itens)
+
+    @staticmethod
+    def _guardar_campo(caminho: tuple, campos_por_caminho: Dict[tuple, str],
+                       destino: Dict[str, Optional[str]], elemento) -> None:
+        """Guarda o texto do elemento se o caminho for de um campo e ele ainda não foi lido"""
+        nome_campo = campos_por_caminho.get(caminho)
+        if nome_campo and nome_campo not in destino:
+            destino[nome_campo] = _texto(elemento.text)
+
+
+class ExtratorLxml(ExtratorXml):
+    """
+    Lê o XML com o parser em C do lxml e consulta os campos com XPath
+    compilado. As consultas são compiladas uma vez para cada namespace
+    encontrado (na prática, apenas o da NFe e o sem namespace).
+
+    Parser e consultas do lxml não podem ser usados por duas threads ao
+    mesmo tempo, por isso cada thread mantém os seus.
+    """
+
+    nome = MOTOR_LXML
+
+    @classmethod
+    def disponivel(cls) -> bool:
+        return lxml_etree is not None
+
+    def __init__(self):
+        self.estado_thread = threading.local()
+
+    def _parser(self):
+        """Parser da thread atual, sem resolução de entidades nem acesso à rede"""
+        parser = getattr(self.estado_thread, 'parser', None)
+        if parser is None:
+            parser = lxml_etree.XMLParser(resolve_entities=False, no_network=True)
+            self.estado_thread.parser = parser
+            self.estado_thread.consultas_por_namespace = {}
+        return parser
+
+    def _consultas(self, namespace: str) -> Tuple:
+        """Compila (uma única vez por thread) as consultas XPath para o namespace"""
+        consultas_por_namespace = self.estado_thread.consultas_por_namespace
+        consultas = consultas_por_namespace.get(namespace)
+        if consultas is None:
+            prefixo = 'n:' if namespace else ''
+            mapa = {'n': namespace} if namespace else None
+
+            def compilar(caminho):
+                expressao = '/'.join(prefixo + tag for tag in caminho)
+                return lxml_etree.XPath(expressao, namespaces=mapa)
+
+            # Caminhos até o infNFe a partir da raiz, indexados pelo nome da raiz
+            infnfe = {caminho[0]: compilar(caminho[1:]) for caminho in CAMINHOS_INFNFE}
+            campos_nota = [(nome, compilar(caminho)) for nome, caminho in CAMPOS_NOTA.items()]
+            det = compilar(('det',))
+            campos_item = [(nome, compilar(caminho)) for nome, caminho in CAMPOS_ITEM.items()]
+            consultas = (infnfe, campos_nota, det, campos_item)
+            consultas_por_namespace[namespace] = consultas
+        return consultas
+
+    def extrair(self, caminho_arquivo_xml: Union[str, bytes]) -> Optional[DadosNota]:
+        if isinstance(caminho_arquivo_xml, bytes):
+            raiz = lxml_etree.fromstring(caminho_arquivo_xml, self._parser())
+        else:
+            raiz = lxml_etree.parse(caminho_arquivo_xml, self._parser()).getroot()
+        namespace, _, nome_raiz = raiz.tag.rpartition('}')
+        infnfe, campos_nota, det, campos_item = self._consultas(namespace.lstrip('{'))
+
+        consulta_infnfe = infnfe.get(nome_raiz)
+        encontrados = consulta_infnfe(raiz) if consulta_infnfe is not None else []
+        if not encontrados:
+            return None
+        infNFe = encontrados[0]
+
+        campos = {}
+        for nome_campo, consulta in campos_nota:
+            elementos = consulta(infNFe)
+            if elementos:
+                campos[nome_campo] = _texto(elementos[0].text)
+
+        itens = []
+        for elemento_det in det(infNFe):
+            item = {}
+            for nome_campo, consulta in campos_item:
+                elementos = consulta(elemento_det)
+                if elementos:
+                    item[nome_campo] = _texto(elementos[0].text)
+            itens.append(item)
+
+        return DadosNota(infNFe.get('Id'), campos, itens)
+
+
+# Registro dos motores disponíveis para o NFeParser
+MOTORES_EXTRACAO = {
+    MOTOR_XMLTODICT: ExtratorXmltodict,
+    MOTOR_ITERPARSE: ExtratorIterparse,
+    MOTOR_LXML: ExtratorLxml,
+}
+
+
+def criar_extrator(nome_motor: str = MOTOR_AUTOMATICO) -> ExtratorXml:
+    """
+    Cria o motor pedido, recorrendo à ordem de preferência quando ele é
+    'auto', desconhecido ou não está instalado.
+
+    Args:
+        nome_motor: Nome do motor ('auto', 'lxml', 'iterparse' ou 'xmltodict')
+
+    Returns:
+        Instância do motor escolhido (o nome fica em .nome)
+    """
+    classe = MOTORES_EXTRACAO.get((nome_motor or MOTOR_AUTOMATICO).strip().lower())
+    if classe is not None and classe.disponivel():
+        return classe()
+
+    for nome in ORDEM_PREFERENCIA_MOTORES:
+        if MOTORES_EXTRACAO[nome].disponivel():
+            return MOTORES_EXTRACAO[nome]()
+    return ExtratorXmltodict()
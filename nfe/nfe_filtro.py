@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filtros sobre a chave de acesso da NFe
+Um filtro é descrito em texto (opção filtro_chaves do config.ini ou --filtro
+na linha de comando) e compilado em um predicado sobre a chave de acesso, de
+modo que a seleção acontece antes de qualquer arquivo ser aberto.
+
+Formato: critérios separados por ';', valores por ',' e intervalos por '-'
+    meses=2401-2406,2409; cnpj=12.345.678/0001-55; modelo=55; serie=1-3; uf=SP,41
+"""
+
+import re
+from typing import Callable, FrozenSet, List, NamedTuple, Tuple
+
+from .nfe_chaves import POSICOES_CHAVE, TAMANHO_CHAVE, np
+
+# Códigos IBGE das UFs (posições 1-2 da chave)
+CODIGOS_UF = {
+    'RO': 11, 'AC': 12, 'AM': 13, 'RR': 14, 'PA': 15, 'AP': 16, 'TO': 17,
+    'MA': 21, 'PI': 22, 'CE': 23, 'RN': 24, 'PB': 25, 'PE': 26, 'AL': 27, 'SE': 28, 'BA': 29,
+    'MG': 31, 'ES': 32, 'RJ': 33, 'SP': 35,
+    'PR': 41, 'SC': 42, 'RS': 43,
+    'MS': 50, 'MT': 51, 'GO': 52, 'DF': 53,
+}
+
+# Modelos aceitos na chave: 55 = NF-e, 65 = NFC-e
+MODELOS_VALIDOS = (55, 65)
+
+
+class FiltroChaves(NamedTuple):
+    """Critérios de seleção pela chave de acesso (critério vazio = não filtra)"""
+    meses: Tuple[Tuple[int, int], ...] = ()    # Intervalos de AAMM (inclusivos)
+    cnpjs: FrozenSet[str] = frozenset()         # CNPJs do emitente (somente dígitos)
+    modelos: FrozenSet[int] = frozenset()
+    series: Tuple[Tuple[int, int], ...] = ()   # Intervalos de série (inclusivos)
+    ufs: FrozenSet[int] = frozenset()           # Códigos IBGE
+
+    @property
+    def vazio(self) -> bool:
+        return not any(self)
+
+
+def _intervalos(valores: List[str], criterio: str) -> Tuple[Tuple[int, int], ...]:
+    """Converte valores como '2401' ou '2401-2406' em intervalos inclusivos"""
+    intervalos = []
+    for valor in valores:
+        inicio, _, fim = valor.partition('-')
+        if not inicio.strip().isdigit() or (fim and not fim.strip().isdigit()):
+            raise ValueError(f"Valor inválido para '{criterio}' no filtro: '{valor}'")
+        inicio = int(inicio)
+        fim = int(fim) if fim else inicio
+        if fim < inicio:
+            raise ValueError(f"Intervalo invertido para '{criterio}' no filtro: '{valor}'")
+        intervalos.append((inicio, fim))
+    return tuple(intervalos)
+
+
+def _validar_meses(intervalos: Tuple[Tuple[int, int], ...]) -> None:
+    for inicio, fim in intervalos:
+        for aamm in (inicio, fim):
+            if aamm > 9999 or not 1 <= aamm % 100 <= 12:
+                raise ValueError(f"Mês inválido no filtro (use AAMM): '{aamm:04d}'")
+
+
+def _cnpjs(valores: List[str]) -> FrozenSet[str]:
+    cnpjs = set()
+    for valor in valores:
+        cnpj = re.sub(r'[.\-/\s]', '', valor)
+        if len(cnpj) != 14 or not cnpj.isdigit():
+            raise ValueError(f"CNPJ inválido no filtro: '{valor}'")
+        cnpjs.add(cnpj)
+    return frozenset(cnpjs)
+
+
+def _modelos(valores: List[str]) -> FrozenSet[int]:
+    modelos = set()
+    for valor in valores:
+        if not valor.isdigit() or int(valor) not in MODELOS_VALIDOS:
+            raise ValueError(f"Modelo inválido no filtro (use 55 ou 65): '{valor}'")
+        modelos.add(int(valor))
+    return frozenset(modelos)
+
+
+def _ufs(valores: List[str]) -> FrozenSet[int]:
+    ufs = set()
+    for valor in valores:
+        if valor.isdigit() and int(valor) in CODIGOS_UF.values():
+            ufs.add(int(valor))
+        elif valor.upper() in CODIGOS_UF:
+            ufs.add(CODIGOS_UF[valor.upper()])
+        else:
+            raise ValueError(f"UF inválida no filtro: '{valor}'")
+    return frozenset(ufs)
+
+
+def interpretar_filtro(texto: str) -> FiltroChaves:
+    """
+    Interpreta a descrição em texto de um filtro de chaves.
+
+    Args:
+        texto: Critérios no formato 'meses=2401-2406; cnpj=...; modelo=55; serie=1; uf=SP'
+
+    Returns:
+        Filtro interpretado (vazio se o texto estiver em branco)
+
+    Raises:
+        ValueError: Se algum critério ou valor for inválido
+    """
+    criterios = {}
+    for parte in (texto or '').split(';'):
+        if not parte.strip():
+            continue
+        nome, separador, valores = parte.partition('=')
+        nome = nome.strip().lower()
+        valores = [valor.strip() for valor in valores.split(',') if valor.strip()]
+        if not separador or not valores:
+            raise ValueError(f"Critério sem valores no filtro: '{parte.strip()}'")
+        if nome == 'meses':
+            criterios['meses'] = _intervalos(valores, nome)
+            _validar_meses(criterios['meses'])
+        elif nome == 'cnpj':
+            criterios['cnpjs'] = _cnpjs(valores)
+        elif nome == 'modelo':
+            criterios['modelos'] = _modelos(valores)
+        elif nome == 'serie':
+            criterios['series'] = _intervalos(valores, nome)
+        elif nome == 'uf':
+            criterios['ufs'] = _ufs(valores)
+        else:
+            raise ValueError(f"Critério desconhecido no filtro: '{nome}' "
+                             "(use meses, cnpj, modelo, serie ou uf)")
+    return FiltroChaves(**criterios)
+
+
+def _no_intervalo(valor: int, intervalos: Tuple[Tuple[int, int], ...]) -> bool:
+    return any(inicio <= valor <= fim for inicio, fim in intervalos)
+
+
+def compilar_filtro(filtro: FiltroChaves) -> Callable[[str], bool]:
+    """
+    Compila o filtro em um predicado sobre a chave de acesso (texto de 44 dígitos).
+    Apenas os critérios preenchidos são verificados.
+
+    Args:
+        filtro: Filtro interpretado
+
+    Returns:
+        Função que recebe a chave e diz se ela passa no filtro
+    """
+    verificacoes = []
+    if filtro.ufs:
+        inicio, fim = POSICOES_CHAVE['cuf']
+        verificacoes.append(lambda chave: int(chave[inicio:fim]) in filtro.ufs)
+    if filtro.meses:
+        inicio_aamm, fim_aamm = POSICOES_CHAVE['aamm']
+        verificacoes.append(lambda chave: _no_intervalo(int(chave[inicio_aamm:fim_aamm]), filtro.meses))
+    if filtro.cnpjs:
+        inicio_cnpj, fim_cnpj = POSICOES_CHAVE['cnpj']
+        verificacoes.append(lambda chave: chave[inicio_cnpj:fim_cnpj] in filtro.cnpjs)
+    if filtro.modelos:
+        inicio_modelo, fim_modelo = POSICOES_CHAVE['modelo']
+        verificacoes.append(lambda chave: int(chave[inicio_modelo:fim_modelo]) in filtro.modelos)
+    if filtro.series:
+        inicio_serie, fim_serie = POSICOES_CHAVE['serie']
+        verificacoes.append(lambda chave: _no_intervalo(int(chave[inicio_serie:fim_serie]), filtro.series))
+
+    def predicado(chave: str) -> bool:
+        if not chave or len(chave) != TAMANHO_CHAVE or not chave.isdigit():
+            return False
+        return all(verificacao(chave) for verificacao in verificacoes)
+
+    return predicado
+
+
+def _mascara_intervalos(valores: 'np.ndarray', intervalos: Tuple[Tuple[int, int], ...]) -> 'np.ndarray':
+    mascara = np.zeros(len(valores), dtype=np.bool_)
+    for inicio, fim in intervalos:
+        mascara |= (valores >= inicio) & (valores <= fim)
+    return mascara
+
+
+def mascara_filtro(filtro: FiltroChaves, chaves: 'np.ndarray') -> 'np.ndarray':
+    """
+    Aplica o filtro a um lote de chaves decodificadas (ver decodificar_chaves).
+
+    Args:
+        filtro: Filtro interpretado
+        chaves: Array estruturado das chaves
+
+    Returns:
+        Array booleano alinhado com as chaves
+    """
+    mascara = chaves['valida'].copy()
+    if filtro.ufs:
+        mascara &= np.isin(chaves['cuf'], list(filtro.ufs))
+    if filtro.meses:
+        mascara &= _mascara_intervalos(chaves['aamm'], filtro.meses)
+    if filtro.cnpjs:
+        mascara &= np.isin(chaves['cnpj'], [cnpj.encode('ascii') for cnpj in filtro.cnpjs])
+    if filtro.modelos:
+        mascara &= np.isin(chaves['modelo'], list(filtro.modelos))
+    if filtro.series:
+        mascara &= _mascara_intervalos(chaves['serie'], filtro.series)
+    return mascara
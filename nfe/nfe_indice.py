@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Índice persistente da varredura de XMLs
+Guarda, por caminho, o tamanho e a data de modificação de cada arquivo junto
+com a classificação já feita (chave, AAMM e tipo), para que execuções futuras
+só precisem ler arquivos novos ou alterados. Guarda também a marca d'água do
+modo incremental (o instante da última varredura e as chaves já processadas),
+o sinal de vida do modo vigia, que mantém o índice atualizado em tempo real,
+e os eventos de cancelamento já encontrados, que continuam valendo mesmo
+depois que o arquivo do evento sai da pasta de origem.
+"""
+
+import os
+import sqlite3
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+
+# Nome do banco criado dentro da pasta destino base
+NOME_ARQUIVO_INDICE = 'indice_varredura.sqlite3'
+
+# Intervalo máximo sem sinal de vida para considerar o modo vigia ativo
+TOLERANCIA_SINAL_VIGIA_NS = 180 * 1_000_000_000
+
+# Situação da classificação de um arquivo
+STATUS_OK = 'ok'
+STATUS_ERRO = 'erro'
+
+
+class RegistroIndice(NamedTuple):
+    """Classificação de um arquivo XML guardada no índice"""
+    caminho: str
+    tamanho: int
+    mtime_ns: int
+    chave: Optional[str]
+    aamm: Optional[str]
+    tipo: str
+    status: str
+
+
+class MarcaDagua(NamedTuple):
+    """Ponto até onde o backup incremental já processou a pasta de origem"""
+    ultima_varredura_ns: Optional[int]
+    chaves_processadas: Set[str]
+
+
+class SinalVigia(NamedTuple):
+    """Último sinal de vida do modo vigia"""
+    pasta_origem: str
+    ultimo_sinal_ns: int
+
+
+class EventoCancelamento(NamedTuple):
+    """Evento de cancelamento (tpEvento 110111) guardado no índice"""
+    chave: str
+    protocolo: Optional[str]  # nProt do registro do evento
+    dh_evento: Optional[str]
+    caminho: Optional[str]
+
+
+class CancelamentoTardio(NamedTuple):
+    """Cancelamento de uma nota que já tinha entrado em um backup como autorizada"""
+    evento: EventoCancelamento
+    aamm: str
+    caminho_nota: str
+
+
+class IndiceVarredura:
+    """Índice SQLite com a classificação dos arquivos da pasta de origem"""
+
+    def __init__(self, caminho_banco: str):
+        self.caminho_banco = caminho_banco
+        # O modo vigia e a execução mensal podem usar o banco ao mesmo tempo
+        self.conexao = sqlite3.connect(caminho_banco, timeout=30)
+        self.conexao.execute('PRAGMA journal_mode=WAL')
+        self._criar_tabelas()
+
+    @classmethod
+    def na_pasta(cls, pasta_destino_base: str) -> 'IndiceVarredura':
+        """
+        Abre (ou cria) o índice padrão dentro da pasta destino base.
+
+        Args:
+            pasta_destino_base: Pasta onde ficam os backups
+
+        Returns:
+            Instância do índice
+        """
+        if not os.path.exists(pasta_destino_base):
+            os.makedirs(pasta_destino_base)
+        return cls(os.path.join(pasta_destino_base, NOME_ARQUIVO_INDICE))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.fechar()
+
+    def _criar_tabelas(self):
+        """Cria as tabelas do índice se ainda não existirem"""
+        with self.conexao:
+            self.conexao.execute('''
+                CREATE TABLE IF NOT EXISTS arquivos (
+                    caminho TEXT PRIMARY KEY,
+                    tamanho INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    chave TEXT,
+                    aamm TEXT,
+                    tipo TEXT NOT NULL,
+                    status TEXT NOT NULL
+                )
+            ''')
+            self.conexao.execute(
+                'CREATE INDEX IF NOT EXISTS idx_arquivos_aamm_tipo ON arquivos (aamm, tipo)'
+            )
+            self.conexao.execute('''
+                CREATE TABLE IF NOT EXISTS marca_dagua (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    ultima_varredura_ns INTEGER NOT NULL
+                )
+            ''')
+            self.conexao.execute('''
+                CREATE TABLE IF NOT EXISTS vigia (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    pasta_origem TEXT NOT NULL,
+                    ultimo_sinal_ns INTEGER NOT NULL
+                )
+            ''')
+            self.conexao.execute('''
+                CREATE TABLE IF NOT EXISTS cancelamentos (
+                    chave TEXT PRIMARY KEY,
+                    protocolo TEXT,
+                    dh_evento TEXT,
+                    caminho TEXT,
+                    registrado_ns INTEGER NOT NULL,
+                    notificado_ns INTEGER
+                )
+            ''')
+            self.conexao.execute('''
+                CREATE TABLE IF NOT EXISTS chaves_processadas (
+                    chave TEXT PRIMARY KEY,
+                    aamm TEXT NOT NULL,
+                    caminho TEXT NOT NULL
+                )
+            ''')
+
+    def carregar(self) -> Dict[str, RegistroIndice]:
+        """
+        Carrega todo o índice em memória.
+
+        Returns:
+            Dicionário {caminho: RegistroIndice}
+        """
+        cursor = self.conexao.execute(
+            'SELECT caminho, tamanho, mtime_ns, chave, aamm, tipo, status FROM arquivos'
+        )
+        return {linha[0]: RegistroIndice(*linha) for linha in cursor}
+
+    def consultar(self, pasta_origem: str, tipos: Iterable[str]) -> List[RegistroIndice]:
+        """
+        Consulta os arquivos de determinados tipos dentro de uma pasta.
+
+        Args:
+            pasta_origem: Pasta raiz dos arquivos
+            tipos: Tipos desejados (ex.: NFe e cancelamento)
+
+        Returns:
+            Registros encontrados, ordenados por caminho
+        """
+        tipos = list(tipos)
+        marcadores = ', '.join('?' for _ in tipos)
+        prefixo = os.path.join(pasta_origem, '')
+        cursor = self.conexao.execute(
+            'SELECT caminho, tamanho, mtime_ns, chave, aamm, tipo, status FROM arquivos '
+            f'WHERE tipo IN ({marcadores}) AND status = ? AND substr(caminho, 1, ?) = ? '
+            'ORDER BY caminho',
+            (*tipos, STATUS_OK, len(prefixo), prefixo)
+        )
+        return [RegistroIndice(*linha) for linha in cursor]
+
+    def registrar(self, registros: Iterable[RegistroIndice]) -> None:
+        """
+        Insere ou atualiza registros do índice em uma única transação.
+
+        Args:
+            registros: Registros a gravar
+        """
+        with self.conexao:
+            self.conexao.executemany(
+                'INSERT OR REPLACE INTO arquivos '
+                '(caminho, tamanho, mtime_ns, chave, aamm, tipo, status) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                registros
+            )
+
+    def remover(self, caminhos: Iterable[str]) -> None:
+        """
+        Remove do índice arquivos que não existem mais.
+
+        Args:
+            caminhos: Caminhos a remover
+        """
+        with self.conexao:
+            self.conexao.executemany(
+                'DELETE FROM arquivos WHERE caminho = ?',
+                ((caminho,) for caminho in caminhos)
+            )
+
+    def carregar_marca_dagua(self) -> MarcaDagua:
+        """
+        Lê a marca d'água do backup incremental.
+
+        Returns:
+            MarcaDagua (ultima_varredura_ns é None se nunca houve execução incremental)
+        """
+        linha = self.conexao.execute(
+            'SELECT ultima_varredura_ns FROM marca_dagua WHERE id = 1'
+        ).fetchone()
+        chaves = {chave for (chave,) in self.conexao.execute('SELECT chave FROM chaves_processadas')}
+        return MarcaDagua(linha[0] if linha else None, chaves)
+
+    def registrar_processamento(self, chaves: Iterable[Tuple[str, str, str]],
+                                ultima_varredura_ns: Optional[int] = None) -> None:
+        """
+        Grava as chaves processadas e, opcionalmente, avança a marca d'água,
+        em uma única transação.
+
+        Args:
+            chaves: Tuplas (chave, AAMM, caminho de origem) já incluídas no backup
+            ultima_varredura_ns: Instante em que a varredura começou (opcional)
+        """
+        with self.conexao:
+            self.conexao.executemany(
+                'INSERT OR REPLACE INTO chaves_processadas (chave, aamm, caminho) VALUES (?, ?, ?)',
+                chaves
+            )
+            if ultima_varredura_ns is not None:
+                self.conexao.execute(
+                    'INSERT OR REPLACE INTO marca_dagua (id, ultima_varredura_ns) VALUES (1, ?)',
+                    (ultima_varredura_ns,)
+                )
+
+    def registrar_cancelamentos(self, eventos: Iterable[EventoCancelamento], instante_ns: int) -> None:
+        """
+        Grava eventos de cancelamento em uma única transação. Um evento já
+        conhecido mantém o instante do primeiro registro.
+
+        Args:
+            eventos: Eventos lidos dos arquivos
+            instante_ns: Instante do registro (time.time_ns())
+        """
+        with self.conexao:
+            self.conexao.executemany(
+                'INSERT INTO cancelamentos (chave, protocolo, dh_evento, caminho, registrado_ns) '
+                'VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (chave) DO UPDATE SET '
+                'protocolo = COALESCE(excluded.protocolo, protocolo), '
+                'dh_evento = COALESCE(excluded.dh_evento, dh_evento), '
+                'caminho = excluded.caminho',
+                ((*evento, instante_ns) for evento in eventos)
+            )
+
+    def consultar_cancelamento(self, chave: str) -> Optional[EventoCancelamento]:
+        """
+        Consulta o evento de cancelamento de uma nota.
+
+        Args:
+            chave: Chave de acesso da nota
+
+        Returns:
+            EventoCancelamento ou None se a nota não foi cancelada
+        """
+        linha = self.conexao.execute(
+            'SELECT chave, protocolo, dh_evento, caminho FROM cancelamentos WHERE chave = ?', (chave,)
+        ).fetchone()
+        return EventoCancelamento(*linha) if linha else None
+
+    def chaves_canceladas(self) -> Set[str]:
+        """Chaves de todas as notas com evento de cancelamento registrado"""
+        return {chave for (chave,) in self.conexao.execute('SELECT chave FROM cancelamentos')}
+
+    def cancelamentos_tardios(self) -> List[CancelamentoTardio]:
+        """
+        Cancelamentos ainda não notificados de notas que já entraram em um
+        backup anterior (e por isso aparecem nele como autorizadas).
+
+        Returns:
+            Lista de CancelamentoTardio, ordenada por mês e chave
+        """
+        cursor = self.conexao.execute(
+            'SELECT c.chave, c.protocolo, c.dh_evento, c.caminho, p.aamm, p.caminho '
+            'FROM cancelamentos c JOIN chaves_processadas p ON p.chave = c.chave '
+            'WHERE c.notificado_ns IS NULL ORDER BY p.aamm, c.chave'
+        )
+        return [CancelamentoTardio(EventoCancelamento(*linha[:4]), linha[4], linha[5]) for linha in cursor]
+
+    def marcar_cancelamentos_notificados(self, chaves: Iterable[str], instante_ns: int) -> None:
+        """
+        Marca cancelamentos tardios como já notificados.
+
+        Args:
+            chaves: Chaves das notas
+            instante_ns: Instante da notificação (time.time_ns())
+        """
+        with self.conexao:
+            self.conexao.executemany(
+                'UPDATE cancelamentos SET notificado_ns = ? WHERE chave = ?',
+                ((instante_ns, chave) for chave in chaves)
+            )
+
+    def registrar_sinal_vigia(self, pasta_origem: str, instante_ns: int) -> None:
+        """
+        Registra que o modo vigia está ativo e com o índice em dia.
+
+        Args:
+            pasta_origem: Pasta vigiada
+            instante_ns: Instante do sinal (time.time_ns())
+        """
+        with self.conexao:
+            self.conexao.execute(
+                'INSERT OR REPLACE INTO vigia (id, pasta_origem, ultimo_sinal_ns) VALUES (1, ?, ?)',
+                (os.path.normcase(os.path.abspath(pasta_origem)), instante_ns)
+            )
+
+    def vigia_ativa(self, pasta_origem: str, agora_ns: int,
+                    tolerancia_ns: int = TOLERANCIA_SINAL_VIGIA_NS) -> bool:
+        """
+        Indica se o modo vigia está mantendo o índice da pasta atualizado.
+
+        Args:
+            pasta_origem: Pasta de origem da execução
+            agora_ns: Instante atual (time.time_ns())
+            tolerancia_ns: Tempo máximo desde o último sinal
+
+        Returns:
+            True se o índice pode substituir a varredura da pasta
+        """
+        linha = self.conexao.execute(
+            'SELECT pasta_origem, ultimo_sinal_ns FROM vigia WHERE id = 1'
+        ).fetchone()
+        if not linha:
+            return False
+        sinal = SinalVigia(*linha)
+        return (sinal.pasta_origem == os.path.normcase(os.path.abspath(pasta_origem))
+                and agora_ns - sinal.ultimo_sinal_ns <= tolerancia_ns)
+
+    def fechar(self) -> None:
+        """Fecha a conexão com o banco"""
+        self.conexao.close()
@@ -8,26 +8,170 @@ Responsável por extrair dados, filtrar por chave de acesso e gerar relatórios
 import os
 import re
 import csv
-import xmltodict
+import time
+from decimal import Decimal
 from datetime import datetime
-from typing import List, Dict, Set, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from itertools import repeat
+from typing import List, Dict, Set, Optional, Tuple, Iterable, Iterator, NamedTuple
+
+from .nfe_indice import (IndiceVarredura, RegistroIndice, MarcaDagua, EventoCancelamento,
+                         STATUS_OK, STATUS_ERRO)
+from .nfe_armazem import ArmazemNotas
+from .nfe_varredor import EntradaXml, varrer_xmls, WORKERS_VARREDURA_PADRAO
+from .nfe_extratores import criar_extrator, MOTOR_AUTOMATICO
+from .nfe_eventos import (RAIZES_EVENTO, RAIZES_NFE, PADRAO_NPROT_EVENTO, PADRAO_DH_EVENTO,
+                          elemento_raiz, localizar_cancelamento)
+from .nfe_chaves import numpy_disponivel, decodificar_chaves, mascara_meses, indices_da_mascara
+from .nfe_filtro import FiltroChaves, compilar_filtro, mascara_filtro
+from .nfe_relatorio import (CABECALHO_CSV, ROTULO_TOTAL_CSV, RODAPE_CSV, escrever_rodape_csv,
+                             localizar_rodape_csv)
+from .nfe_registros import (CabecalhoNota, ItemNota, STATUS_AUTORIZADA, STATUS_CANCELADA, criar_cabecalho,
+                             criar_item, internar_nota)
+
+
+# Quantidade de bytes lida do início do arquivo para localizar a chave de acesso
+TAMANHO_PREFIXO_CHAVE = 4096
+
+# Padrões pré-compilados (em bytes) para a chave no atributo Id do infNFe
+PADRAO_CHAVE_INFNFE = re.compile(rb'<infNFe\s+Id="NFe(\d{44})"')
+PADRAO_CHAVE_ID = re.compile(rb'Id="NFe(\d{44})"')
+
+# Tipos de documento identificados durante a varredura
+TIPO_NFE = 'nfe'
+TIPO_EVENTO = 'evento'
+TIPO_CANCELAMENTO = 'cancelamento'
+TIPO_OUTRO = 'outro'
+
+# Padrões de nome de arquivo usados pelo Mobility_POS e pelas ferramentas da SEFAZ.
+# Cada padrão precisa de um grupo nomeado "chave" com os 44 dígitos.
+PADROES_NOME_ARQUIVO_PADRAO = (
+    (r'^(?P<chave>\d{44})-(?:nfe|procNFe)\.xml$', TIPO_NFE),
+    (r'^(?:\d{6})?(?P<chave>\d{44})(?:\d{2})?-procEventoNFe\.xml$', TIPO_EVENTO),
+)
+
+
+class ArquivoClassificado(NamedTuple):
+    """Resultado da classificação de um arquivo XML da pasta de origem"""
+    caminho: str
+    tipo: str
+    chave: Optional[str]
+    aamm: Optional[str]
+    alterado_ns: int = 0  # Última modificação ou criação do arquivo
+
+
+class ResultadoVarredura(NamedTuple):
+    """Arquivos classificados e chaves canceladas encontrados em uma única varredura"""
+    arquivos: List[ArquivoClassificado]
+    chaves_canceladas: Set[str]
+
+
+class ResultadoExtracao(NamedTuple):
+    """Linhas extraídas de um arquivo XML ou a mensagem de erro da extração"""
+    caminho: str
+    linhas: List[ItemNota]
+    erro: Optional[str]
+    conteudo: Optional[bytes] = None  # Bytes lidos, quando pedidos (ex.: para o ZIP)
+    nota: Optional[CabecalhoNota] = None  # Cabeçalho da nota, presente mesmo sem itens
+
+
+# Estado de cada processo do pool de extração (definido pelo inicializador)
+_parser_worker = None
+_chaves_canceladas_worker = None
+
+
+def _inicializar_worker_extracao(parser: 'NFeParser', canceled_keys_set: Set[str]) -> None:
+    """Recebe o parser e as chaves canceladas uma única vez por processo"""
+    global _parser_worker, _chaves_canceladas_worker
+    _parser_worker = parser
+    _chaves_canceladas_worker = canceled_keys_set
+
+
+def _extrair_arquivo_no_worker(caminho_arquivo_xml: str, devolver_conteudo: bool) -> ResultadoExtracao:
+    """Função executada nos processos do pool (precisa estar no nível do módulo)"""
+    return _parser_worker._extrair_resultado(caminho_arquivo_xml, _chaves_canceladas_worker,
+                                             devolver_conteudo)
 
 
 class NFeParser:
     """Classe responsável pelo processamento de arquivos XML de NFe"""
     
-    def __init__(self):
+    def __init__(self, padroes_nome_arquivo: Optional[List[Tuple[str, str]]] = None,
+                 workers_varredura: int = WORKERS_VARREDURA_PADRAO,
+                 workers_extracao: Optional[int] = None,
+                 motor_extracao: str = MOTOR_AUTOMATICO):
         self.pagamento_map = {
             '01': 'Dinheiro', '02': 'Cheque', '03': 'Cartão de Crédito', 
             '04': 'Cartão de Débito', '05': 'Crédito Loja', '10': 'Vale Alimentação', 
             '11': 'Vale Refeição', '15': 'Boleto Bancário', '16': 'Depósito Bancário', 
             '17': 'PIX', '90': 'Sem Pagamento', '99': 'Outros'
         }
+        
+        # Padrões (regex, tipo) que permitem classificar o arquivo só pelo nome
+        if padroes_nome_arquivo is None:
+            padroes_nome_arquivo = PADROES_NOME_ARQUIVO_PADRAO
+        self.padroes_nome_arquivo = [
+            (re.compile(padrao, re.IGNORECASE), tipo) for padrao, tipo in padroes_nome_arquivo
+        ]
+        
+        # Threads usadas para listar os diretórios da pasta de origem
+        self.workers_varredura = workers_varredura
+        
+        # Processos usados na extração em lote (padrão: quantidade de CPUs)
+        self.workers_extracao = workers_extracao or os.cpu_count() or 1
+        
+        # Motor de leitura dos XMLs ('auto', 'lxml', 'iterparse' ou 'xmltodict')
+        self.extrator = criar_extrator(motor_extracao)
+        
+        # Contadores da última varredura: arquivos decididos pelo nome, pelo conteúdo
+        # ou reaproveitados do índice persistente
+        self.estatisticas_filtragem = {'por_nome': 0, 'por_conteudo': 0, 'pelo_indice': 0}
+    
+    def selecionar_motor(self, nome_motor: str) -> str:
+        """
+        Troca o motor de leitura dos XMLs. Se o motor pedido não estiver
+        instalado (ou for 'auto'), usa o melhor disponível.
+        
+        Args:
+            nome_motor: Nome do motor configurado
+            
+        Returns:
+            Nome do motor efetivamente em uso
+        """
+        self.extrator = criar_extrator(nome_motor)
+        return self.extrator.nome
+    
+    def localizar_chave_em_bytes(self, conteudo: bytes) -> Optional[str]:
+        """
+        Procura a chave de acesso em um trecho (bytes) de um XML de NFe.
+        
+        Args:
+            conteudo: Bytes lidos do arquivo XML (completo ou apenas o início)
+            
+        Returns:
+            Chave de 44 dígitos ou None se não encontrar
+        """
+        # Procura pelo padrão: <infNFe Id="NFe{44 dígitos}">
+        match = PADRAO_CHAVE_INFNFE.search(conteudo)
+        if match:
+            return match.group(1).decode('ascii')
+        
+        # Procura em outros formatos possíveis
+        match2 = PADRAO_CHAVE_ID.search(conteudo)
+        if match2:
+            return match2.group(1).decode('ascii')
+        
+        return None
     
     def extrair_chave_de_acesso(self, caminho_arquivo_xml: str) -> Optional[str]:
         """
         Extrai a chave de acesso do arquivo XML da NFe.
         
+        Lê apenas o início do arquivo em modo binário (o atributo Id do
+        infNFe fica nas primeiras centenas de bytes) e só lê o restante
+        quando a chave não é encontrada nesse prefixo.
+        
         Args:
             caminho_arquivo_xml: Caminho para o arquivo XML
             
@@ -35,28 +179,211 @@ class NFeParser:
             Chave de 44 dígitos ou None se não encontrar
         """
         try:
-            with open(caminho_arquivo_xml, 'r', encoding='utf-8') as arquivo:
-                xml_content = arquivo.read()
+            with open(caminho_arquivo_xml, 'rb') as arquivo:
+                prefixo = arquivo.read(TAMANHO_PREFIXO_CHAVE)
+                chave_acesso = self.localizar_chave_em_bytes(prefixo)
                 
-            # Procura pelo padrão: <infNFe Id="NFe{44 dígitos}">
-            pattern = r'<infNFe\s+Id="NFe(\d{44})"'
-            match = re.search(pattern, xml_content)
-            
-            if match:
-                return match.group(1)
+                # Chave fora do prefixo: lê o restante do arquivo
+                if chave_acesso is None and len(prefixo) == TAMANHO_PREFIXO_CHAVE:
+                    chave_acesso = self.localizar_chave_em_bytes(prefixo + arquivo.read())
             
-            # Procura em outros formatos possíveis
-            pattern2 = r'Id="NFe(\d{44})"'
-            match2 = re.search(pattern2, xml_content)
-            if match2:
-                return match2.group(1)
-                
-            return None
+            return chave_acesso
             
         except Exception as e:
             print(f"ERRO ao extrair chave de acesso de {os.path.basename(caminho_arquivo_xml)}: {e}")
             return None
     
+    def classificar_por_nome(self, nome_arquivo: str) -> Optional[Tuple[str, str]]:
+        """
+        Identifica o tipo do documento e a chave de acesso apenas pelo nome do arquivo.
+        
+        Args:
+            nome_arquivo: Nome do arquivo (sem o diretório)
+            
+        Returns:
+            Tupla (tipo, chave) ou None se o nome não segue um padrão conhecido
+        """
+        for padrao, tipo in self.padroes_nome_arquivo:
+            match = padrao.match(nome_arquivo)
+            if match:
+                return tipo, match.group('chave')
+        return None
+    
+    def localizar_cancelamento_em_bytes(self, conteudo: bytes) -> Optional[str]:
+        """
+        Verifica se o conteúdo é um evento de cancelamento (tpEvento 110111),
+        direto nos bytes (ver nfe_eventos).
+        
+        Args:
+            conteudo: Bytes do arquivo XML completo
+            
+        Returns:
+            Chave da nota cancelada ou None se não for evento de cancelamento
+        """
+        return localizar_cancelamento(conteudo)
+    
+    def ler_evento_cancelamento(self, caminho_arquivo_xml: str, chave_acesso: str) -> EventoCancelamento:
+        """
+        Lê o protocolo e o instante de um evento de cancelamento já classificado.
+        
+        O protocolo é o nProt do retorno da SEFAZ (retEvento), presente quando o
+        arquivo é um procEventoNFe; o nProt de detEvento é o da nota, não o do evento.
+        
+        Args:
+            caminho_arquivo_xml: Caminho do arquivo do evento
+            chave_acesso: Chave da nota cancelada
+            
+        Returns:
+            EventoCancelamento (protocolo e instante podem ser None)
+        """
+        with open(caminho_arquivo_xml, 'rb') as arquivo:
+            conteudo = arquivo.read()
+        
+        protocolo = None
+        inicio_retorno = conteudo.find(b'retEvento')
+        if inicio_retorno >= 0:
+            match = PADRAO_NPROT_EVENTO.search(conteudo, inicio_retorno)
+            if match:
+                protocolo = match.group(1).decode('ascii')
+        match = PADRAO_DH_EVENTO.search(conteudo)
+        dh_evento = match.group(1).decode('utf-8', 'replace').strip() if match else None
+        return EventoCancelamento(chave_acesso, protocolo, dh_evento, caminho_arquivo_xml)
+    
+    def sincronizar_cancelamentos(self, indice: IndiceVarredura, arquivos: Iterable,
+                                  log_callback=None) -> int:
+        """
+        Guarda no índice os eventos de cancelamento ainda não registrados.
+        Só os arquivos de eventos novos são lidos; os já conhecidos vêm do índice.
+        
+        Args:
+            indice: Índice persistente
+            arquivos: ArquivoClassificado ou RegistroIndice (só os cancelamentos são usados)
+            log_callback: Função para logging (opcional)
+            
+        Returns:
+            Quantidade de eventos novos registrados
+        """
+        conhecidas = indice.chaves_canceladas()
+        eventos = {}
+        for arquivo in arquivos:
+            if arquivo.tipo != TIPO_CANCELAMENTO or not arquivo.chave:
+                continue
+            if arquivo.chave in conhecidas or arquivo.chave in eventos:
+                continue
+            try:
+                eventos[arquivo.chave] = self.ler_evento_cancelamento(arquivo.caminho, arquivo.chave)
+            except OSError as e:
+                if log_callback:
+                    log_callback(f"AVISO: Erro ao ler o evento {os.path.basename(arquivo.caminho)}: {e}")
+        
+        if eventos:
+            indice.registrar_cancelamentos(eventos.values(), time.time_ns())
+            if log_callback:
+                log_callback(f"{len(eventos)} eventos de cancelamento novos guardados no índice.")
+        return len(eventos)
+    
+    def classificar_arquivo(self, caminho_arquivo_xml: str) -> Tuple[str, Optional[str]]:
+        """
+        Classifica um arquivo XML como NFe, evento de cancelamento ou outro documento.
+        
+        Usa o nome do arquivo quando ele segue o padrão de NFe e, caso
+        contrário, lê o conteúdo uma única vez. O elemento raiz, lido do
+        prefixo, separa eventos de notas: eventos não passam pela busca da
+        chave da NFe e notas não passam pela busca de tpEvento e chNFe.
+        
+        Args:
+            caminho_arquivo_xml: Caminho para o arquivo XML
+            
+        Returns:
+            Tupla (tipo, chave). Para cancelamentos, a chave é a da nota cancelada.
+        """
+        classificacao = self.classificar_por_nome(os.path.basename(caminho_arquivo_xml))
+        if classificacao and classificacao[0] == TIPO_NFE:
+            self.estatisticas_filtragem['por_nome'] += 1
+            return classificacao
+        
+        self.estatisticas_filtragem['por_conteudo'] += 1
+        with open(caminho_arquivo_xml, 'rb') as arquivo:
+            prefixo = arquivo.read(TAMANHO_PREFIXO_CHAVE)
+            chave_acesso = self.localizar_chave_em_bytes(prefixo)
+            if chave_acesso:
+                return TIPO_NFE, chave_acesso
+            raiz = elemento_raiz(prefixo)
+            conteudo = prefixo + arquivo.read()
+        
+        # Raiz desconhecida ou fora do prefixo: tenta os dois casos
+        if raiz not in RAIZES_EVENTO:
+            chave_acesso = self.localizar_chave_em_bytes(conteudo)
+            if chave_acesso:
+                return TIPO_NFE, chave_acesso
+        if raiz not in RAIZES_NFE:
+            chave_cancelada = localizar_cancelamento(conteudo)
+            if chave_cancelada:
+                return TIPO_CANCELAMENTO, chave_cancelada
+        
+        # Evento reconhecido pelo nome, mas que não é de cancelamento
+        if classificacao:
+            return classificacao
+        return TIPO_OUTRO, None
+    
+    def _classificar_com_indice(self, entrada: EntradaXml, 
+                                registros_indice: Dict[str, RegistroIndice],
+                                novos_registros: List[RegistroIndice]) -> Tuple[str, Optional[str]]:
+        """
+        Classifica um arquivo reaproveitando o índice quando tamanho e mtime não mudaram.
+        Arquivos novos ou alterados são lidos e acrescentados em novos_registros.
+        """
+        registro = registros_indice.get(entrada.caminho)
+        if (registro and registro.status == STATUS_OK and registro.tamanho == entrada.tamanho
+                and registro.mtime_ns == entrada.mtime_ns):
+            self.estatisticas_filtragem['pelo_indice'] += 1
+            return registro.tipo, registro.chave
+        
+        try:
+            tipo, chave_acesso = self.classificar_arquivo(entrada.caminho)
+        except Exception:
+            novos_registros.append(RegistroIndice(
+                entrada.caminho, entrada.tamanho, entrada.mtime_ns, None, None, TIPO_OUTRO, STATUS_ERRO
+            ))
+            raise
+        
+        aamm = chave_acesso[2:6] if chave_acesso else None
+        novos_registros.append(RegistroIndice(
+            entrada.caminho, entrada.tamanho, entrada.mtime_ns, chave_acesso, aamm, tipo, STATUS_OK
+        ))
+        return tipo, chave_acesso
+    
+    def classificar_entrada(self, entrada: EntradaXml) -> RegistroIndice:
+        """
+        Classifica um único arquivo e monta o registro do índice (usado pelo
+        modo vigia à medida que os arquivos chegam).
+        
+        Args:
+            entrada: Arquivo com os dados de stat já lidos
+            
+        Returns:
+            RegistroIndice; em caso de erro de leitura, com status STATUS_ERRO
+        """
+        try:
+            tipo, chave_acesso = self.classificar_arquivo(entrada.caminho)
+        except Exception:
+            return RegistroIndice(entrada.caminho, entrada.tamanho, entrada.mtime_ns, 
+                                  None, None, TIPO_OUTRO, STATUS_ERRO)
+        aamm = chave_acesso[2:6] if chave_acesso else None
+        return RegistroIndice(entrada.caminho, entrada.tamanho, entrada.mtime_ns, 
+                              chave_acesso, aamm, tipo, STATUS_OK)
+    
+    def _atualizar_indice(self, indice: IndiceVarredura, pasta_origem: str,
+                          registros_indice: Dict[str, RegistroIndice],
+                          novos_registros: List[RegistroIndice], caminhos_vistos: Set[str]) -> None:
+        """Grava os registros novos e remove do índice os arquivos que sumiram da pasta"""
+        indice.registrar(novos_registros)
+        prefixo_pasta = os.path.join(pasta_origem, '')
+        indice.remover(
+            caminho for caminho in registros_indice
+            if caminho.startswith(prefixo_pasta) and caminho not in caminhos_vistos
+        )
+    
     def pertence_ao_mes_referencia(self, chave_acesso: str, mes_referencia: datetime) -> bool:
         """
         Verifica se a NFe pertence ao mês de referência baseado na chave de acesso.
@@ -94,211 +421,533 @@ class NFeParser:
         except (ValueError, IndexError):
             return False
     
-    def filtrar_arquivos_por_chave(self, pasta_origem: str, mes_referencia: datetime, 
-                                   log_callback=None) -> List[str]:
+    def iterar_classificacao(self, pasta_origem: str, 
+                             indice: Optional[IndiceVarredura] = None,
+                             log_callback=None,
+                             workers: Optional[int] = None) -> Iterator[ArquivoClassificado]:
         """
-        Filtra arquivos XML baseado na chave de acesso da NFe.
+        Percorre a pasta uma única vez e classifica cada arquivo XML.
+        
+        Os diretórios são listados em paralelo e cada arquivo é classificado
+        assim que aparece na listagem. Cada arquivo é lido no máximo uma vez
+        (ou nenhuma, quando o nome ou o índice já permitem decidir). Para
+        eventos de cancelamento, a chave retornada é a da nota cancelada.
         
         Args:
             pasta_origem: Pasta onde estão os arquivos XML
-            mes_referencia: Mês de referência para filtrar
+            indice: Índice persistente; só arquivos novos ou alterados são lidos (opcional)
             log_callback: Função para logging (opcional)
+            workers: Threads de listagem de diretórios (padrão: self.workers_varredura)
+            
+        Yields:
+            ArquivoClassificado para cada arquivo XML encontrado
+        """
+        self.estatisticas_filtragem = {'por_nome': 0, 'por_conteudo': 0, 'pelo_indice': 0}
+        registros_indice = indice.carregar() if indice else {}
+        novos_registros = []
+        caminhos_vistos = set()
+        
+        for entrada in varrer_xmls(pasta_origem, workers or self.workers_varredura):
+            caminhos_vistos.add(entrada.caminho)
+            if len(caminhos_vistos) % 100 == 0 and log_callback:  # Log a cada 100 arquivos
+                log_callback(f"Verificados {len(caminhos_vistos)} arquivos...")
+            
+            try:
+                if indice:
+                    tipo, chave_acesso = self._classificar_com_indice(
+                        entrada, registros_indice, novos_registros
+                    )
+                else:
+                    tipo, chave_acesso = self.classificar_arquivo(entrada.caminho)
+            except Exception as e:
+                # Se der erro ao ler o XML, pula o arquivo
+                if log_callback:
+                    log_callback(f"AVISO: Erro ao verificar {entrada.nome}: {e}")
+                continue
+            
+            aamm = chave_acesso[2:6] if chave_acesso else None
+            yield ArquivoClassificado(entrada.caminho, tipo, chave_acesso, aamm, entrada.alterado_ns)
+        
+        if indice:
+            self._atualizar_indice(indice, pasta_origem, registros_indice, 
+                                   novos_registros, caminhos_vistos)
+        
+        if log_callback:
+            log_callback(f"Encontrados {len(caminhos_vistos)} arquivos XML no total.")
+            log_callback(f"Arquivos decididos pelo nome: {self.estatisticas_filtragem['por_nome']} | "
+                         f"pelo conteúdo: {self.estatisticas_filtragem['por_conteudo']} | "
+                         f"pelo índice: {self.estatisticas_filtragem['pelo_indice']}")
+    
+    def varrer_pasta(self, pasta_origem: str, log_callback=None,
+                     indice: Optional[IndiceVarredura] = None,
+                     workers: Optional[int] = None) -> ResultadoVarredura:
+        """
+        Classifica todos os XMLs da pasta e coleta as chaves canceladas na mesma passada.
+        
+        Args:
+            pasta_origem: Pasta onde estão os arquivos XML
+            log_callback: Função para logging (opcional)
+            indice: Índice persistente (opcional)
+            workers: Threads de listagem de diretórios (padrão: self.workers_varredura)
             
         Returns:
-            Lista de caminhos dos arquivos que pertencem ao mês de referência
+            ResultadoVarredura com os arquivos classificados (ordenados por caminho)
+            e as chaves canceladas
         """
         if log_callback:
             log_callback(f"Procurando arquivos .xml em '{pasta_origem}'...")
             log_callback("ATENÇÃO: Filtrando por CHAVE DE ACESSO (mês/ano da emissão)!")
         
-        # Busca TODOS os arquivos XML
-        todos_arquivos_xml = [
-            os.path.join(root, file)
-            for root, _, files in os.walk(pasta_origem)
-            for file in files
-            if file.endswith(".xml")
-        ]
+        arquivos = []
+        chaves_canceladas = set()
+        for arquivo in self.iterar_classificacao(pasta_origem, indice, log_callback, workers):
+            if arquivo.tipo == TIPO_CANCELAMENTO:
+                chaves_canceladas.add(arquivo.chave)
+            arquivos.append(arquivo)
+        
+        # A varredura paralela não tem ordem fixa; ordena para relatórios estáveis
+        arquivos.sort()
+        
+        if indice:
+            # Cancelamentos de execuções anteriores valem mesmo sem o arquivo do evento
+            self.sincronizar_cancelamentos(indice, arquivos, log_callback)
+            chaves_canceladas |= indice.chaves_canceladas()
         
         if log_callback:
-            log_callback(f"Encontrados {len(todos_arquivos_xml)} arquivos XML no total. Verificando chaves de acesso...")
+            log_callback(f"Encontradas {len(chaves_canceladas)} notas canceladas.")
+        
+        return ResultadoVarredura(arquivos, chaves_canceladas)
+    
+    def consultar_indice(self, pasta_origem: str, indice: IndiceVarredura, 
+                         log_callback=None) -> ResultadoVarredura:
+        """
+        Monta o resultado da varredura direto do índice, sem percorrer a pasta.
+        Só é confiável enquanto o modo vigia mantém o índice atualizado.
+        
+        Args:
+            pasta_origem: Pasta onde estão os arquivos XML
+            indice: Índice persistente mantido pelo modo vigia
+            log_callback: Função para logging (opcional)
+            
+        Returns:
+            ResultadoVarredura com as NFes e as chaves canceladas
+        """
+        arquivos = []
+        chaves_canceladas = set()
+        for registro in indice.consultar(pasta_origem, (TIPO_NFE, TIPO_CANCELAMENTO)):
+            if registro.tipo == TIPO_CANCELAMENTO:
+                chaves_canceladas.add(registro.chave)
+            arquivos.append(ArquivoClassificado(registro.caminho, registro.tipo, registro.chave,
+                                                registro.aamm, registro.mtime_ns))
+        chaves_canceladas |= indice.chaves_canceladas()
+        
+        if log_callback:
+            log_callback(f"Índice do modo vigia consultado: {len(arquivos)} arquivos, sem varrer a pasta.")
+            log_callback(f"Encontradas {len(chaves_canceladas)} notas canceladas.")
+        
+        return ResultadoVarredura(arquivos, chaves_canceladas)
+    
+    def obter_varredura(self, pasta_origem: str, log_callback=None,
+                        indice: Optional[IndiceVarredura] = None,
+                        workers: Optional[int] = None) -> ResultadoVarredura:
+        """
+        Consulta o índice se o modo vigia estiver ativo para a pasta; caso
+        contrário, faz a varredura completa (ver varrer_pasta).
+        """
+        if indice and indice.vigia_ativa(pasta_origem, time.time_ns()):
+            return self.consultar_indice(pasta_origem, indice, log_callback)
+        return self.varrer_pasta(pasta_origem, log_callback, indice, workers)
+    
+    def aplicar_filtro_chaves(self, arquivos: List[ArquivoClassificado], 
+                              filtro: FiltroChaves) -> List[ArquivoClassificado]:
+        """
+        Mantém apenas as NFes cuja chave de acesso passa no filtro, antes de
+        qualquer arquivo ser aberto. Eventos e demais arquivos não são filtrados,
+        para que os cancelamentos continuem valendo.
+        
+        Args:
+            arquivos: Arquivos classificados por varrer_pasta
+            filtro: Filtro interpretado (ver interpretar_filtro)
+            
+        Returns:
+            Arquivos classificados que passaram no filtro
+        """
+        if filtro.vazio:
+            return arquivos
+        posicoes_nfe = [i for i, arquivo in enumerate(arquivos) if arquivo.tipo == TIPO_NFE]
+        if numpy_disponivel():
+            chaves = decodificar_chaves([arquivos[i].chave or '' for i in posicoes_nfe])
+            aceitas = {posicoes_nfe[j] for j in indices_da_mascara(mascara_filtro(filtro, chaves))}
+        else:
+            predicado = compilar_filtro(filtro)
+            aceitas = {i for i in posicoes_nfe if predicado(arquivos[i].chave)}
+        return [arquivo for i, arquivo in enumerate(arquivos) 
+                if arquivo.tipo != TIPO_NFE or i in aceitas]
+    
+    def selecionar_arquivos_do_mes(self, arquivos: List[ArquivoClassificado], 
+                                   mes_referencia: datetime, log_callback=None) -> List[str]:
+        """
+        Seleciona, entre os arquivos já classificados, as NFes do mês de referência.
+        
+        Args:
+            arquivos: Arquivos classificados por varrer_pasta
+            mes_referencia: Mês de referência para filtrar
+            log_callback: Função para logging (opcional)
+            
+        Returns:
+            Lista de caminhos dos arquivos que pertencem ao mês de referência
+        """
+        if numpy_disponivel():
+            # Decodifica todas as chaves de uma vez e filtra o mês com uma máscara
+            nfes = [arquivo for arquivo in arquivos if arquivo.tipo == TIPO_NFE and arquivo.chave]
+            chaves = decodificar_chaves([arquivo.chave for arquivo in nfes])
+            aamm = (mes_referencia.year - 2000) * 100 + mes_referencia.month
+            selecionados = [nfes[i] for i in indices_da_mascara(mascara_meses(chaves, [aamm]))]
+        else:
+            selecionados = [arquivo for arquivo in arquivos
+                            if arquivo.tipo == TIPO_NFE
+                            and self.pertence_ao_mes_referencia(arquivo.chave, mes_referencia)]
         
-        # Filtra apenas os arquivos que pertencem ao mês de referência
         arquivos_para_copiar = []
-        arquivos_verificados = 0
+        for arquivo in selecionados:
+            arquivos_para_copiar.append(arquivo.caminho)
+            # Log individual para debugar
+            if log_callback:
+                log_callback(f"✅ INCLUÍDO: {os.path.basename(arquivo.caminho)} (AAMM: {arquivo.aamm})")
+        return arquivos_para_copiar
+    
+    def agrupar_por_mes(self, arquivos: List[ArquivoClassificado], 
+                        meses: Optional[Set[str]] = None) -> Dict[str, List[str]]:
+        """
+        Separa as NFes já classificadas pelo AAMM da chave de acesso, para
+        processar vários meses a partir de uma única varredura.
         
-        for arquivo_xml in todos_arquivos_xml:
-            arquivos_verificados += 1
-            if arquivos_verificados % 100 == 0 and log_callback:  # Log a cada 100 arquivos
-                log_callback(f"Verificados {arquivos_verificados}/{len(todos_arquivos_xml)} arquivos...")
+        Args:
+            arquivos: Arquivos classificados por varrer_pasta
+            meses: AAMMs desejados (padrão: todos os encontrados)
             
-            try:
-                chave_acesso = self.extrair_chave_de_acesso(arquivo_xml)
-                if chave_acesso and self.pertence_ao_mes_referencia(chave_acesso, mes_referencia):
-                    arquivos_para_copiar.append(arquivo_xml)
-                    # Log individual para debugar
-                    if log_callback:
-                        aamm = chave_acesso[2:6]
-                        log_callback(f"✅ INCLUÍDO: {os.path.basename(arquivo_xml)} (AAMM: {aamm})")
-            except Exception as e:
-                # Se der erro ao ler o XML, pula o arquivo
-                if log_callback:
-                    log_callback(f"AVISO: Erro ao verificar {os.path.basename(arquivo_xml)}: {e}")
+        Returns:
+            Dicionário {AAMM: caminhos dos arquivos do mês}, em ordem de AAMM
+        """
+        arquivos_por_mes = {}
+        for arquivo in arquivos:
+            if arquivo.tipo != TIPO_NFE or not arquivo.aamm:
+                continue
+            if meses is not None and arquivo.aamm not in meses:
                 continue
+            arquivos_por_mes.setdefault(arquivo.aamm, []).append(arquivo.caminho)
+        return dict(sorted(arquivos_por_mes.items()))
+    
+    def filtrar_arquivos_por_chave(self, pasta_origem: str, mes_referencia: datetime, 
+                                   log_callback=None, 
+                                   indice: Optional[IndiceVarredura] = None) -> List[str]:
+        """
+        Filtra arquivos XML baseado na chave de acesso da NFe.
         
-        return arquivos_para_copiar
+        Args:
+            pasta_origem: Pasta onde estão os arquivos XML
+            mes_referencia: Mês de referência para filtrar
+            log_callback: Função para logging (opcional)
+            indice: Índice persistente; com o modo vigia ativo, substitui a varredura (opcional)
+            
+        Returns:
+            Lista de caminhos dos arquivos que pertencem ao mês de referência
+        """
+        varredura = self.obter_varredura(pasta_origem, log_callback, indice)
+        return self.selecionar_arquivos_do_mes(varredura.arquivos, mes_referencia, log_callback)
     
     def extrair_dados_de_xml(self, caminho_arquivo_xml: str, 
-                            canceled_keys_set: Set[str]) -> List[Dict[str, str]]:
+                            canceled_keys_set: Set[str]) -> List[ItemNota]:
         """
-        Lê um arquivo XML de NFe e retorna uma lista de dicionários,
-        um para cada item/produto na nota.
+        Lê um arquivo XML de NFe e retorna um registro para cada item/produto
+        da nota, todos apontando para o mesmo cabeçalho.
         
         Args:
             caminho_arquivo_xml: Caminho para o arquivo XML
             canceled_keys_set: Conjunto de chaves de notas canceladas
             
         Returns:
-            Lista de dicionários com dados dos produtos
+            Lista de ItemNota com dados dos produtos
         """
         try:
-            with open(caminho_arquivo_xml, 'r', encoding='utf-8') as arquivo:
-                nfe_dict = xmltodict.parse(arquivo.read())
-            
-            infNFe = nfe_dict.get('nfeProc', {}).get('NFe', {}).get('infNFe', {})
-            if not infNFe:
-                infNFe = nfe_dict.get('NFe', {}).get('infNFe', {})
-            if not infNFe:
-                print(f"AVISO: Estrutura XML não reconhecida em {os.path.basename(caminho_arquivo_xml)}")
-                return []
-            
-            # Extrai informações da nota
-            chave_acesso = infNFe.get('@Id', 'NFe').replace('NFe', '')
-            status = 'Cancelada' if chave_acesso in canceled_keys_set else 'Autorizada'
-            
-            pagamento_info = infNFe.get('pag', {}).get('detPag', {})
-            if isinstance(pagamento_info, list):
-                pagamento_info = pagamento_info[0]
-            
-            cod_pagamento = pagamento_info.get('tPag', '99')
-            forma_pagamento = self.pagamento_map.get(cod_pagamento, 'Outros')
-            
-            # Dados gerais da nota (que se repetem para cada produto)
-            dados_gerais = {
-                'arquivo': os.path.basename(caminho_arquivo_xml),
-                'data_emissao': infNFe.get('ide', {}).get('dhEmi', 'N/A'),
-                'numero_nfe': infNFe.get('ide', {}).get('nNF', 'N/A'),
-                'emitente_nome': infNFe.get('emit', {}).get('xNome', 'N/A'),
-                'emitente_cnpj': infNFe.get('emit', {}).get('CNPJ', 'N/A'),
-                'destinatario_nome': infNFe.get('dest', {}).get('xNome', 'N/A'),
-                'valor_total_nota': infNFe.get('total', {}).get('ICMSTot', {}).get('vNF', '0.00'),
-                'status': status,
-                'forma_pagamento': forma_pagamento
-            }
-
-            lista_produtos = []
-            itens_nfe = infNFe.get('det', [])
-
-            # Garante que 'itens_nfe' seja sempre uma lista
-            if not isinstance(itens_nfe, list):
-                itens_nfe = [itens_nfe]
-
-            # Itera sobre cada produto da nota
-            for item in itens_nfe:
-                prod = item.get('prod', {})
-                
-                dados_produto_especifico = {
-                    'codigo_produto': prod.get('cProd', 'N/A'),
-                    'descricao_produto': prod.get('xProd', 'N/A'),
-                    'ncm': prod.get('NCM', 'N/A'),
-                    'quantidade': prod.get('qCom', '0'),
-                    'valor_unitario': prod.get('vUnCom', '0.00'),
-                    'valor_total_produto': prod.get('vProd', '0.00'),
-                }
-                
-                # Junta os dados gerais com os dados do produto específico
-                linha_completa = {**dados_gerais, **dados_produto_especifico}
-                lista_produtos.append(linha_completa)
-            
-            return lista_produtos
-
+            return self._ler_dados_de_xml(caminho_arquivo_xml, canceled_keys_set)
         except Exception as e:
             print(f"ERRO ao processar o arquivo XML {os.path.basename(caminho_arquivo_xml)}: {e}")
             return []
     
-    def salvar_dados_em_csv(self, lista_de_dados: List[Dict[str, str]], 
-                           caminho_arquivo_csv: str, total_geral: float) -> bool:
+    def _ler_dados_de_xml(self, caminho_arquivo_xml: str, canceled_keys_set: Set[str],
+                          conteudo: Optional[bytes] = None) -> List[ItemNota]:
+        """Extrai os itens de um XML de NFe (do conteúdo, se já lido); erros de leitura são propagados"""
+        return self._ler_nota_de_xml(caminho_arquivo_xml, canceled_keys_set, conteudo)[1]
+    
+    def _ler_nota_de_xml(self, caminho_arquivo_xml: str, canceled_keys_set: Set[str],
+                         conteudo: Optional[bytes] = None) -> Tuple[Optional[CabecalhoNota], List[ItemNota]]:
+        """
+        Extrai o cabeçalho e os itens de um XML de NFe (do conteúdo, se já lido).
+        
+        Returns:
+            Tupla (cabeçalho ou None se a estrutura não for reconhecida, itens)
+        """
+        dados_nota = self.extrator.extrair(caminho_arquivo_xml if conteudo is None else conteudo)
+        if dados_nota is None:
+            print(f"AVISO: Estrutura XML não reconhecida em {os.path.basename(caminho_arquivo_xml)}")
+            return None, []
+        
+        # Extrai informações da nota
+        campos = dados_nota.campos
+        chave_acesso = (dados_nota.id_infnfe or 'NFe').replace('NFe', '')
+        status = STATUS_CANCELADA if chave_acesso in canceled_keys_set else STATUS_AUTORIZADA
+        
+        cod_pagamento = campos.get('tPag', '99')
+        forma_pagamento = self.pagamento_map.get(cod_pagamento, 'Outros')
+        
+        # Dados gerais da nota (compartilhados por todos os produtos)
+        cabecalho = criar_cabecalho(
+            chave_acesso,
+            os.path.basename(caminho_arquivo_xml),
+            campos.get('dhEmi', 'N/A'),
+            campos.get('nNF', 'N/A'),
+            campos.get('emit_xNome', 'N/A'),
+            campos.get('emit_CNPJ', 'N/A'),
+            campos.get('dest_xNome', 'N/A'),
+            campos.get('vNF', '0.00'),
+            status,
+            forma_pagamento
+        )
+        
+        # Um registro por produto da nota
+        return cabecalho, [
+            criar_item(
+                cabecalho,
+                prod.get('cProd', 'N/A'),
+                prod.get('xProd', 'N/A'),
+                prod.get('NCM', 'N/A'),
+                prod.get('qCom', '0'),
+                prod.get('vUnCom', '0.00'),
+                prod.get('vProd', '0.00'),
+            )
+            for prod in dados_nota.itens
+        ]
+    
+    def criar_pool_extracao(self, canceled_keys_set: Set[str],
+                            max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+        """
+        Cria o pool de processos da extração, para ser compartilhado por vários
+        lotes (ex.: os meses processados ao mesmo tempo) sem multiplicar os processos.
+        
+        Args:
+            canceled_keys_set: Conjunto de chaves de notas canceladas
+            max_workers: Quantidade de processos (padrão: self.workers_extracao)
+            
+        Returns:
+            ProcessPoolExecutor (o chamador encerra o pool, ex.: com 'with')
+        """
+        return ProcessPoolExecutor(max_workers=max_workers or self.workers_extracao,
+                                   initializer=_inicializar_worker_extracao,
+                                   initargs=(self, canceled_keys_set))
+    
+    def extrair_dados_em_lote(self, caminhos_arquivos_xml: List[str], canceled_keys_set: Set[str],
+                              max_workers: Optional[int] = None,
+                              devolver_conteudo: bool = False,
+                              pool: Optional[ProcessPoolExecutor] = None) -> Iterator[ResultadoExtracao]:
+        """
+        Extrai os dados de vários XMLs distribuindo os arquivos entre processos.
+        
+        Os resultados saem na mesma ordem da lista de entrada. Um arquivo com
+        erro gera um ResultadoExtracao com a mensagem em 'erro', sem
+        interromper o restante do lote.
+        
+        Args:
+            caminhos_arquivos_xml: Caminhos dos arquivos XML
+            canceled_keys_set: Conjunto de chaves de notas canceladas
+            max_workers: Quantidade de processos (padrão: self.workers_extracao)
+            devolver_conteudo: Devolve também os bytes lidos (cada arquivo é
+                lido uma única vez, para a extração e para quem chamou)
+            pool: Pool já criado por criar_pool_extracao, com as mesmas chaves
+                canceladas (opcional; sem ele, um pool é criado para o lote)
+            
+        Yields:
+            ResultadoExtracao para cada arquivo, na ordem de entrada
+        """
+        max_workers = max_workers or self.workers_extracao
+        
+        # Poucos arquivos ou um único processo: não compensa usar o pool
+        if max_workers <= 1 or len(caminhos_arquivos_xml) < (2 if pool else 2 * max_workers):
+            for caminho in caminhos_arquivos_xml:
+                yield self._extrair_resultado(caminho, canceled_keys_set, devolver_conteudo)
+            return
+        
+        with ExitStack() as pilha:
+            if pool is None:
+                pool = pilha.enter_context(self.criar_pool_extracao(canceled_keys_set, max_workers))
+            # Lotes grandes diminuem a comunicação entre processos sem desbalancear a carga
+            tamanho_lote = max(1, min(256, len(caminhos_arquivos_xml) // (max_workers * 4)))
+            for resultado in pool.map(_extrair_arquivo_no_worker, caminhos_arquivos_xml,
+                                      repeat(devolver_conteudo), chunksize=tamanho_lote):
+                # Os textos chegam do outro processo sem internar
+                nota, linhas = internar_nota(resultado.nota, resultado.linhas)
+                yield resultado._replace(nota=nota, linhas=linhas)
+    
+    def armazenar_em_lote(self, caminhos_arquivos_xml: List[str], canceled_keys_set: Set[str],
+                          armazem: ArmazemNotas, max_workers: Optional[int] = None,
+                          log_callback=None) -> int:
+        """
+        Extrai vários XMLs e grava as notas, os itens e os cancelamentos no
+        armazém SQLite (ex.: para carregar meses já arquivados).
+        
+        Args:
+            caminhos_arquivos_xml: Caminhos dos arquivos XML
+            canceled_keys_set: Conjunto de chaves de notas canceladas
+            armazem: Armazém de destino (ver ArmazemNotas.na_pasta)
+            max_workers: Quantidade de processos (padrão: self.workers_extracao)
+            log_callback: Função para logging (opcional)
+            
+        Returns:
+            Quantidade de itens gravados
+        """
+        armazem.registrar_cancelamentos(canceled_keys_set)
+        itens_antes = armazem.linhas_escritas
+        for resultado in self.extrair_dados_em_lote(caminhos_arquivos_xml, canceled_keys_set, max_workers):
+            if resultado.erro:
+                if log_callback:
+                    log_callback(f"ERRO ao processar o arquivo XML {os.path.basename(resultado.caminho)}: {resultado.erro}")
+                continue
+            armazem.escrever_nota(resultado.linhas, resultado.nota)
+        armazem.gravar()
+        return armazem.linhas_escritas - itens_antes
+    
+    def _extrair_resultado(self, caminho_arquivo_xml: str, canceled_keys_set: Set[str],
+                           devolver_conteudo: bool = False) -> ResultadoExtracao:
+        """
+        Extrai um arquivo e converte exceções em um ResultadoExtracao com erro.
+        Com devolver_conteudo, o arquivo é lido uma vez e os bytes seguem no
+        resultado mesmo que a extração falhe.
+        """
+        conteudo = None
+        try:
+            if devolver_conteudo:
+                with open(caminho_arquivo_xml, 'rb') as arquivo:
+                    conteudo = arquivo.read()
+            cabecalho, itens = self._ler_nota_de_xml(caminho_arquivo_xml, canceled_keys_set, conteudo)
+            return ResultadoExtracao(caminho_arquivo_xml, itens, None, conteudo, cabecalho)
+        except Exception as e:
+            return ResultadoExtracao(caminho_arquivo_xml, [], str(e), conteudo)
+    
+    def salvar_dados_em_csv(self, lista_de_dados: List[ItemNota], 
+                           caminho_arquivo_csv: str, total_geral: float, log_callback=None) -> bool:
         """
         Salva uma lista de dados de produtos em um arquivo CSV.
         
         Args:
-            lista_de_dados: Lista de dicionários com dados dos produtos
+            lista_de_dados: Itens das notas (ItemNota)
             caminho_arquivo_csv: Caminho onde salvar o CSV
             total_geral: Valor total geral das notas
+            log_callback: Função para logging (padrão: print)
             
         Returns:
             True se salvou com sucesso, False caso contrário
         """
+        log = log_callback or print
         if not lista_de_dados:
-            print("Nenhum dado de NFe para salvar no resumo CSV.")
+            log("Nenhum dado de NFe para salvar no resumo CSV.")
             return False
             
         try:
-            cabecalho = [
-                'status', 'arquivo', 'data_emissao', 'numero_nfe', 'emitente_nome', 'emitente_cnpj',
-                'destinatario_nome', 'forma_pagamento', 'codigo_produto', 'descricao_produto', 'ncm',
-                'quantidade', 'valor_unitario', 'valor_total_produto', 'valor_total_nota'
-            ]
-            
             with open(caminho_arquivo_csv, 'w', newline='', encoding='utf-8-sig') as arquivo_csv:
-                escritor = csv.DictWriter(arquivo_csv, fieldnames=cabecalho, delimiter=';')
-                escritor.writeheader()
-                escritor.writerows(lista_de_dados)
-                
-                # Escreve a linha de total
-                escritor.writerow({})
-                linha_total = {
-                    'valor_total_produto': 'TOTAL GERAL DAS NOTAS:',
-                    'valor_total_nota': f'{total_geral:.2f}'.replace('.', ',')
-                }
-                escritor.writerow(linha_total)
+                escritor = csv.writer(arquivo_csv, delimiter=';')
+                escritor.writerow(CABECALHO_CSV)
+                escritor.writerows(item.como_linha() for item in lista_de_dados)
+                escrever_rodape_csv(escritor, total_geral)
 
-            print(f"SUCESSO: Resumo detalhado salvo em '{caminho_arquivo_csv}'")
+            log(f"SUCESSO: Resumo detalhado salvo em '{caminho_arquivo_csv}'")
+            return True
+            
+        except Exception as e:
+            log(f"ERRO ao salvar o arquivo CSV detalhado: {e}")
+            return False
+    
+    def anexar_dados_em_csv(self, lista_de_dados: List[ItemNota], 
+                            caminho_arquivo_csv: str, total_adicional: float, 
+                            log_callback=None) -> bool:
+        """
+        Acrescenta linhas a um resumo CSV já existente, reescrevendo apenas o
+        rodapé com o total atualizado. Se o CSV não existir (ou não tiver o
+        rodapé esperado), ele é criado do zero com as linhas informadas.
+        
+        Args:
+            lista_de_dados: Itens das notas (ItemNota)
+            caminho_arquivo_csv: Caminho do CSV do mês
+            total_adicional: Valor das notas novas a somar ao total do rodapé
+            log_callback: Função para logging (padrão: print)
+            
+        Returns:
+            True se salvou com sucesso, False caso contrário
+        """
+        log = log_callback or print
+        if not lista_de_dados:
+            return True
+        
+        try:
+            inicio_rodape, total_anterior = localizar_rodape_csv(caminho_arquivo_csv)
+        except OSError:
+            inicio_rodape, total_anterior = None, 0
+        if inicio_rodape is None:
+            return self.salvar_dados_em_csv(lista_de_dados, caminho_arquivo_csv, total_adicional, log_callback)
+        
+        try:
+            # Remove o rodapé antigo e escreve as linhas novas seguidas do novo rodapé
+            with open(caminho_arquivo_csv, 'r+b') as arquivo_csv:
+                arquivo_csv.truncate(inicio_rodape)
+            with open(caminho_arquivo_csv, 'a', newline='', encoding='utf-8') as arquivo_csv:
+                escritor = csv.writer(arquivo_csv, delimiter=';')
+                escritor.writerows(item.como_linha() for item in lista_de_dados)
+                escrever_rodape_csv(escritor, total_anterior + Decimal(str(total_adicional)))
+            
+            log(f"SUCESSO: {len(lista_de_dados)} linhas acrescentadas em '{caminho_arquivo_csv}'")
             return True
             
         except Exception as e:
-            print(f"ERRO ao salvar o arquivo CSV detalhado: {e}")
+            log(f"ERRO ao acrescentar dados ao arquivo CSV detalhado: {e}")
             return False
     
-    def encontrar_notas_canceladas(self, pasta_origem: str) -> Set[str]:
+    def selecionar_arquivos_novos(self, arquivos: List[ArquivoClassificado], 
+                                  marca_dagua: MarcaDagua) -> List[ArquivoClassificado]:
+        """
+        Seleciona as NFes criadas ou alteradas desde a última execução
+        incremental cujas chaves ainda não foram incluídas no backup.
+        
+        Args:
+            arquivos: Arquivos classificados por varrer_pasta
+            marca_dagua: Marca d'água lida do índice
+            
+        Returns:
+            Lista de arquivos novos
+        """
+        return [
+            arquivo for arquivo in arquivos
+            if arquivo.tipo == TIPO_NFE and arquivo.aamm
+            and arquivo.chave not in marca_dagua.chaves_processadas
+            and (marca_dagua.ultima_varredura_ns is None 
+                 or arquivo.alterado_ns >= marca_dagua.ultima_varredura_ns)
+        ]
+    
+    def encontrar_notas_canceladas(self, pasta_origem: str, 
+                                   indice: Optional[IndiceVarredura] = None) -> Set[str]:
         """
         Varre uma pasta para encontrar todos os XMLs de evento de cancelamento
         e retorna um conjunto com as chaves de acesso das notas canceladas.
         
+        Prefira varrer_pasta quando também for filtrar os arquivos do mês,
+        para não percorrer a pasta duas vezes.
+        
         Args:
             pasta_origem: Pasta onde procurar os XMLs
+            indice: Índice persistente; só arquivos novos ou alterados são lidos (opcional)
             
         Returns:
             Conjunto com as chaves das notas canceladas
         """
-        canceled_keys = set()
         print("Iniciando verificação de notas canceladas...")
-        
-        for root, _, files in os.walk(pasta_origem):
-            for file in files:
-                if file.endswith(".xml"):
-                    file_path = os.path.join(root, file)
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            xml_content = f.read()
-                        
-                        # Verifica se é XML de evento de cancelamento
-                        if '<evento' in xml_content.lower() and '<tpEvento>110111</tpEvento>' in xml_content:
-                            # Extrai a chave de acesso do evento de cancelamento
-                            chave_match = re.search(r'<chNFe>(\d{44})</chNFe>', xml_content)
-                            if chave_match:
-                                canceled_keys.add(chave_match.group(1))
-                    except Exception:
-                        continue  # Ignora arquivos com problemas
-        
+        canceled_keys = self.obter_varredura(pasta_origem, indice=indice).chaves_canceladas
         print(f"Encontradas {len(canceled_keys)} notas canceladas.")
-        return canceled_keys
\ No newline at end of file
+        return canceled_keys
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Registros extraídos das NFes para os relatórios
+Cada nota gera um único CabecalhoNota, compartilhado por todos os seus itens.
+Textos que se repetem entre notas (emitente, destinatário, NCM, produtos) são
+internados, de modo que meses com muitas notas ocupam bem menos memória que
+um dicionário completo por item.
+"""
+
+import sys
+from typing import List, NamedTuple, Optional, Tuple
+
+# Situações da nota
+STATUS_AUTORIZADA = 'Autorizada'
+STATUS_CANCELADA = 'Cancelada'
+
+
+class CabecalhoNota(NamedTuple):
+    """Dados gerais da nota, que se repetem em todas as linhas dos seus itens"""
+    chave_acesso: str
+    arquivo: str
+    data_emissao: str
+    numero_nfe: str
+    emitente_nome: str
+    emitente_cnpj: str
+    destinatario_nome: str
+    valor_total_nota: str
+    status: str
+    forma_pagamento: str
+
+    @property
+    def autorizada(self) -> bool:
+        return self.status == STATUS_AUTORIZADA
+
+
+class ItemNota(NamedTuple):
+    """Um produto da nota, apontando para o cabeçalho compartilhado"""
+    nota: CabecalhoNota
+    codigo_produto: str
+    descricao_produto: str
+    ncm: str
+    quantidade: str
+    valor_unitario: str
+    valor_total_produto: str
+
+    def como_linha(self) -> Tuple[str, ...]:
+        """Valores na ordem das colunas do resumo CSV (ver CABECALHO_CSV)"""
+        nota = self.nota
+        return (nota.status, nota.arquivo, nota.data_emissao, nota.numero_nfe,
+                nota.emitente_nome, nota.emitente_cnpj, nota.destinatario_nome,
+                nota.forma_pagamento, self.codigo_produto, self.descricao_produto,
+                self.ncm, self.quantidade, self.valor_unitario,
+                self.valor_total_produto, nota.valor_total_nota)
+
+
+def _internar(texto):
+    return sys.intern(texto) if type(texto) is str else texto
+
+
+def criar_cabecalho(*campos: str) -> CabecalhoNota:
+    """Cria o cabeçalho internando os textos (mesma ordem de CabecalhoNota)"""
+    return CabecalhoNota(*map(_internar, campos))
+
+
+def criar_item(nota: CabecalhoNota, *campos: str) -> ItemNota:
+    """Cria o item internando os textos (mesma ordem de ItemNota, sem a nota)"""
+    return ItemNota(nota, *map(_internar, campos))
+
+
+def internar_nota(nota: Optional[CabecalhoNota],
+                  itens: List[ItemNota]) -> Tuple[Optional[CabecalhoNota], List[ItemNota]]:
+    """
+    Interna de novo os textos de uma nota recebida de outro processo (a cópia
+    feita entre processos não preserva os textos internados). O cabeçalho é
+    recriado uma única vez e os itens passam a apontar para ele.
+
+    Args:
+        nota: Cabeçalho da nota (None se não houver)
+        itens: Itens de uma ou mais notas
+
+    Returns:
+        Tupla (cabeçalho, itens) equivalentes com os textos internados
+    """
+    cabecalhos = {}
+    if nota is not None:
+        cabecalhos[id(nota)] = criar_cabecalho(*nota)
+    resultado = []
+    for item in itens:
+        cabecalho = cabecalhos.get(id(item.nota))
+        if cabecalho is None:
+            cabecalho = cabecalhos[id(item.nota)] = criar_cabecalho(*item.nota)
+        resultado.append(criar_item(cabecalho, *item[1:]))
+    return (cabecalhos[id(nota)] if nota is not None else None), resultado
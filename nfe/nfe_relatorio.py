@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gravação dos relatórios das NFes
+O EscritorResumoCsv grava as linhas de cada nota assim que ela é extraída e
+acumula o total geral internamente, escrevendo o rodapé apenas ao fechar.
+Assim a memória usada não depende da quantidade de itens do mês.
+
+O EscritorRelatorioNormalizado grava o mesmo conteúdo em duas tabelas (uma
+linha por nota e uma por item, ligadas pela chave de acesso) e um manifesto
+JSON, sem repetir os dados da nota em cada item.
+"""
+
+import csv
+import hashlib
+import json
+import os
+from datetime import datetime
+from decimal import Decimal
+from itertools import groupby
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .nfe_registros import ItemNota, STATUS_AUTORIZADA
+from .nfe_agregacao import valor_decimal
+
+
+# Colunas do resumo CSV e rótulo da linha de total (rodapé)
+CABECALHO_CSV = [
+    'status', 'arquivo', 'data_emissao', 'numero_nfe', 'emitente_nome', 'emitente_cnpj',
+    'destinatario_nome', 'forma_pagamento', 'codigo_produto', 'descricao_produto', 'ncm',
+    'quantidade', 'valor_unitario', 'valor_total_produto', 'valor_total_nota'
+]
+ROTULO_TOTAL_CSV = 'TOTAL GERAL DAS NOTAS:'
+
+# Rodapé do CSV (linha vazia + linha de total), usado para acrescentar linhas
+RODAPE_CSV = (';' * (len(CABECALHO_CSV) - 1) + '\r\n'
+              + ';' * (len(CABECALHO_CSV) - 2) + ROTULO_TOTAL_CSV + ';').encode('utf-8')
+
+# Quantidade de bytes lida do final do CSV para localizar o rodapé
+TAMANHO_BUSCA_RODAPE = 4096
+
+
+def escrever_rodape_csv(escritor, total_geral) -> None:
+    """Escreve a linha vazia e a linha de total no final do CSV"""
+    escritor.writerow([''] * len(CABECALHO_CSV))
+    escritor.writerow([''] * (len(CABECALHO_CSV) - 2) + [
+        ROTULO_TOTAL_CSV, f'{total_geral:.2f}'.replace('.', ',')
+    ])
+
+
+def localizar_rodape_csv(caminho_arquivo_csv: str) -> Tuple[Optional[int], Decimal]:
+    """
+    Localiza o rodapé lendo só o final do arquivo.
+
+    Returns:
+        Tupla (posição em bytes onde o rodapé começa ou None, total do rodapé)
+    """
+    with open(caminho_arquivo_csv, 'rb') as arquivo_csv:
+        tamanho = arquivo_csv.seek(0, os.SEEK_END)
+        inicio_leitura = max(0, tamanho - TAMANHO_BUSCA_RODAPE)
+        arquivo_csv.seek(inicio_leitura)
+        final = arquivo_csv.read()
+
+    posicao = final.rfind(RODAPE_CSV)
+    if posicao < 0:
+        return None, Decimal(0)
+    total = valor_decimal(final[posicao + len(RODAPE_CSV):].strip().decode('utf-8'))
+    if total is None:
+        return None, Decimal(0)
+    return inicio_leitura + posicao, total
+
+
+class EscritorResumoCsv:
+    """
+    Grava o resumo CSV (';' e utf-8-sig) nota a nota.
+
+    O arquivo só é criado quando a primeira nota é escrita. No modo anexar,
+    o rodapé de um CSV existente é removido e o total dele passa a ser o
+    ponto de partida do total geral; se o CSV não existir (ou não tiver o
+    rodapé esperado), ele é criado do zero.
+
+    Uso:
+        with EscritorResumoCsv(caminho) as escritor:
+            for itens in notas:
+                escritor.escrever_nota(itens)
+    """
+
+    def __init__(self, caminho_arquivo_csv: str, anexar: bool = False):
+        self.caminho = caminho_arquivo_csv
+        self.anexar = anexar
+        self.total_geral = Decimal(0)
+        self.linhas_escritas = 0
+        self.notas_escritas = 0
+        self._arquivo = None
+        self._escritor = None
+        self._nota_atual = None
+        self._chaves_somadas = set()
+
+    def __enter__(self) -> 'EscritorResumoCsv':
+        return self
+
+    def __exit__(self, tipo_excecao, excecao, rastreamento) -> None:
+        self.fechar()
+
+    def _abrir(self) -> None:
+        """Abre o arquivo e escreve o cabeçalho (ou remove o rodapé, ao anexar)"""
+        inicio_rodape = None
+        if self.anexar:
+            try:
+                inicio_rodape, self.total_geral = localizar_rodape_csv(self.caminho)
+            except OSError:
+                inicio_rodape = None
+
+        if inicio_rodape is not None:
+            with open(self.caminho, 'r+b') as arquivo_csv:
+                arquivo_csv.truncate(inicio_rodape)
+            self._arquivo = open(self.caminho, 'a', newline='', encoding='utf-8')
+            self._escritor = csv.writer(self._arquivo, delimiter=';')
+        else:
+            self.total_geral = Decimal(0)
+            self._arquivo = open(self.caminho, 'w', newline='', encoding='utf-8-sig')
+            self._escritor = csv.writer(self._arquivo, delimiter=';')
+            self._escritor.writerow(CABECALHO_CSV)
+
+    def escrever_nota(self, itens: Iterable[ItemNota]) -> None:
+        """
+        Escreve as linhas dos itens e soma o valor das notas autorizadas
+        (com Decimal, uma única vez por chave de acesso).
+
+        Args:
+            itens: Itens de uma nota (ou de várias notas)
+        """
+        for item in itens:
+            if self._escritor is None:
+                self._abrir()
+            self._escritor.writerow(item.como_linha())
+            self.linhas_escritas += 1
+
+            nota = item.nota
+            if nota is not self._nota_atual:
+                self._nota_atual = nota
+                self.notas_escritas += 1
+                identificador = nota.chave_acesso or nota.arquivo
+                if nota.autorizada and identificador not in self._chaves_somadas:
+                    self._chaves_somadas.add(identificador)
+                    self.total_geral += valor_decimal(nota.valor_total_nota) or 0
+
+    def fechar(self) -> None:
+        """Escreve o rodapé com o total geral e fecha o arquivo"""
+        if self._arquivo is None:
+            return
+        try:
+            escrever_rodape_csv(self._escritor, self.total_geral)
+        finally:
+            self._arquivo.close()
+            self._arquivo = None
+            self._escritor = None
+
+
+# Formatos de relatório do mês
+FORMATO_DETALHADO = 'detalhado'      # Resumo_Detalhado (uma linha por item, com os dados da nota)
+FORMATO_NORMALIZADO = 'normalizado'  # Tabelas de notas e de itens + manifesto
+FORMATO_AMBOS = 'ambos'
+FORMATOS_RELATORIO = (FORMATO_DETALHADO, FORMATO_NORMALIZADO, FORMATO_AMBOS)
+
+# Colunas das tabelas normalizadas
+COLUNAS_NOTAS = [
+    'chave_acesso', 'status', 'arquivo', 'data_emissao', 'numero_nfe', 'emitente_nome',
+    'emitente_cnpj', 'destinatario_nome', 'forma_pagamento', 'valor_total_nota', 'quantidade_itens'
+]
+COLUNAS_ITENS = [
+    'chave_acesso', 'item', 'codigo_produto', 'descricao_produto', 'ncm',
+    'quantidade', 'valor_unitario', 'valor_total_produto'
+]
+
+# Versão 2: o SHA-256 de cada tabela é guardado por trecho gravado (ver _resumir_trecho)
+VERSAO_MANIFESTO = 2
+
+
+def _resumir_trecho(caminho: str, inicio: int) -> Dict:
+    """
+    Tamanho e SHA-256 da tabela a partir de 'inicio'. Cada execução resume só
+    o trecho que acrescentou; os trechos anteriores seguem no manifesto.
+    """
+    resumo = hashlib.sha256()
+    tamanho = 0
+    with open(caminho, 'rb') as arquivo:
+        arquivo.seek(inicio)
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+            resumo.update(bloco)
+            tamanho += len(bloco)
+    return {'inicio': inicio, 'bytes': tamanho, 'sha256': resumo.hexdigest()}
+
+
+def _contar_linhas(caminho: str) -> int:
+    """Linhas de dados de uma tabela (sem o cabeçalho; textos com quebra de linha contam uma vez)"""
+    with open(caminho, newline='', encoding='utf-8-sig') as arquivo:
+        return max(0, sum(1 for _ in csv.reader(arquivo, delimiter=';')) - 1)
+
+
+class EscritorRelatorioNormalizado:
+    """
+    Grava as tabelas de notas e de itens (';' e utf-8-sig) nota a nota e, ao
+    fechar, o manifesto com as colunas, a quantidade de linhas e o SHA-256
+    de cada tabela e o total das notas autorizadas.
+
+    A tabela de notas tem uma linha por chave de acesso: notas repetidas
+    (na mesma execução ou, no modo anexar, já presentes na tabela) não são
+    gravadas de novo. No modo anexar, contagens e total continuam do
+    manifesto anterior e só os bytes acrescentados são resumidos; sem um
+    manifesto que confira com as tabelas, elas são relidas uma vez.
+    """
+
+    def __init__(self, caminho_notas: str, caminho_itens: str, caminho_manifesto: str,
+                 anexar: bool = False, mes_referencia: Optional[str] = None):
+        self.caminho_notas = caminho_notas
+        self.caminho_itens = caminho_itens
+        self.caminho_manifesto = caminho_manifesto
+        self.anexar = anexar
+        self.mes_referencia = mes_referencia
+        self.linhas_escritas = 0
+        self.notas_escritas = 0
+        self._arquivos = []
+        self._escritor_notas = None
+        self._escritor_itens = None
+        # Estado das tabelas completas: notas já gravadas, contagens, total e trechos resumidos
+        self._chaves_gravadas = set()
+        self._total_autorizadas = Decimal(0)
+        self._tabelas = {}
+
+    def __enter__(self) -> 'EscritorRelatorioNormalizado':
+        return self
+
+    def __exit__(self, tipo_excecao, excecao, rastreamento) -> None:
+        self.fechar()
+
+    @property
+    def caminhos(self) -> List[str]:
+        """Arquivos gerados (tabelas e manifesto)"""
+        return [self.caminho_notas, self.caminho_itens, self.caminho_manifesto]
+
+    def _carregar_manifesto(self) -> Optional[Dict]:
+        """Manifesto anterior, se for desta versão e conferir com o tamanho das tabelas"""
+        try:
+            with open(self.caminho_manifesto, encoding='utf-8') as arquivo:
+                manifesto = json.load(arquivo)
+            tabelas = {tabela['tabela']: tabela for tabela in manifesto['tabelas']}
+            if (manifesto.get('versao') != VERSAO_MANIFESTO
+                    or tabelas['notas']['bytes'] != os.path.getsize(self.caminho_notas)
+                    or tabelas['itens']['bytes'] != os.path.getsize(self.caminho_itens)):
+                return None
+            manifesto['total_notas_autorizadas'] = Decimal(manifesto['total_notas_autorizadas'])
+            manifesto['tabelas'] = tabelas
+            return manifesto
+        except (OSError, ValueError, KeyError, TypeError, ArithmeticError):
+            return None
+
+    def _ler_notas_gravadas(self, somar: bool) -> int:
+        """
+        Lê as chaves da tabela de notas existente (e, com 'somar', o total das
+        autorizadas, quando não há manifesto válido).
+
+        Returns:
+            Quantidade de notas na tabela
+        """
+        quantidade = 0
+        with open(self.caminho_notas, newline='', encoding='utf-8-sig') as arquivo:
+            for linha in csv.DictReader(arquivo, delimiter=';'):
+                quantidade += 1
+                identificador = linha['chave_acesso'] or linha['arquivo']
+                if identificador in self._chaves_gravadas:
+                    continue
+                self._chaves_gravadas.add(identificador)
+                if somar and linha['status'] == STATUS_AUTORIZADA:
+                    self._total_autorizadas += valor_decimal(linha['valor_total_nota']) or 0
+        return quantidade
+
+    def _abrir(self) -> None:
+        """Abre as tabelas (acrescentando às existentes no modo anexar)"""
+        continuar = (self.anexar and os.path.exists(self.caminho_notas)
+                     and os.path.exists(self.caminho_itens))
+        if continuar:
+            manifesto = self._carregar_manifesto()
+            if manifesto:
+                self._ler_notas_gravadas(somar=False)
+                self._total_autorizadas = manifesto['total_notas_autorizadas']
+                self._tabelas = {
+                    nome: {'linhas': tabela['linhas'], 'partes': list(tabela['partes'])}
+                    for nome, tabela in manifesto['tabelas'].items()
+                }
+            else:
+                # Tabelas sem manifesto conferido: relidas e resumidas por inteiro uma vez
+                self._tabelas = {
+                    'notas': {'linhas': self._ler_notas_gravadas(somar=True),
+                              'partes': [_resumir_trecho(self.caminho_notas, 0)]},
+                    'itens': {'linhas': _contar_linhas(self.caminho_itens),
+                              'partes': [_resumir_trecho(self.caminho_itens, 0)]},
+                }
+        else:
+            self._tabelas = {'notas': {'linhas': 0, 'partes': []}, 'itens': {'linhas': 0, 'partes': []}}
+
+        for nome, caminho, colunas in (('notas', self.caminho_notas, COLUNAS_NOTAS),
+                                       ('itens', self.caminho_itens, COLUNAS_ITENS)):
+            if continuar:
+                self._tabelas[nome]['inicio'] = os.path.getsize(caminho)
+                arquivo = open(caminho, 'a', newline='', encoding='utf-8')
+                escritor = csv.writer(arquivo, delimiter=';')
+            else:
+                self._tabelas[nome]['inicio'] = 0
+                arquivo = open(caminho, 'w', newline='', encoding='utf-8-sig')
+                escritor = csv.writer(arquivo, delimiter=';')
+                escritor.writerow(colunas)
+            self._arquivos.append(arquivo)
+            if nome == 'notas':
+                self._escritor_notas = escritor
+            else:
+                self._escritor_itens = escritor
+
+    def escrever_nota(self, itens: Iterable[ItemNota]) -> None:
+        """
+        Escreve uma linha por nota e uma por item (notas já gravadas são ignoradas).
+
+        Args:
+            itens: Itens de uma nota (ou de várias notas, em sequência)
+        """
+        for nota, itens_da_nota in groupby(itens, key=lambda item: item.nota):
+            if self._escritor_notas is None:
+                self._abrir()
+            identificador = nota.chave_acesso or nota.arquivo
+            if identificador in self._chaves_gravadas:
+                continue
+            self._chaves_gravadas.add(identificador)
+            itens_da_nota = list(itens_da_nota)
+
+            self._escritor_notas.writerow((
+                nota.chave_acesso, nota.status, nota.arquivo, nota.data_emissao, nota.numero_nfe,
+                nota.emitente_nome, nota.emitente_cnpj, nota.destinatario_nome,
+                nota.forma_pagamento, nota.valor_total_nota, len(itens_da_nota)
+            ))
+            self._escritor_itens.writerows(
+                (nota.chave_acesso, numero_item, item.codigo_produto, item.descricao_produto,
+                 item.ncm, item.quantidade, item.valor_unitario, item.valor_total_produto)
+                for numero_item, item in enumerate(itens_da_nota, start=1)
+            )
+            if nota.autorizada:
+                self._total_autorizadas += valor_decimal(nota.valor_total_nota) or 0
+            self.notas_escritas += 1
+            self.linhas_escritas += len(itens_da_nota)
+
+    def _descrever_tabela(self, nome: str, caminho: str, colunas: List[str], linhas_novas: int) -> Dict:
+        """Nome, colunas, linhas, tamanho e trechos (com SHA-256) de uma tabela, para o manifesto"""
+        tabela = self._tabelas[nome]
+        trecho = _resumir_trecho(caminho, tabela['inicio'])
+        partes = tabela['partes'] + ([trecho] if trecho['bytes'] or not tabela['partes'] else [])
+        return {
+            'tabela': nome,
+            'arquivo': os.path.basename(caminho),
+            'colunas': colunas,
+            'linhas': tabela['linhas'] + linhas_novas,
+            'bytes': os.path.getsize(caminho),
+            'partes': partes,
+        }
+
+    def fechar(self) -> None:
+        """Fecha as tabelas e grava o manifesto"""
+        if not self._arquivos:
+            return
+        for arquivo in self._arquivos:
+            arquivo.close()
+        self._arquivos = []
+        self._escritor_notas = None
+        self._escritor_itens = None
+
+        manifesto = {
+            'versao': VERSAO_MANIFESTO,
+            'mes_referencia': self.mes_referencia,
+            'gerado_em': datetime.now().isoformat(timespec='seconds'),
+            'delimitador': ';',
+            'codificacao': 'utf-8-sig',
+            'chave': 'chave_acesso',
+            'total_notas_autorizadas': f'{self._total_autorizadas:.2f}',
+            'tabelas': [
+                self._descrever_tabela('notas', self.caminho_notas, COLUNAS_NOTAS, self.notas_escritas),
+                self._descrever_tabela('itens', self.caminho_itens, COLUNAS_ITENS, self.linhas_escritas),
+            ],
+        }
+        with open(self.caminho_manifesto, 'w', encoding='utf-8') as arquivo:
+            json.dump(manifesto, arquivo, ensure_ascii=False, indent=2)
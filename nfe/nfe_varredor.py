@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Varredura paralela de diretórios
+Lista as subpastas em paralelo com os.scandir e devolve os arquivos XML
+à medida que são encontrados, reaproveitando os dados de stat do DirEntry.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterator, List, NamedTuple, Tuple
+
+
+# Quantidade padrão de threads listando diretórios ao mesmo tempo
+WORKERS_VARREDURA_PADRAO = 8
+
+
+class EntradaXml(NamedTuple):
+    """Arquivo XML encontrado na varredura, com os dados de stat já lidos"""
+    caminho: str
+    nome: str
+    tamanho: int
+    mtime_ns: int
+    alterado_ns: int  # Maior entre mtime e ctime (no Windows, ctime é a data de criação)
+
+
+def _listar_diretorio(pasta: str) -> Tuple[List[EntradaXml], List[str]]:
+    """
+    Lista um único diretório.
+
+    Returns:
+        Tupla (arquivos XML do diretório, subdiretórios a visitar)
+    """
+    arquivos = []
+    subpastas = []
+    try:
+        with os.scandir(pasta) as entradas:
+            for entrada in entradas:
+                try:
+                    if entrada.is_dir(follow_symlinks=False):
+                        subpastas.append(entrada.path)
+                    elif entrada.name.endswith(".xml") and entrada.is_file():
+                        # No Windows o stat do DirEntry vem da própria listagem
+                        info = entrada.stat()
+                        arquivos.append(EntradaXml(entrada.path, entrada.name,
+                                                   info.st_size, info.st_mtime_ns,
+                                                   max(info.st_mtime_ns, info.st_ctime_ns)))
+                except OSError:
+                    continue  # Arquivo removido ou inacessível durante a listagem
+    except OSError:
+        pass  # Pasta inacessível: ignorada, como no os.walk
+    return arquivos, subpastas
+
+
+def varrer_xmls(pasta_origem: str, max_workers: int = WORKERS_VARREDURA_PADRAO) -> Iterator[EntradaXml]:
+    """
+    Percorre a pasta e suas subpastas listando vários diretórios ao mesmo tempo.
+
+    Os arquivos são devolvidos assim que o diretório em que estão é listado,
+    sem montar a lista completa antes. A ordem não é garantida.
+
+    Args:
+        pasta_origem: Pasta raiz da varredura
+        max_workers: Quantidade de threads listando diretórios
+
+    Yields:
+        EntradaXml para cada arquivo .xml encontrado
+    """
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        pendentes = {executor.submit(_listar_diretorio, pasta_origem)}
+        while pendentes:
+            concluidos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+            for futuro in concluidos:
+                arquivos, subpastas = futuro.result()
+                for subpasta in subpastas:
+                    pendentes.add(executor.submit(_listar_diretorio, subpasta))
+                yield from arquivos
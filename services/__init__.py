@@ -6,5 +6,6 @@ Módulo de serviços auxiliares
 from .email_service import EmailService
 from .rclone_service import RcloneService
 from .scheduler_service import SchedulerService
+from .backup_service import BackupService
 
-__all__ = ['EmailService', 'RcloneService', 'SchedulerService']
\ No newline at end of file
+__all__ = ['EmailService', 'RcloneService', 'SchedulerService', 'BackupService']
\ No newline at end of file
@@ -0,0 +1,741 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Serviço de geração do backup mensal de NFes
+Monta a pasta, o resumo CSV e o ZIP de cada mês a partir dos arquivos já
+selecionados pela varredura. Cada XML é lido uma única vez: os mesmos bytes
+alimentam os relatórios e o ZIP, e a pasta do mês pode ser dispensada.
+Vários meses podem ser processados ao mesmo tempo a partir de uma única
+varredura (modo retroativo), e o modo incremental apenas acrescenta as notas
+novas ao CSV e ao ZIP já existentes.
+"""
+
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from nfe.nfe_parser import NFeParser, ArquivoClassificado, TIPO_NFE
+from nfe.nfe_agregacao import AgregadorNotas, formatar_valor
+from nfe.nfe_armazem import ArmazemNotas
+from nfe.nfe_relatorio import (EscritorResumoCsv, EscritorRelatorioNormalizado, FORMATO_DETALHADO,
+                               FORMATO_NORMALIZADO, FORMATO_AMBOS, FORMATOS_RELATORIO)
+from nfe.nfe_indice import IndiceVarredura
+from nfe.nfe_filtro import interpretar_filtro
+from services.copy_service import CopyService, ESTRATEGIA_COPIA
+from services.zip_service import ZipService, MODO_ZIP_ANEXAR, MODO_ZIP_ATUALIZAR, nomes_no_zip
+
+
+# Modos de execução do backup
+MODO_MENSAL = 'mensal'          # Apenas o mês anterior ao atual
+MODO_RETROATIVO = 'retroativo'  # Vários meses a partir de uma única varredura
+MODO_INCREMENTAL = 'incremental'  # Só as notas novas desde a última execução
+
+# Quantidade padrão de meses processados ao mesmo tempo no modo retroativo
+MESES_SIMULTANEOS_PADRAO = 4
+
+# Comentário do ZIP do mês: identifica com que opções e cancelamentos os relatórios foram gerados
+PREFIXO_IMPRESSAO_RELATORIOS = b'nfe-relatorios-v1:'
+
+
+class ResultadoMes(NamedTuple):
+    """Arquivos gerados para um mês de referência"""
+    mes_referencia: datetime
+    nome_pasta: str
+    caminho_csv: str
+    caminho_zip: str
+    arquivos_copiados: List[str]
+    erros: List[str]
+    arquivos_incluidos: List[str]  # Arquivos de origem que estão no ZIP do mês
+    relatorios_adicionais: Tuple[str, ...] = ()  # Totais e, no formato normalizado, tabelas e manifesto
+
+
+class ExecucaoBackup(NamedTuple):
+    """Resultado de uma execução completa do backup (ver BackupService.executar)"""
+    resultados: List[ResultadoMes]
+    erros: List[str]
+
+
+def mes_anterior(data: datetime) -> datetime:
+    """Primeiro dia do mês anterior ao da data informada"""
+    primeiro_dia_mes = data.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return (primeiro_dia_mes - timedelta(days=1)).replace(day=1)
+
+
+def meses_anteriores(data: datetime, quantidade: int) -> List[datetime]:
+    """
+    Lista os meses anteriores ao da data, do mais antigo ao mais recente.
+
+    Args:
+        data: Data de referência (normalmente hoje)
+        quantidade: Quantidade de meses
+
+    Returns:
+        Lista com o primeiro dia de cada mês
+    """
+    meses = []
+    mes = data
+    for _ in range(quantidade):
+        mes = mes_anterior(mes)
+        meses.append(mes)
+    return list(reversed(meses))
+
+
+def aamm_do_mes(mes_referencia: datetime) -> str:
+    """AAMM usado na chave de acesso para o mês"""
+    return mes_referencia.strftime('%y%m')
+
+
+def mes_do_aamm(aamm: str) -> datetime:
+    """Primeiro dia do mês correspondente ao AAMM da chave de acesso"""
+    return datetime(2000 + int(aamm[:2]), int(aamm[2:4]), 1)
+
+
+def _opcao_booleana(valor) -> bool:
+    """Interpreta uma opção True/False do config.ini"""
+    return str(valor).strip().lower() in ('true', '1', 'sim')
+
+
+def ler_opcoes_avancadas(opcoes: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Converte as opções da seção [Options] usadas pelo backup e pelo modo vigia.
+
+    Args:
+        opcoes: Valores como lidos do config.ini (ver OPCOES_AVANCADAS_PADRAO)
+
+    Returns:
+        Dicionário com os valores convertidos (None = padrão do serviço)
+    """
+    return {
+        "workers_varredura": int(opcoes.get('workers_varredura') or 8),
+        "workers_extracao": int(opcoes.get('workers_extracao') or 0) or None,
+        "motor_xml": opcoes.get('motor_xml') or 'auto',
+        "modo_backup": (opcoes.get('modo_backup') or MODO_MENSAL).strip().lower(),
+        "meses_retroativos": int(opcoes.get('meses_retroativos') or 0),
+        "meses_simultaneos": int(opcoes.get('meses_simultaneos') or MESES_SIMULTANEOS_PADRAO),
+        "workers_copia": int(opcoes.get('workers_copia') or 0) or None,
+        "estrategia_copia": (opcoes.get('estrategia_copia') or ESTRATEGIA_COPIA).strip().lower(),
+        "copia_compara_conteudo": _opcao_booleana(opcoes.get('copia_compara_conteudo')),
+        "workers_compressao": int(opcoes.get('workers_compressao') or 0) or None,
+        "pasta_do_mes": _opcao_booleana(opcoes.get('pasta_do_mes', 'True')),
+        "formato_relatorio": (opcoes.get('formato_relatorio') or FORMATO_DETALHADO).strip().lower(),
+        "armazem_notas": _opcao_booleana(opcoes.get('armazem_notas')),
+        "vigia_modo": (opcoes.get('vigia_modo') or 'auto').strip().lower(),
+        "vigia_debounce": float(opcoes.get('vigia_debounce') or 2),
+        "vigia_intervalo_polling": float(opcoes.get('vigia_intervalo_polling') or 10),
+        "filtro_chaves": opcoes.get('filtro_chaves') or '',
+    }
+
+
+def nome_pasta_do_mes(mes_referencia: datetime) -> str:
+    """Nome da pasta local do mês (ex.: 2024-07_JULHO)"""
+    return f"{mes_referencia.strftime('%Y-%m')}_{mes_referencia.strftime('%B').upper()}"
+
+
+class BackupService:
+    """Serviço responsável por gerar a pasta, o CSV e o ZIP de cada mês"""
+
+    def __init__(self, nfe_parser: NFeParser, log_callback: Optional[Callable] = None,
+                 progresso_callback: Optional[Callable[[int], None]] = None,
+                 formato_relatorio: str = FORMATO_DETALHADO, armazenar_notas: bool = False,
+                 workers_copia: Optional[int] = None, comparar_conteudo_copia: bool = False,
+                 estrategia_copia: str = ESTRATEGIA_COPIA, manter_pasta_do_mes: bool = True,
+                 workers_compressao: Optional[int] = None):
+        """
+        Args:
+            nfe_parser: Parser usado na extração dos dados
+            log_callback: Função para logging (padrão: print)
+            progresso_callback: Função chamada com a quantidade de passos concluídos
+            formato_relatorio: detalhado, normalizado ou ambos (ver FORMATOS_RELATORIO)
+            armazenar_notas: Grava também as notas no armazém SQLite da pasta destino
+            workers_copia: Threads de cópia dos XMLs (padrão: WORKERS_COPIA_PADRAO)
+            comparar_conteudo_copia: Compara o conteúdo antes de copiar um arquivo
+                que já está no destino com o mesmo tamanho e outra data
+            estrategia_copia: copia ou link (reflink/hardlink no mesmo volume)
+            manter_pasta_do_mes: Monta a pasta do mês; sem ela, relatórios e ZIP
+                são gerados direto dos arquivos de origem
+            workers_compressao: Threads de compressão do ZIP (padrão: quantidade de CPUs)
+        """
+        self.nfe_parser = nfe_parser
+        self.log = log_callback or print
+        self.progresso = progresso_callback or (lambda passos: None)
+        self.formato_relatorio = formato_relatorio if formato_relatorio in FORMATOS_RELATORIO else FORMATO_DETALHADO
+        self.armazenar_notas = armazenar_notas
+        self.copiador = CopyService(workers_copia, comparar_conteudo_copia, estrategia_copia)
+        self.manter_pasta_do_mes = manter_pasta_do_mes
+        self.workers_compressao = workers_compressao
+
+    @classmethod
+    def das_configuracoes(cls, nfe_parser: NFeParser, configuracoes: Dict[str, Any],
+                          log_callback: Optional[Callable] = None,
+                          progresso_callback: Optional[Callable[[int], None]] = None) -> 'BackupService':
+        """
+        Cria o serviço a partir das configurações da interface.
+
+        Args:
+            nfe_parser: Parser usado na extração dos dados
+            configuracoes: Opções convertidas por ler_opcoes_avancadas
+            log_callback: Função para logging (padrão: print)
+            progresso_callback: Função chamada com a quantidade de passos concluídos
+
+        Returns:
+            BackupService configurado
+        """
+        return cls(nfe_parser, log_callback, progresso_callback,
+                   configuracoes["formato_relatorio"], configuracoes["armazem_notas"],
+                   configuracoes["workers_copia"], configuracoes["copia_compara_conteudo"],
+                   configuracoes["estrategia_copia"], configuracoes["pasta_do_mes"],
+                   configuracoes["workers_compressao"])
+
+    def executar(self, configuracoes: Dict[str, Any],
+                 preparar_progresso: Optional[Callable[[int], None]] = None,
+                 passos_extras_por_mes: int = 0) -> ExecucaoBackup:
+        """
+        Executa o backup: varredura (ou consulta ao índice), filtro por chave,
+        seleção dos meses conforme o modo, geração dos arquivos de cada mês e
+        registro no índice. O envio para a nuvem e o e-mail ficam com a interface.
+
+        Args:
+            configuracoes: pasta_origem, pasta_destino_base e as opções
+                convertidas por ler_opcoes_avancadas
+            preparar_progresso: Chamada com o total de passos antes dos meses (opcional)
+            passos_extras_por_mes: Passos que a interface dará depois, por mês (ex.: uploads)
+
+        Returns:
+            ExecucaoBackup com os resultados dos meses e as mensagens de erro
+        """
+        pasta_destino_base = configuracoes["pasta_destino_base"]
+        hoje = datetime.now()
+        mes_de_referencia = mes_anterior(hoje)
+        modo_retroativo = configuracoes["modo_backup"] == MODO_RETROATIVO
+        modo_incremental = configuracoes["modo_backup"] == MODO_INCREMENTAL
+
+        if modo_retroativo:
+            self.log("MODO RETROATIVO: uma única varredura gera o backup de vários meses")
+        elif modo_incremental:
+            self.log("MODO INCREMENTAL: apenas notas novas desde a última execução serão acrescentadas")
+        else:
+            self.log(f"NOVA LÓGICA: Buscando NFes do mês {mes_de_referencia.strftime('%m/%Y')} baseado na CHAVE DE ACESSO")
+
+        # Motor de leitura dos XMLs (com alternativa automática se não estiver instalado)
+        motor_xml = self.nfe_parser.selecionar_motor(configuracoes["motor_xml"])
+        self.log(f"Motor de leitura XML: {motor_xml}")
+
+        # Uma única varredura classifica os arquivos e coleta as notas canceladas.
+        # O índice persistente evita reler arquivos que não mudaram desde a última execução.
+        inicio_varredura_ns = time.time_ns()
+        with IndiceVarredura.na_pasta(pasta_destino_base) as indice:
+            marca_dagua = indice.carregar_marca_dagua()
+            # Com o modo vigia ativo, o índice já está em dia e a pasta não é percorrida
+            varredura = self.nfe_parser.obter_varredura(
+                configuracoes["pasta_origem"], self.log, indice, configuracoes["workers_varredura"]
+            )
+        canceled_keys = varredura.chaves_canceladas
+        # Filtro pela chave de acesso (UF, meses, CNPJ, modelo, série), antes de abrir os arquivos
+        filtro_chaves = interpretar_filtro(configuracoes["filtro_chaves"])
+        arquivos_varredura = self.nfe_parser.aplicar_filtro_chaves(varredura.arquivos, filtro_chaves)
+        if not filtro_chaves.vazio:
+            self.log(f"Filtro de chaves '{configuracoes['filtro_chaves']}': "
+                     f"{sum(1 for arquivo in arquivos_varredura if arquivo.tipo == TIPO_NFE)} NFes selecionadas")
+
+        if modo_incremental:
+            # Notas criadas ou alteradas desde a marca d'água e ainda não incluídas
+            arquivos_novos = self.nfe_parser.selecionar_arquivos_novos(arquivos_varredura, marca_dagua)
+            if not marca_dagua.chaves_processadas:
+                # Primeira execução (nenhum backup registrado no índice): só o mês de referência,
+                # como no modo mensal; meses anteriores são gerados pelo modo retroativo
+                aamm_referencia = aamm_do_mes(mes_de_referencia)
+                arquivos_novos = [arquivo for arquivo in arquivos_novos if arquivo.aamm == aamm_referencia]
+                self.log(f"Primeira execução incremental: apenas o mês {mes_de_referencia.strftime('%m/%Y')}")
+            self.log(f"Notas novas desde a última execução: {len(arquivos_novos)}")
+            arquivos_por_mes = self.nfe_parser.agrupar_por_mes(arquivos_novos)
+        elif modo_retroativo:
+            # Meses separados pelo AAMM da chave (0 = todos os meses encontrados)
+            meses_desejados = None
+            if configuracoes["meses_retroativos"] > 0:
+                meses_desejados = {aamm_do_mes(mes) for mes in meses_anteriores(hoje, configuracoes["meses_retroativos"])}
+            arquivos_por_mes = self.nfe_parser.agrupar_por_mes(arquivos_varredura, meses_desejados)
+        else:
+            arquivos_para_copiar = self.nfe_parser.selecionar_arquivos_do_mes(
+                arquivos_varredura, mes_de_referencia, self.log
+            )
+            arquivos_por_mes = {aamm_do_mes(mes_de_referencia): arquivos_para_copiar} if arquivos_para_copiar else {}
+
+        resultados_meses = []
+        if arquivos_por_mes:
+            if preparar_progresso:
+                preparar_progresso(1 + sum(self.passos_do_mes(len(arquivos)) + passos_extras_por_mes
+                                           for arquivos in arquivos_por_mes.values()))
+            self.progresso(1)
+            # Cópia, CSV e ZIP de cada mês (vários meses ao mesmo tempo no modo retroativo)
+            resultados_meses = self.processar_meses(
+                arquivos_por_mes, canceled_keys, pasta_destino_base,
+                configuracoes["workers_extracao"], configuracoes["meses_simultaneos"], modo_incremental
+            )
+        elif modo_incremental:
+            self.log("Nenhuma nota nova desde a última execução.")
+        elif modo_retroativo:
+            self.log("⚠️  Nenhum arquivo XML dos meses solicitados foi encontrado com base na chave de acesso.")
+        else:
+            self.log(f"⚠️  Nenhum arquivo XML do mês {mes_de_referencia.strftime('%m/%Y')} foi encontrado com base na chave de acesso.")
+
+        # Marca d'água: chaves incluídas nos backups e, no modo incremental sem falhas,
+        # o início desta varredura (arquivos com falha serão tentados de novo)
+        erros = [erro for resultado_mes in resultados_meses for erro in resultado_mes.erros]
+        with IndiceVarredura.na_pasta(pasta_destino_base) as indice:
+            cancelamentos_tardios = self.registrar_processamento(
+                indice, resultados_meses, varredura.arquivos,
+                inicio_varredura_ns if modo_incremental and not erros else None
+            )
+        # Cancelamentos tardios vão para o resumo e o e-mail como os demais problemas
+        erros.extend(cancelamentos_tardios)
+        return ExecucaoBackup(resultados_meses, erros)
+
+    @staticmethod
+    def passos_do_mes(quantidade_arquivos: int) -> int:
+        """Passos de progresso de um mês: cópia (ou seleção) de cada arquivo, CSV e ZIP"""
+        return quantidade_arquivos + 2
+
+    def processar_mes(self, mes_referencia: datetime, arquivos: List[str],
+                      canceled_keys: Set[str], pasta_destino_base: str,
+                      workers_extracao: Optional[int] = None,
+                      pool_extracao: Optional[ProcessPoolExecutor] = None) -> ResultadoMes:
+        """
+        Copia os arquivos do mês e gera o resumo CSV e o ZIP na mesma leitura.
+
+        Args:
+            mes_referencia: Primeiro dia do mês de referência
+            arquivos: Caminhos dos XMLs do mês na pasta de origem
+            canceled_keys: Chaves de notas canceladas
+            pasta_destino_base: Pasta onde ficam os backups
+            workers_extracao: Processos usados na extração (padrão: os do parser)
+            pool_extracao: Pool de extração compartilhado entre os meses (opcional)
+
+        Returns:
+            ResultadoMes com os caminhos gerados e os erros encontrados
+        """
+        erros = []
+        nome_pasta, caminho_resumo_csv, caminho_arquivo_zip = self._caminhos_do_mes(
+            mes_referencia, pasta_destino_base
+        )
+
+        self.log(f"🎯 RESULTADO: {len(arquivos)} arquivos do mês {mes_referencia.strftime('%m/%Y')} serão copiados!")
+        copiados = self._preparar_arquivos(arquivos, os.path.join(pasta_destino_base, nome_pasta), erros)
+        caminhos_leitura = [destino for _, destino in copiados]
+
+        # Relatórios e ZIP alimentados pela mesma leitura de cada arquivo
+        relatorios_adicionais = ()
+        self.log(f"Iniciando a compactação para '{caminho_arquivo_zip}'...")
+        # O ZIP de uma execução anterior é atualizado: arquivos com o mesmo nome, tamanho e data de
+        # um membro são mantidos sem serem lidos, e só os novos ou alterados são gravados
+        with ZipService(caminho_arquivo_zip, MODO_ZIP_ATUALIZAR, self.workers_compressao) as arquivo_zip:
+            if caminhos_leitura:
+                inalterados = arquivo_zip.manter_inalterados(caminhos_leitura)
+                impressao = self._impressao_relatorios(mes_referencia, canceled_keys)
+                csv_esperado, adicionais_esperados = self._relatorios_do_formato(
+                    nome_pasta, caminho_resumo_csv, pasta_destino_base
+                )
+                # Os totais e as duplicidades valem para o mês inteiro: os relatórios só são
+                # aproveitados se nada mudou desde que foram gerados (mesmos membros, opções e cancelamentos)
+                em_dia = (len(inalterados) == len(caminhos_leitura) and not arquivo_zip.existentes
+                          and arquivo_zip.comentario == impressao
+                          and all(os.path.exists(caminho) for caminho in (csv_esperado,) + adicionais_esperados
+                                  if caminho))
+                if em_dia:
+                    self.log(f"Nenhum XML novo ou alterado: ZIP e relatórios do mês já estão em dia "
+                             f"({len(inalterados)} arquivos conferidos sem leitura).")
+                    caminho_resumo_csv, relatorios_adicionais = csv_esperado, adicionais_esperados
+                else:
+                    escritores = self._criar_escritores(mes_referencia, nome_pasta, caminho_resumo_csv,
+                                                        pasta_destino_base)
+                    gravados = self._gravar_resumo(caminhos_leitura, canceled_keys, workers_extracao, escritores,
+                                                   arquivo_zip=arquivo_zip, pool_extracao=pool_extracao)
+                    caminho_resumo_csv, relatorios_adicionais = self._relatorios_gerados(escritores)
+                    # Sem relatórios completos, a próxima execução precisa refazê-los
+                    arquivo_zip.comentario = impressao if gravados else b''
+            else:
+                caminho_resumo_csv = ""
+            self.progresso(1)
+            falhas = self._completar_zip(arquivo_zip, caminhos_leitura, erros)
+        self.log(f"Compactação concluída com sucesso ({arquivo_zip.membros_gravados} gravados, "
+                 f"{arquivo_zip.membros_mantidos} mantidos, {arquivo_zip.membros_removidos} removidos).")
+        self.progresso(1)
+
+        return ResultadoMes(mes_referencia, nome_pasta, caminho_resumo_csv, caminho_arquivo_zip,
+                            caminhos_leitura if self.manter_pasta_do_mes else [], erros,
+                            [origem for origem, leitura in copiados if leitura not in falhas],
+                            relatorios_adicionais)
+
+    def processar_mes_incremental(self, mes_referencia: datetime, arquivos: List[str],
+                                  canceled_keys: Set[str], pasta_destino_base: str,
+                                  workers_extracao: Optional[int] = None,
+                                  pool_extracao: Optional[ProcessPoolExecutor] = None) -> ResultadoMes:
+        """
+        Acrescenta ao CSV e ao ZIP do mês apenas os arquivos que ainda não
+        estão no ZIP, sem reprocessar as notas já incluídas.
+
+        Args:
+            mes_referencia: Primeiro dia do mês de referência
+            arquivos: Caminhos dos XMLs novos do mês na pasta de origem
+            canceled_keys: Chaves de notas canceladas
+            pasta_destino_base: Pasta onde ficam os backups
+            workers_extracao: Processos usados na extração (padrão: os do parser)
+            pool_extracao: Pool de extração compartilhado entre os meses (opcional)
+
+        Returns:
+            ResultadoMes com os caminhos gerados e os erros encontrados
+        """
+        erros = []
+        nome_pasta, caminho_resumo_csv, caminho_arquivo_zip = self._caminhos_do_mes(
+            mes_referencia, pasta_destino_base
+        )
+
+        # Arquivos que já estão no ZIP (de execuções anteriores) não são repetidos
+        nomes_incluidos = nomes_no_zip(caminho_arquivo_zip)
+        ja_incluidos = [arquivo for arquivo in arquivos if os.path.basename(arquivo) in nomes_incluidos]
+        novos = [arquivo for arquivo in arquivos if os.path.basename(arquivo) not in nomes_incluidos]
+        self.progresso(len(ja_incluidos))
+
+        self.log(f"🎯 INCREMENTAL: {len(novos)} arquivos novos do mês {mes_referencia.strftime('%m/%Y')} serão acrescentados!")
+        copiados = self._preparar_arquivos(novos, os.path.join(pasta_destino_base, nome_pasta), erros)
+        caminhos_leitura = [destino for _, destino in copiados]
+
+        escritores = self._criar_escritores(mes_referencia, nome_pasta, caminho_resumo_csv,
+                                            pasta_destino_base, anexar=True)
+        falhas = set()
+        if caminhos_leitura:
+            self.log(f"Acrescentando {len(caminhos_leitura)} arquivos em '{caminho_arquivo_zip}'...")
+            with ZipService(caminho_arquivo_zip, MODO_ZIP_ANEXAR, self.workers_compressao) as arquivo_zip:
+                if not self._gravar_resumo(caminhos_leitura, canceled_keys, workers_extracao,
+                                           escritores, anexar=True, arquivo_zip=arquivo_zip,
+                                           pool_extracao=pool_extracao):
+                    # Relatórios incompletos: a próxima execução mensal ou retroativa os refaz
+                    arquivo_zip.comentario = b''
+                self.progresso(1)
+                falhas = self._completar_zip(arquivo_zip, caminhos_leitura, erros)
+            self.log("Compactação concluída com sucesso.")
+            self.progresso(1)
+        else:
+            self.progresso(2)
+
+        caminho_resumo_csv, relatorios_adicionais = self._relatorios_gerados(escritores)
+        return ResultadoMes(mes_referencia, nome_pasta, caminho_resumo_csv, caminho_arquivo_zip,
+                            caminhos_leitura if self.manter_pasta_do_mes else [], erros,
+                            ja_incluidos + [origem for origem, leitura in copiados if leitura not in falhas],
+                            relatorios_adicionais)
+
+    def _caminhos_do_mes(self, mes_referencia: datetime, pasta_destino_base: str) -> Tuple[str, str, str]:
+        """
+        Caminhos dos arquivos do mês (a pasta é criada na cópia, se mantida).
+
+        Returns:
+            Tupla (nome da pasta do mês, caminho do CSV, caminho do ZIP)
+        """
+        nome_pasta = nome_pasta_do_mes(mes_referencia)
+        nome_resumo_csv = f"Resumo_Detalhado_NFEs_{nome_pasta}.csv"
+        nome_arquivo_zip = f"NFEs_{mes_referencia.strftime('%b').upper()}_{mes_referencia.strftime('%Y')}.zip"
+        return (nome_pasta, os.path.join(pasta_destino_base, nome_resumo_csv),
+                os.path.join(pasta_destino_base, nome_arquivo_zip))
+
+    def _preparar_arquivos(self, arquivos: List[str], pasta_destino: str,
+                           erros: List[str]) -> List[Tuple[str, str]]:
+        """
+        Arquivos de onde os relatórios e o ZIP serão lidos: as cópias na pasta
+        do mês ou, sem ela, os próprios arquivos de origem. Como na cópia, só o
+        primeiro arquivo com cada nome segue para o ZIP; os demais voltam como erro.
+
+        Returns:
+            Lista de tuplas (caminho de origem, caminho a ser lido)
+        """
+        if self.manter_pasta_do_mes:
+            return self._copiar_arquivos(arquivos, pasta_destino, erros)
+        os.makedirs(os.path.dirname(pasta_destino) or '.', exist_ok=True)
+        self.progresso(len(arquivos))
+        primeiro_com_nome = {}
+        for arquivo in arquivos:
+            nome = os.path.basename(arquivo)
+            if nome in primeiro_com_nome:
+                erros.append(f"Erro ao compactar '{arquivo}': mesmo nome de "
+                             f"'{primeiro_com_nome[nome]}', que já vai para o ZIP")
+            else:
+                primeiro_com_nome[nome] = arquivo
+        return [(arquivo, arquivo) for arquivo in primeiro_com_nome.values()]
+
+    def _completar_zip(self, arquivo_zip: ZipService, caminhos: List[str],
+                       erros: List[str]) -> Set[str]:
+        """
+        Grava no ZIP, lendo do disco, os arquivos que a extração não entregou.
+
+        Returns:
+            Caminhos que não puderam ser incluídos no ZIP
+        """
+        falhas = arquivo_zip.adicionar_faltantes(caminhos)
+        for caminho, erro in falhas:
+            erros.append(f"Erro ao compactar '{os.path.basename(caminho)}': {erro}")
+        return {caminho for caminho, _ in falhas}
+
+    def _copiar_arquivos(self, arquivos: List[str], pasta_destino: str,
+                         erros: List[str]) -> List[Tuple[str, str]]:
+        """
+        Copia os arquivos para a pasta do mês (os que já estão lá, idênticos,
+        não são copiados de novo).
+
+        Returns:
+            Lista de tuplas (caminho de origem, caminho no destino)
+        """
+        relatorio = self.copiador.copiar(arquivos, pasta_destino, self.progresso)
+        copiados = []
+        for resultado in relatorio.resultados:
+            if resultado.erro:
+                erros.append(f"Erro ao copiar '{os.path.basename(resultado.origem)}': {resultado.erro}")
+            else:
+                copiados.append((resultado.origem, resultado.destino))
+        if arquivos:
+            self.log(f"Cópia: {relatorio.copiados} arquivos copiados, {relatorio.ignorados} já estavam no destino, "
+                     f"{relatorio.bytes_copiados / 1048576:.1f} MB em {relatorio.segundos:.1f}s "
+                     f"({relatorio.bytes_por_segundo / 1048576:.1f} MB/s)")
+            metodos = ', '.join(f"{metodo}: {quantidade}" for metodo, quantidade in sorted(relatorio.por_metodo.items()))
+            self.log(f"Montagem da pasta do mês ({metodos})")
+        return copiados
+
+    @staticmethod
+    def _caminhos_relatorios(nome_pasta: str, pasta_destino_base: str) -> Tuple[str, str, str, str]:
+        """
+        Returns:
+            Tupla (totais, tabela de notas, tabela de itens, manifesto) do mês
+        """
+        return (os.path.join(pasta_destino_base, f"Totais_NFEs_{nome_pasta}.csv"),
+                os.path.join(pasta_destino_base, f"Notas_NFEs_{nome_pasta}.csv"),
+                os.path.join(pasta_destino_base, f"Itens_NFEs_{nome_pasta}.csv"),
+                os.path.join(pasta_destino_base, f"Manifesto_NFEs_{nome_pasta}.json"))
+
+    def _relatorios_do_formato(self, nome_pasta: str, caminho_resumo_csv: str,
+                               pasta_destino_base: str) -> Tuple[str, Tuple[str, ...]]:
+        """
+        Relatórios que o formato configurado gera para o mês.
+
+        Returns:
+            Tupla (caminho do resumo CSV ou "" se o formato não o gera, demais relatórios)
+        """
+        caminho_totais, caminho_notas, caminho_itens, caminho_manifesto = self._caminhos_relatorios(
+            nome_pasta, pasta_destino_base
+        )
+        adicionais = (caminho_totais,)
+        if self.formato_relatorio in (FORMATO_NORMALIZADO, FORMATO_AMBOS):
+            adicionais += (caminho_notas, caminho_itens, caminho_manifesto)
+        if self.formato_relatorio in (FORMATO_DETALHADO, FORMATO_AMBOS):
+            return caminho_resumo_csv, adicionais
+        return "", adicionais
+
+    def _impressao_relatorios(self, mes_referencia: datetime, canceled_keys: Set[str]) -> bytes:
+        """
+        Identifica o que os relatórios do mês refletem além dos membros do ZIP:
+        formato, armazém e notas canceladas do mês. Fica gravada como
+        comentário do ZIP.
+        """
+        aamm = aamm_do_mes(mes_referencia)
+        resumo = hashlib.sha256(f"{self.formato_relatorio}|{self.armazenar_notas}".encode('utf-8'))
+        for chave in sorted(chave for chave in canceled_keys if chave[2:6] == aamm):
+            resumo.update(chave.encode('ascii', 'replace'))
+        return PREFIXO_IMPRESSAO_RELATORIOS + resumo.hexdigest().encode('ascii')
+
+    def _criar_escritores(self, mes_referencia: datetime, nome_pasta: str, caminho_resumo_csv: str,
+                          pasta_destino_base: str, anexar: bool = False) -> List:
+        """Escritores dos relatórios do mês conforme o formato configurado, mais o de totais"""
+        caminho_totais, caminho_notas, caminho_itens, caminho_manifesto = self._caminhos_relatorios(
+            nome_pasta, pasta_destino_base
+        )
+        escritores = [AgregadorNotas(caminho_totais, anexar)]
+        if self.formato_relatorio in (FORMATO_DETALHADO, FORMATO_AMBOS):
+            escritores.append(EscritorResumoCsv(caminho_resumo_csv, anexar))
+        if self.formato_relatorio in (FORMATO_NORMALIZADO, FORMATO_AMBOS):
+            escritores.append(EscritorRelatorioNormalizado(
+                caminho_notas, caminho_itens, caminho_manifesto, anexar, mes_referencia.strftime('%Y-%m')
+            ))
+        if self.armazenar_notas:
+            escritores.append(ArmazemNotas.na_pasta(pasta_destino_base))
+        return escritores
+
+    def _relatorios_gerados(self, escritores: List) -> Tuple[str, Tuple[str, ...]]:
+        """
+        Returns:
+            Tupla (caminho do resumo CSV ou "", demais relatórios existentes)
+        """
+        caminho_resumo_csv = ""
+        relatorios_adicionais = []
+        for escritor in escritores:
+            if isinstance(escritor, EscritorResumoCsv):
+                caminho_resumo_csv = escritor.caminho if os.path.exists(escritor.caminho) else ""
+            elif isinstance(escritor, AgregadorNotas):
+                relatorios_adicionais.append(escritor.caminho)
+            elif isinstance(escritor, EscritorRelatorioNormalizado):
+                relatorios_adicionais.extend(escritor.caminhos)
+        return caminho_resumo_csv, tuple(caminho for caminho in relatorios_adicionais
+                                         if os.path.exists(caminho))
+
+    def _gravar_resumo(self, caminhos_arquivos: List[str], canceled_keys: Set[str],
+                       workers_extracao: Optional[int], escritores: List,
+                       anexar: bool = False, arquivo_zip: Optional[ZipService] = None,
+                       pool_extracao: Optional[ProcessPoolExecutor] = None) -> bool:
+        """
+        Extrai as notas e grava as linhas nos relatórios à medida que cada
+        arquivo é lido, sem acumular os itens do mês em memória. Todos os
+        relatórios (e o ZIP, se informado) são alimentados pela mesma leitura
+        dos arquivos.
+
+        Returns:
+            True se os relatórios foram gravados, False caso contrário
+        """
+        self.log("Iniciando extração de dados das NFes...")
+        try:
+            with ExitStack() as pilha:
+                for escritor in escritores:
+                    pilha.enter_context(escritor)
+                # Extração em lote distribuída entre processos (resultados na ordem dos arquivos)
+                for resultado in self.nfe_parser.extrair_dados_em_lote(
+                    caminhos_arquivos, canceled_keys, workers_extracao, arquivo_zip is not None, pool_extracao
+                ):
+                    if resultado.conteudo is not None:
+                        arquivo_zip.adicionar_conteudo(resultado.caminho, resultado.conteudo)
+                    if resultado.erro:
+                        self.log(f"ERRO ao processar o arquivo XML {os.path.basename(resultado.caminho)}: {resultado.erro}")
+                        continue
+                    for escritor in escritores:
+                        if isinstance(escritor, ArmazemNotas):
+                            # O armazém grava também as notas sem itens
+                            escritor.escrever_nota(resultado.linhas, resultado.nota)
+                        else:
+                            escritor.escrever_nota(resultado.linhas)
+        except Exception as e:
+            self.log(f"ERRO ao salvar os relatórios do mês: {e}")
+            return False
+
+        if not any(escritor.linhas_escritas for escritor in escritores):
+            self.log("Nenhum dado de NFe para salvar no resumo CSV.")
+            return False
+        for escritor in escritores:
+            if isinstance(escritor, AgregadorNotas):
+                self.log(f"Total das notas autorizadas: R$ {formatar_valor(escritor.total_geral)} "
+                         f"({escritor.notas_autorizadas} autorizadas, {escritor.notas_canceladas} canceladas, "
+                         f"{escritor.notas_duplicadas} duplicadas)")
+            elif isinstance(escritor, EscritorResumoCsv):
+                if anexar:
+                    self.log(f"SUCESSO: {escritor.linhas_escritas} linhas acrescentadas em '{escritor.caminho}'")
+                else:
+                    self.log(f"SUCESSO: Resumo detalhado salvo em '{escritor.caminho}'")
+            elif isinstance(escritor, ArmazemNotas):
+                self.log(f"SUCESSO: {escritor.linhas_escritas} itens gravados no armazém '{escritor.caminho_banco}'")
+            else:
+                self.log(f"SUCESSO: Relatório normalizado com {escritor.notas_escritas} notas e "
+                         f"{escritor.linhas_escritas} itens salvo em '{escritor.caminho_notas}' e "
+                         f"'{escritor.caminho_itens}'")
+        return True
+
+    def processar_meses(self, arquivos_por_mes: Dict[str, List[str]], canceled_keys: Set[str],
+                        pasta_destino_base: str, workers_extracao: Optional[int] = None,
+                        meses_simultaneos: int = MESES_SIMULTANEOS_PADRAO,
+                        incremental: bool = False) -> List[ResultadoMes]:
+        """
+        Processa vários meses ao mesmo tempo a partir de uma única varredura.
+
+        Os meses em andamento compartilham um único pool de processos de
+        extração, para não sobrecarregar a máquina.
+
+        Args:
+            arquivos_por_mes: Dicionário {AAMM: caminhos} (ver NFeParser.agrupar_por_mes)
+            canceled_keys: Chaves de notas canceladas
+            pasta_destino_base: Pasta onde ficam os backups
+            workers_extracao: Total de processos de extração (padrão: os do parser)
+            meses_simultaneos: Quantidade de meses processados ao mesmo tempo
+            incremental: Acrescenta ao CSV e ao ZIP existentes em vez de recriá-los
+
+        Returns:
+            Lista de ResultadoMes, na ordem dos meses
+        """
+        if not arquivos_por_mes:
+            return []
+
+        if self.armazenar_notas:
+            # Cancelamentos valem também para notas de meses já gravados no armazém
+            try:
+                with ArmazemNotas.na_pasta(pasta_destino_base) as armazem:
+                    armazem.registrar_cancelamentos(canceled_keys)
+            except Exception as e:
+                self.log(f"ERRO ao registrar cancelamentos no armazém: {e}")
+
+        meses_simultaneos = max(1, min(meses_simultaneos, len(arquivos_por_mes)))
+        workers_extracao = workers_extracao or self.nfe_parser.workers_extracao
+
+        with ExitStack() as pilha:
+            pool_extracao = None
+            if workers_extracao > 1:
+                pool_extracao = pilha.enter_context(
+                    self.nfe_parser.criar_pool_extracao(canceled_keys, workers_extracao)
+                )
+            executor = pilha.enter_context(ThreadPoolExecutor(max_workers=meses_simultaneos))
+            futuros = [
+                executor.submit(self._processar_mes_protegido, mes_do_aamm(aamm), arquivos,
+                                canceled_keys, pasta_destino_base, workers_extracao, incremental,
+                                pool_extracao)
+                for aamm, arquivos in arquivos_por_mes.items()
+            ]
+            return [futuro.result() for futuro in futuros]
+
+    def _processar_mes_protegido(self, mes_referencia: datetime, arquivos: List[str],
+                                 canceled_keys: Set[str], pasta_destino_base: str,
+                                 workers_extracao: int, incremental: bool,
+                                 pool_extracao: Optional[ProcessPoolExecutor] = None) -> ResultadoMes:
+        """Processa um mês sem deixar que a falha dele interrompa os demais"""
+        processar = self.processar_mes_incremental if incremental else self.processar_mes
+        try:
+            return processar(mes_referencia, arquivos, canceled_keys,
+                             pasta_destino_base, workers_extracao, pool_extracao)
+        except Exception as e:
+            erro = f"Erro ao processar o mês {mes_referencia.strftime('%m/%Y')}: {e}"
+            self.log(erro)
+            return ResultadoMes(mes_referencia, nome_pasta_do_mes(mes_referencia), "", "", [], [erro], [])
+
+    def registrar_processamento(self, indice: IndiceVarredura, resultados: List[ResultadoMes],
+                                arquivos: List[ArquivoClassificado],
+                                inicio_varredura_ns: Optional[int] = None) -> List[str]:
+        """
+        Grava no índice as chaves incluídas nos backups e, no modo incremental,
+        avança a marca d'água para o início da varredura.
+
+        Antes disso, avisa sobre cancelamentos tardios: notas que entraram como
+        autorizadas em um backup anterior e cujo evento de cancelamento só
+        apareceu depois. Cada cancelamento é avisado uma única vez.
+
+        Args:
+            indice: Índice persistente da pasta destino
+            resultados: Resultados dos meses processados
+            arquivos: Arquivos classificados pela varredura
+            inicio_varredura_ns: Instante em que a varredura começou (opcional)
+
+        Returns:
+            Mensagens dos cancelamentos tardios avisados nesta execução
+        """
+        por_caminho = {arquivo.caminho: arquivo for arquivo in arquivos}
+        chaves = [
+            (por_caminho[caminho].chave, por_caminho[caminho].aamm, caminho)
+            for resultado in resultados for caminho in resultado.arquivos_incluidos
+            if caminho in por_caminho
+        ]
+        tardios = indice.cancelamentos_tardios()
+        mensagens = []
+        for tardio in tardios:
+            mensagem = (f"NFe {tardio.evento.chave} (mês {tardio.aamm}) foi cancelada depois do backup "
+                        f"(protocolo {tardio.evento.protocolo or '-'}, evento em {tardio.evento.dh_evento or '-'}).")
+            self.log(f"AVISO: {mensagem}")
+            mensagens.append(mensagem)
+        indice.registrar_processamento(chaves, inicio_varredura_ns)
+
+        # Notas deste backup já saíram como canceladas; não são cancelamentos tardios
+        canceladas = indice.chaves_canceladas()
+        notificadas = [tardio.evento.chave for tardio in tardios]
+        notificadas.extend(chave for chave, _, _ in chaves if chave in canceladas)
+        indice.marcar_cancelamentos_notificados(notificadas, time.time_ns())
+        return mensagens
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Serviço de cópia dos XMLs para a pasta do mês
+Copia vários arquivos ao mesmo tempo e, quando o sistema permite, sem passar
+os dados pelo Python (copy_file_range ou sendfile). Arquivos que já estão no
+destino com o mesmo tamanho e data de modificação (ou, opcionalmente, com o
+mesmo conteúdo) não são copiados de novo, de modo que repetir um mês depois
+de uma falha parcial só copia o que faltou.
+
+Na estratégia 'link', a pasta do mês é montada sem copiar dados quando
+origem e destino estão no mesmo volume: reflink (cópia sob demanda, em
+Btrfs/XFS) ou, se não houver suporte, hardlink. Em volumes diferentes a
+cópia é feita normalmente.
+"""
+
+import hashlib
+import os
+import shutil
+import stat
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:  # fcntl só existe em sistemas Unix (sem reflink no Windows)
+    fcntl = None
+
+# Threads de cópia (a cópia espera pelo disco, não pela CPU)
+WORKERS_COPIA_PADRAO = 8
+
+# Bytes por chamada de copy_file_range/sendfile
+TAMANHO_BLOCO_COPIA = 8 * 1024 * 1024
+
+# Estratégias de montagem da pasta do mês
+ESTRATEGIA_COPIA = 'copia'  # Sempre copia os dados
+ESTRATEGIA_LINK = 'link'    # Reflink ou hardlink no mesmo volume, cópia nos demais
+ESTRATEGIAS_COPIA = (ESTRATEGIA_COPIA, ESTRATEGIA_LINK)
+
+# Como cada arquivo chegou ao destino
+METODO_COPIA = 'copia'
+METODO_REFLINK = 'reflink'
+METODO_HARDLINK = 'hardlink'
+METODO_EXISTENTE = 'existente'  # Já estava no destino
+
+# ioctl FICLONE (linux/fs.h): o destino passa a compartilhar os blocos da origem
+FICLONE = 0x40049409
+
+# Arquivo temporário (nome único por cópia); o destino só aparece depois da cópia completa
+PREFIXO_TEMPORARIO = '.'
+SUFIXO_TEMPORARIO = '.copiando'
+
+
+class ResultadoCopia(NamedTuple):
+    """Cópia de um arquivo (copiado=False quando ele já estava no destino)"""
+    origem: str
+    destino: str
+    copiado: bool
+    tamanho: int
+    erro: Optional[str] = None
+    metodo: str = METODO_COPIA
+
+
+class RelatorioCopia(NamedTuple):
+    """Resultado da cópia de um lote de arquivos"""
+    resultados: List[ResultadoCopia]
+    segundos: float
+
+    @property
+    def copiados(self) -> int:
+        return sum(1 for resultado in self.resultados if resultado.copiado and not resultado.erro)
+
+    @property
+    def ignorados(self) -> int:
+        return sum(1 for resultado in self.resultados if not resultado.copiado and not resultado.erro)
+
+    @property
+    def bytes_copiados(self) -> int:
+        return sum(resultado.tamanho for resultado in self.resultados if resultado.copiado and not resultado.erro)
+
+    @property
+    def bytes_por_segundo(self) -> float:
+        return self.bytes_copiados / self.segundos if self.segundos > 0 else 0.0
+
+    @property
+    def por_metodo(self) -> Dict[str, int]:
+        """Quantidade de arquivos por método (copia, reflink, hardlink, existente)"""
+        contagem = {}
+        for resultado in self.resultados:
+            if not resultado.erro:
+                contagem[resultado.metodo] = contagem.get(resultado.metodo, 0) + 1
+        return contagem
+
+
+def _resumo_arquivo(caminho: str) -> bytes:
+    """BLAKE2b do conteúdo do arquivo"""
+    resumo = hashlib.blake2b()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+            resumo.update(bloco)
+    return resumo.digest()
+
+
+def _copiar_conteudo(origem, destino, tamanho: int) -> None:
+    """
+    Copia o conteúdo entre dois arquivos abertos, usando a cópia do kernel
+    quando disponível (copy_file_range permite reflink e cópia no servidor).
+    """
+    copiado = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while copiado < tamanho:
+                enviados = os.copy_file_range(origem.fileno(), destino.fileno(), TAMANHO_BLOCO_COPIA)
+                if enviados == 0:
+                    break
+                copiado += enviados
+            if copiado >= tamanho:
+                return
+        except OSError:
+            # Sistema de arquivos sem suporte (ou entre dispositivos em kernels antigos)
+            pass
+
+    if hasattr(os, 'sendfile') and copiado == 0:
+        try:
+            while copiado < tamanho:
+                enviados = os.sendfile(destino.fileno(), origem.fileno(), copiado, TAMANHO_BLOCO_COPIA)
+                if enviados == 0:
+                    break
+                copiado += enviados
+            if copiado >= tamanho:
+                return
+        except OSError:
+            pass
+
+    # Alternativa portátil, continuando de onde a cópia do kernel parou
+    origem.seek(copiado)
+    destino.seek(copiado)
+    destino.truncate()
+    shutil.copyfileobj(origem, destino, TAMANHO_BLOCO_COPIA)
+
+
+def _reflink(origem: str, destino: str) -> bool:
+    """Cria destino compartilhando os blocos da origem; False se o volume não suporta"""
+    if fcntl is None:
+        return False
+    try:
+        with open(origem, 'rb') as arquivo_origem, open(destino, 'wb') as arquivo_destino:
+            fcntl.ioctl(arquivo_destino.fileno(), FICLONE, arquivo_origem.fileno())
+        return True
+    except OSError:
+        if os.path.exists(destino):
+            os.remove(destino)
+        return False
+
+
+class CopyService:
+    """Copia lotes de arquivos em paralelo, pulando os que já estão no destino"""
+
+    def __init__(self, workers: Optional[int] = None, comparar_conteudo: bool = False,
+                 estrategia: str = ESTRATEGIA_COPIA):
+        """
+        Args:
+            workers: Threads de cópia (padrão: WORKERS_COPIA_PADRAO)
+            comparar_conteudo: Com mesmo tamanho e datas diferentes, compara o
+                conteúdo (BLAKE2b) antes de copiar
+            estrategia: copia ou link (ver ESTRATEGIAS_COPIA)
+        """
+        self.workers = workers or WORKERS_COPIA_PADRAO
+        self.comparar_conteudo = comparar_conteudo
+        self.estrategia = estrategia if estrategia in ESTRATEGIAS_COPIA else ESTRATEGIA_COPIA
+        # Volumes sem reflink (por st_dev), para não tentar de novo a cada arquivo
+        self._sem_reflink = set()
+
+    def ja_copiado(self, info_origem: os.stat_result, origem: str, destino: str) -> bool:
+        """
+        Verifica se o destino já tem o arquivo (mesmo tamanho e data de
+        modificação ou, com comparar_conteudo, mesmo conteúdo).
+        """
+        try:
+            info_destino = os.stat(destino)
+        except OSError:
+            return False
+        if info_destino.st_size != info_origem.st_size:
+            return False
+        if info_destino.st_mtime_ns == info_origem.st_mtime_ns:
+            return True
+        if self.comparar_conteudo and _resumo_arquivo(origem) == _resumo_arquivo(destino):
+            # Alinha a data para a próxima execução não precisar comparar de novo
+            os.utime(destino, ns=(info_origem.st_atime_ns, info_origem.st_mtime_ns))
+            return True
+        return False
+
+    def _vincular(self, origem: str, temporario: str, dispositivo: int) -> Optional[str]:
+        """
+        Monta o arquivo no destino sem copiar dados (origem e destino no mesmo volume).
+
+        Returns:
+            METODO_REFLINK, METODO_HARDLINK ou None se nenhum for possível
+        """
+        if dispositivo not in self._sem_reflink:
+            if _reflink(origem, temporario):
+                return METODO_REFLINK
+            self._sem_reflink.add(dispositivo)
+        try:
+            os.link(origem, temporario)
+            return METODO_HARDLINK
+        except OSError:
+            return None
+
+    def copiar_arquivo(self, origem: str, pasta_destino: str,
+                       dispositivo_destino: Optional[int] = None) -> ResultadoCopia:
+        """
+        Copia um arquivo para a pasta, mantendo permissões e data de modificação.
+
+        Args:
+            origem: Caminho do arquivo
+            pasta_destino: Pasta de destino (já existente)
+            dispositivo_destino: st_dev da pasta de destino (estratégia link)
+
+        Returns:
+            ResultadoCopia (com a mensagem de erro, se houver)
+        """
+        destino = os.path.join(pasta_destino, os.path.basename(origem))
+        try:
+            info = os.stat(origem)
+            if self.ja_copiado(info, origem, destino):
+                return ResultadoCopia(origem, destino, False, info.st_size, metodo=METODO_EXISTENTE)
+
+            descritor, temporario = tempfile.mkstemp(
+                suffix=SUFIXO_TEMPORARIO, prefix=PREFIXO_TEMPORARIO + os.path.basename(origem) + '.',
+                dir=pasta_destino
+            )
+            try:
+                metodo = None
+                if self.estrategia == ESTRATEGIA_LINK and info.st_dev == dispositivo_destino:
+                    # Reflink e hardlink criam o arquivo: o nome reservado é liberado antes
+                    os.close(descritor)
+                    descritor = None
+                    os.remove(temporario)
+                    metodo = self._vincular(origem, temporario, info.st_dev)
+                if metodo is None:
+                    metodo = METODO_COPIA
+                    arquivo_temporario = (open(temporario, 'wb') if descritor is None
+                                          else os.fdopen(descritor, 'wb'))
+                    descritor = None
+                    with open(origem, 'rb') as arquivo_origem, arquivo_temporario as arquivo_destino:
+                        _copiar_conteudo(arquivo_origem, arquivo_destino, info.st_size)
+                if metodo != METODO_HARDLINK:
+                    # O hardlink é o mesmo arquivo da origem: permissões e datas já são as dela
+                    os.chmod(temporario, stat.S_IMODE(info.st_mode))
+                    os.utime(temporario, ns=(info.st_atime_ns, info.st_mtime_ns))
+                os.replace(temporario, destino)
+            except BaseException:
+                if descritor is not None:
+                    os.close(descritor)
+                if os.path.lexists(temporario):
+                    os.remove(temporario)
+                raise
+            return ResultadoCopia(origem, destino, True, info.st_size, metodo=metodo)
+        except Exception as e:
+            return ResultadoCopia(origem, destino, False, 0, str(e))
+
+    @staticmethod
+    def _remover_temporarios(pasta_destino: str) -> None:
+        """Remove os temporários deixados por uma execução interrompida"""
+        for entrada in os.scandir(pasta_destino):
+            if entrada.name.startswith(PREFIXO_TEMPORARIO) and entrada.name.endswith(SUFIXO_TEMPORARIO):
+                try:
+                    os.remove(entrada.path)
+                except OSError:
+                    pass
+
+    def copiar(self, arquivos: List[str], pasta_destino: str,
+               progresso_callback: Optional[Callable[[int], None]] = None) -> RelatorioCopia:
+        """
+        Copia os arquivos para a pasta em paralelo.
+
+        Args:
+            arquivos: Caminhos dos arquivos de origem
+            pasta_destino: Pasta de destino (criada se não existir)
+            progresso_callback: Chamada com 1 a cada arquivo concluído (opcional)
+
+        Returns:
+            RelatorioCopia com um resultado por arquivo, na ordem de entrada
+            (arquivos com o nome de outro já enviado à pasta voltam com erro)
+        """
+        os.makedirs(pasta_destino, exist_ok=True)
+        self._remover_temporarios(pasta_destino)
+        dispositivo_destino = os.stat(pasta_destino).st_dev
+        inicio = time.perf_counter()
+        resultados = [None] * len(arquivos)
+
+        # Um destino por nome: o primeiro arquivo com cada nome é copiado
+        primeiro_com_nome = {}
+        a_copiar = []
+        for posicao, arquivo in enumerate(arquivos):
+            nome = os.path.basename(arquivo)
+            if nome in primeiro_com_nome:
+                resultados[posicao] = ResultadoCopia(
+                    arquivo, os.path.join(pasta_destino, nome), False, 0,
+                    f"mesmo nome de '{primeiro_com_nome[nome]}', que já vai para a pasta"
+                )
+                if progresso_callback:
+                    progresso_callback(1)
+                continue
+            primeiro_com_nome[nome] = arquivo
+            a_copiar.append((posicao, arquivo))
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(a_copiar) or 1))) as executor:
+            futuros = {
+                executor.submit(self.copiar_arquivo, arquivo, pasta_destino, dispositivo_destino): posicao
+                for posicao, arquivo in a_copiar
+            }
+            for futuro in as_completed(futuros):
+                resultados[futuros[futuro]] = futuro.result()
+                if progresso_callback:
+                    progresso_callback(1)
+        return RelatorioCopia(resultados, time.perf_counter() - inicio)
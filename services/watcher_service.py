@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Serviço de vigia da pasta de origem
+Classifica cada XML assim que ele chega e grava o resultado no índice
+persistente, para que a execução mensal só precise consultar o índice.
+Usa inotify no Linux e, nos demais sistemas, uma varredura periódica.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Dict, NamedTuple, Optional, Set, Tuple
+
+from nfe.nfe_parser import NFeParser
+from nfe.nfe_indice import IndiceVarredura
+from nfe.nfe_varredor import EntradaXml, varrer_xmls
+
+
+# Modos de detecção de arquivos
+VIGIA_AUTOMATICO = 'auto'
+VIGIA_INOTIFY = 'inotify'
+VIGIA_POLLING = 'polling'
+
+# Tempo (segundos) que um arquivo precisa ficar sem mudanças antes de ser lido
+DEBOUNCE_PADRAO = 2.0
+
+# Intervalo (segundos) entre varreduras no modo polling
+INTERVALO_POLLING_PADRAO = 10.0
+
+# Intervalo (segundos) entre os sinais de vida gravados no índice
+INTERVALO_SINAL = 30.0
+
+# Constantes do inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = getattr(os, 'O_NONBLOCK', 0o4000)  # os.O_NONBLOCK não existe no Windows
+IN_CLOEXEC = 0o2000000
+
+MASCARA_INOTIFY = (IN_CLOSE_WRITE | IN_MODIFY | IN_CREATE | IN_DELETE
+                   | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF)
+CABECALHO_EVENTO = struct.Struct('iIII')
+
+
+class Eventos(NamedTuple):
+    """Mudanças detectadas na pasta desde a última leitura"""
+    alterados: Set[str]
+    removidos: Set[str]
+    ressincronizar: bool  # Eventos perdidos: é preciso varrer a pasta de novo
+
+
+def _eh_xml(caminho: str) -> bool:
+    """Mesmo critério da varredura: arquivos terminados em .xml"""
+    return caminho.endswith(".xml")
+
+
+class FonteInotify:
+    """Eventos do kernel via inotify (Linux), acessado com ctypes"""
+
+    def __init__(self, pasta_origem: str):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falhou")
+        self.pastas_por_wd = {}
+        self.adicionar_arvore(pasta_origem)
+
+    @staticmethod
+    def disponivel() -> bool:
+        """O inotify só existe no Linux"""
+        return sys.platform.startswith('linux')
+
+    def _adicionar_pasta(self, pasta: str) -> None:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(pasta), MASCARA_INOTIFY)
+        if wd >= 0:
+            self.pastas_por_wd[wd] = pasta
+
+    def adicionar_arvore(self, pasta: str) -> Set[str]:
+        """
+        Vigia a pasta e todas as subpastas.
+
+        Returns:
+            XMLs que já existiam nelas (chegaram antes da vigia começar)
+        """
+        existentes = set()
+        for raiz, subpastas, arquivos in os.walk(pasta):
+            self._adicionar_pasta(raiz)
+            existentes.update(os.path.join(raiz, nome) for nome in arquivos if _eh_xml(nome))
+        return existentes
+
+    def ler(self, timeout: float) -> Eventos:
+        alterados, removidos, ressincronizar = set(), set(), False
+        prontos, _, _ = select.select([self.fd], [], [], timeout)
+        if not prontos:
+            return Eventos(alterados, removidos, ressincronizar)
+
+        try:
+            dados = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return Eventos(alterados, removidos, ressincronizar)
+
+        posicao = 0
+        while posicao < len(dados):
+            wd, mascara, _cookie, tamanho = CABECALHO_EVENTO.unpack_from(dados, posicao)
+            posicao += CABECALHO_EVENTO.size
+            nome = os.fsdecode(dados[posicao:posicao + tamanho].rstrip(b'\0'))
+            posicao += tamanho
+
+            if mascara & IN_Q_OVERFLOW:
+                ressincronizar = True
+                continue
+            if mascara & IN_IGNORED:
+                self.pastas_por_wd.pop(wd, None)
+                continue
+            pasta = self.pastas_por_wd.get(wd)
+            if pasta is None:
+                continue
+            caminho = os.path.join(pasta, nome) if nome else pasta
+
+            if mascara & IN_ISDIR:
+                if mascara & (IN_CREATE | IN_MOVED_TO):
+                    # Pasta nova: passa a ser vigiada e seus arquivos entram na fila
+                    alterados.update(self.adicionar_arvore(caminho))
+                elif mascara & IN_MOVED_FROM:
+                    # Pasta movida para fora: os arquivos dela saem do índice na ressincronização
+                    ressincronizar = True
+            elif mascara & IN_MOVE_SELF:
+                # Pasta vigiada mudou de lugar: os caminhos conhecidos ficaram inválidos
+                ressincronizar = True
+            elif mascara & IN_DELETE_SELF:
+                continue  # Os arquivos da pasta já foram informados com IN_DELETE
+            elif _eh_xml(caminho):
+                if mascara & (IN_DELETE | IN_MOVED_FROM):
+                    removidos.add(caminho)
+                    alterados.discard(caminho)
+                else:
+                    alterados.add(caminho)
+                    removidos.discard(caminho)
+
+        return Eventos(alterados, removidos, ressincronizar)
+
+    def fechar(self) -> None:
+        os.close(self.fd)
+
+
+class FontePolling:
+    """Compara listagens periódicas da pasta (funciona em qualquer sistema)"""
+
+    def __init__(self, pasta_origem: str, intervalo: float = INTERVALO_POLLING_PADRAO,
+                 workers: Optional[int] = None):
+        self.pasta_origem = pasta_origem
+        self.intervalo = intervalo
+        self.workers = workers
+        self.retrato = self._listar()
+        self.proxima_listagem = time.monotonic() + intervalo
+
+    def _listar(self) -> Dict[str, Tuple[int, int]]:
+        argumentos = (self.pasta_origem, self.workers) if self.workers else (self.pasta_origem,)
+        return {entrada.caminho: (entrada.tamanho, entrada.mtime_ns)
+                for entrada in varrer_xmls(*argumentos)}
+
+    def ler(self, timeout: float) -> Eventos:
+        espera = self.proxima_listagem - time.monotonic()
+        if espera > 0:
+            time.sleep(min(espera, timeout))
+            if time.monotonic() < self.proxima_listagem:
+                return Eventos(set(), set(), False)
+
+        atual = self._listar()
+        alterados = {caminho for caminho, info in atual.items() if self.retrato.get(caminho) != info}
+        removidos = set(self.retrato) - set(atual)
+        self.retrato = atual
+        self.proxima_listagem = time.monotonic() + self.intervalo
+        return Eventos(alterados, removidos, False)
+
+    def fechar(self) -> None:
+        pass
+
+
+class WatcherService:
+    """Serviço responsável por manter o índice atualizado enquanto os XMLs chegam"""
+
+    def __init__(self, nfe_parser: NFeParser, pasta_origem: str, pasta_destino_base: str,
+                 log_callback: Optional[Callable] = None, modo: str = VIGIA_AUTOMATICO,
+                 debounce: float = DEBOUNCE_PADRAO,
+                 intervalo_polling: float = INTERVALO_POLLING_PADRAO):
+        """
+        Args:
+            nfe_parser: Parser usado na classificação
+            pasta_origem: Pasta vigiada
+            pasta_destino_base: Pasta onde fica o índice
+            log_callback: Função para logging (padrão: print)
+            modo: 'auto', 'inotify' ou 'polling'
+            debounce: Segundos sem mudanças antes de ler um arquivo
+            intervalo_polling: Segundos entre listagens no modo polling
+        """
+        self.nfe_parser = nfe_parser
+        self.pasta_origem = pasta_origem
+        self.pasta_destino_base = pasta_destino_base
+        self.log = log_callback or print
+        self.modo = modo
+        self.debounce = debounce
+        self.intervalo_polling = intervalo_polling
+        self.evento_parada = threading.Event()
+
+        # Fila com debounce: caminho -> (instante do último evento, último stat visto)
+        self.pendentes = {}
+
+    def _criar_fonte(self):
+        """Escolhe o inotify quando disponível, senão a varredura periódica"""
+        if self.modo != VIGIA_POLLING and FonteInotify.disponivel():
+            try:
+                fonte = FonteInotify(self.pasta_origem)
+                self.log("Modo vigia usando inotify.")
+                return fonte
+            except (OSError, AttributeError) as e:
+                self.log(f"AVISO: inotify indisponível ({e}); usando varredura periódica.")
+        self.log(f"Modo vigia usando varredura periódica a cada {self.intervalo_polling:g}s.")
+        return FontePolling(self.pasta_origem, self.intervalo_polling, self.nfe_parser.workers_varredura)
+
+    def parar(self) -> None:
+        """Pede para o laço de executar() terminar"""
+        self.evento_parada.set()
+
+    def executar(self) -> None:
+        """
+        Sincroniza o índice com uma varredura completa e passa a vigiar a
+        pasta até parar() ser chamado.
+        """
+        self.log(f"Iniciando modo vigia em '{self.pasta_origem}'...")
+        # A conexão SQLite precisa ser usada na thread que a criou
+        with IndiceVarredura.na_pasta(self.pasta_destino_base) as indice:
+            fonte = self._criar_fonte()
+            try:
+                self._ressincronizar(indice)
+                proximo_sinal = 0.0
+                while not self.evento_parada.is_set():
+                    eventos = fonte.ler(min(self.debounce, INTERVALO_SINAL) / 2)
+                    if eventos.ressincronizar:
+                        self.log("AVISO: eventos perdidos; sincronizando o índice com a pasta...")
+                        self._ressincronizar(indice)
+                    self._aplicar_eventos(indice, eventos)
+                    self._processar_prontos(indice)
+
+                    # O sinal diz que o índice está em dia: com arquivos ainda na fila
+                    # do debounce ele espera, e a execução mensal percorre a pasta
+                    if not self.pendentes and time.monotonic() >= proximo_sinal:
+                        indice.registrar_sinal_vigia(self.pasta_origem, time.time_ns())
+                        proximo_sinal = time.monotonic() + INTERVALO_SINAL
+            finally:
+                fonte.fechar()
+        self.log("Modo vigia encerrado.")
+
+    def _ressincronizar(self, indice: IndiceVarredura) -> None:
+        """Varredura completa com o índice (só arquivos novos ou alterados são lidos)"""
+        self.nfe_parser.varrer_pasta(self.pasta_origem, self.log, indice)
+        self.pendentes.clear()
+
+    def _aplicar_eventos(self, indice: IndiceVarredura, eventos: Eventos) -> None:
+        """
+        Coloca os arquivos alterados na fila, reiniciando o debounce de cada
+        um, e tira do índice os arquivos removidos.
+        """
+        agora = time.monotonic()
+        for caminho in eventos.alterados:
+            _, stat_anterior = self.pendentes.get(caminho, (agora, None))
+            self.pendentes[caminho] = (agora, stat_anterior)
+        for caminho in eventos.removidos:
+            self.pendentes.pop(caminho, None)
+        if eventos.removidos:
+            indice.remover(eventos.removidos)
+
+    def _processar_prontos(self, indice: IndiceVarredura) -> None:
+        """
+        Classifica os arquivos que ficaram 'debounce' segundos sem eventos e
+        cujo tamanho e mtime não mudaram desde a última verificação (arquivos
+        ainda sendo gravados voltam para a fila).
+        """
+        agora = time.monotonic()
+        registros = []
+        for caminho, (ultimo_evento, stat_anterior) in list(self.pendentes.items()):
+            if agora - ultimo_evento < self.debounce:
+                continue
+            try:
+                info = os.stat(caminho)
+            except OSError:
+                del self.pendentes[caminho]  # Removido antes de ser lido
+                continue
+
+            stat_atual = (info.st_size, info.st_mtime_ns)
+            if stat_atual != stat_anterior:
+                # Ainda mudando (ou primeira verificação): espera mais um ciclo
+                self.pendentes[caminho] = (agora, stat_atual)
+                continue
+
+            del self.pendentes[caminho]
+            entrada = EntradaXml(caminho, os.path.basename(caminho), info.st_size, info.st_mtime_ns,
+                                 max(info.st_mtime_ns, info.st_ctime_ns))
+            registro = self.nfe_parser.classificar_entrada(entrada)
+            registros.append(registro)
+            self.log(f"Classificado: {entrada.nome} ({registro.tipo}, AAMM: {registro.aamm or '-'})")
+
+        if registros:
+            indice.registrar(registros)
+            self.nfe_parser.sincronizar_cancelamentos(indice, registros, self.log)
@@ -0,0 +1,639 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Serviço de montagem do ZIP do mês
+Grava os membros direto dos arquivos de origem ou dos bytes já lidos para a
+extração dos dados, de modo que cada XML é lido do disco uma única vez e não
+precisa passar por uma cópia intermediária na pasta do mês.
+
+A compressão (deflate puro e CRC32) é feita em paralelo por um pool de
+threads (o zlib libera o GIL) e os membros já comprimidos são gravados na
+ordem em que foram adicionados. Cabeçalhos locais, diretório central e
+registros ZIP64 são escritos aqui mesmo (EscritorZip), seguindo o formato
+publicado (APPNOTE); do zipfile só se usa a leitura pública do diretório de
+um ZIP existente.
+
+Um ZIP existente é atualizado no lugar: membros iguais são mantidos, só os
+novos ou alterados são gravados e o diretório central é reescrito no final.
+Arquivos com o mesmo nome, tamanho e data de um membro nem chegam a ser lidos
+(manter_inalterados). Antes de mexer no arquivo, o diretório central antigo é
+guardado em um journal, que desfaz a atualização se ela não chegar ao fim
+(erro ou queda de energia).
+"""
+
+import os
+import struct
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+# Threads de compressão (padrão: quantidade de CPUs)
+WORKERS_COMPRESSAO_PADRAO = os.cpu_count() or 1
+
+# Membros comprimidos aguardando gravação, por thread (limita a memória usada)
+MEMBROS_PENDENTES_POR_WORKER = 8
+
+# Modos de abertura do ZIP
+MODO_ZIP_NOVO = 'novo'            # Recria o ZIP (gravado em um temporário e trocado no final)
+MODO_ZIP_ANEXAR = 'anexar'        # Só acrescenta nomes que ainda não estão no ZIP
+MODO_ZIP_ATUALIZAR = 'atualizar'  # Mantém os iguais, troca os alterados e remove os que sobraram
+
+# Journal de recuperação: identificação, tamanho original e início do diretório central
+SUFIXO_JOURNAL = '.journal'
+ASSINATURA_JOURNAL = b'NFEZIPJ1'
+FORMATO_JOURNAL = '<8sQQ'
+
+# Fração do arquivo ocupada por membros descartados a partir da qual o ZIP é compactado
+LIMITE_ESPACO_DESCARTADO = 0.5
+
+# Registros do formato ZIP: cabeçalho local, entrada do diretório central,
+# fim do diretório e, acima dos limites, fim do diretório ZIP64 e seu localizador
+ASSINATURA_LOCAL = b'PK\x03\x04'
+ASSINATURA_CENTRAL = b'PK\x01\x02'
+ASSINATURA_FIM = b'PK\x05\x06'
+ASSINATURA_FIM_ZIP64 = b'PK\x06\x06'
+ASSINATURA_LOCALIZADOR_ZIP64 = b'PK\x06\x07'
+FORMATO_LOCAL = struct.Struct('<4s5H3L2H')
+FORMATO_CENTRAL = struct.Struct('<4s6H3L5H2L')
+FORMATO_FIM = struct.Struct('<4s4H2LH')
+FORMATO_FIM_ZIP64 = struct.Struct('<4sQ2H2L4Q')
+FORMATO_LOCALIZADOR_ZIP64 = struct.Struct('<4sLQL')
+
+# Tamanhos e posições acima deste limite vão para a extensão ZIP64 (o mesmo do zipfile)
+LIMITE_ZIP64 = (1 << 31) - 1
+LIMITE_MEMBROS = 0xFFFF
+EXTENSAO_ZIP64 = 0x0001
+VERSAO_PADRAO = 20  # Deflate
+VERSAO_ZIP64 = 45
+
+# Bits de flag: dados seguidos de descritor e nome em UTF-8
+FLAG_DESCRITOR = 0x08
+FLAG_UTF8 = 0x800
+
+# Permissões dos membros quando o arquivo de origem não informa nenhuma
+ATRIBUTOS_PADRAO = 0o600 << 16
+
+
+class MembroZip(NamedTuple):
+    """Entrada do diretório central de um membro"""
+    nome: str
+    data_hora: Tuple[int, int, int, int, int, int]
+    atributos_externos: int
+    sistema_origem: int
+    metodo: int
+    flags: int
+    crc: int
+    tamanho_comprimido: int
+    tamanho: int
+    inicio: int = 0  # Posição do cabeçalho local
+
+
+def comprimir_membro(conteudo: bytes) -> Tuple[int, bytes]:
+    """
+    Comprime o conteúdo como o zipfile faria para ZIP_DEFLATED (deflate puro,
+    sem cabeçalho zlib).
+
+    Returns:
+        Tupla (CRC32, dados comprimidos)
+    """
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    return zlib.crc32(conteudo), compressor.compress(conteudo) + compressor.flush()
+
+
+def data_hora_zip(momento: float) -> Tuple[int, int, int, int, int, int]:
+    """Data e hora locais como ficam gravadas no ZIP (formato DOS, segundos pares)"""
+    data = time.localtime(momento)
+    return data.tm_year, data.tm_mon, data.tm_mday, data.tm_hour, data.tm_min, data.tm_sec // 2 * 2
+
+
+def _data_hora_dos(data_hora: Tuple[int, ...]) -> Tuple[int, int]:
+    """Tupla (data, hora) no formato DOS dos cabeçalhos"""
+    ano, mes, dia, hora, minuto, segundo = data_hora
+    return (max(ano - 1980, 0) << 9 | mes << 5 | dia), (hora << 11 | minuto << 5 | segundo // 2)
+
+
+def _codificar_nome(nome: str, flags: int) -> bytes:
+    """Nome do membro em bytes: UTF-8 com o bit de flag ou, sem ele, CP437 (ASCII nos membros novos)"""
+    return nome.encode('utf-8' if flags & FLAG_UTF8 else 'cp437')
+
+
+def _cabecalho_local(membro: MembroZip) -> bytes:
+    """Cabeçalho local do membro (tamanhos na extensão ZIP64 quando passam do limite)"""
+    nome = _codificar_nome(membro.nome, membro.flags)
+    tamanho, tamanho_comprimido = membro.tamanho, membro.tamanho_comprimido
+    extra = b''
+    versao = VERSAO_PADRAO
+    if tamanho > LIMITE_ZIP64 or tamanho_comprimido > LIMITE_ZIP64:
+        extra = struct.pack('<2H2Q', EXTENSAO_ZIP64, 16, tamanho, tamanho_comprimido)
+        tamanho = tamanho_comprimido = 0xFFFFFFFF
+        versao = VERSAO_ZIP64
+    data, hora = _data_hora_dos(membro.data_hora)
+    return FORMATO_LOCAL.pack(ASSINATURA_LOCAL, versao, membro.flags, membro.metodo, hora, data,
+                              membro.crc, tamanho_comprimido, tamanho, len(nome), len(extra)) + nome + extra
+
+
+def _entrada_central(membro: MembroZip) -> bytes:
+    """Entrada do diretório central (valores acima do limite na extensão ZIP64)"""
+    nome = _codificar_nome(membro.nome, membro.flags)
+    # A extensão traz, nesta ordem, só os valores que não cabem nos campos de 32 bits
+    valores = (membro.tamanho, membro.tamanho_comprimido, membro.inicio)
+    extensao = [valor for valor in valores if valor > LIMITE_ZIP64]
+    tamanho, tamanho_comprimido, inicio = (0xFFFFFFFF if valor > LIMITE_ZIP64 else valor for valor in valores)
+    extra = b''
+    versao = VERSAO_PADRAO
+    if extensao:
+        extra = struct.pack(f'<2H{len(extensao)}Q', EXTENSAO_ZIP64, 8 * len(extensao), *extensao)
+        versao = VERSAO_ZIP64
+    data, hora = _data_hora_dos(membro.data_hora)
+    return FORMATO_CENTRAL.pack(ASSINATURA_CENTRAL, membro.sistema_origem << 8 | versao, versao,
+                                membro.flags, membro.metodo, hora, data, membro.crc, tamanho_comprimido,
+                                tamanho, len(nome), len(extra), 0, 0, 0, membro.atributos_externos,
+                                inicio) + nome + extra
+
+
+def _ler_inicio_diretorio(arquivo: BinaryIO) -> int:
+    """
+    Posição do diretório central, lida do registro de fim (ou do registro
+    ZIP64, quando há um).
+
+    Raises:
+        zipfile.BadZipFile: Se o registro de fim não for encontrado
+    """
+    tamanho_arquivo = arquivo.seek(0, os.SEEK_END)
+    inicio_busca = max(tamanho_arquivo - FORMATO_FIM.size - 0xFFFF, 0)
+    arquivo.seek(inicio_busca)
+    final = arquivo.read()
+
+    # O comentário do ZIP pode conter a assinatura: vale o registro cujo comentário cabe no arquivo
+    posicao = final.rfind(ASSINATURA_FIM)
+    while posicao >= 0:
+        if (len(final) - posicao >= FORMATO_FIM.size
+                and posicao + FORMATO_FIM.size + FORMATO_FIM.unpack_from(final, posicao)[7] <= len(final)):
+            break
+        posicao = final.rfind(ASSINATURA_FIM, 0, posicao)
+    if posicao < 0:
+        raise zipfile.BadZipFile("Registro de fim do diretório central não encontrado")
+    inicio_diretorio = FORMATO_FIM.unpack_from(final, posicao)[6]
+
+    posicao_localizador = posicao - FORMATO_LOCALIZADOR_ZIP64.size
+    if posicao_localizador >= 0:
+        localizador = FORMATO_LOCALIZADOR_ZIP64.unpack_from(final, posicao_localizador)
+        if localizador[0] == ASSINATURA_LOCALIZADOR_ZIP64:
+            arquivo.seek(localizador[2])
+            registro = arquivo.read(FORMATO_FIM_ZIP64.size)
+            if len(registro) == FORMATO_FIM_ZIP64.size and registro.startswith(ASSINATURA_FIM_ZIP64):
+                inicio_diretorio = FORMATO_FIM_ZIP64.unpack(registro)[9]
+    return inicio_diretorio
+
+
+def ler_diretorio(arquivo: BinaryIO) -> Tuple[List[MembroZip], int, bytes]:
+    """
+    Lê o diretório central de um ZIP existente.
+
+    Args:
+        arquivo: ZIP aberto para leitura (com seek)
+
+    Returns:
+        Tupla (membros na ordem do diretório, posição do diretório central, comentário do ZIP)
+
+    Raises:
+        zipfile.BadZipFile: Se o arquivo não for um ZIP válido
+    """
+    inicio_diretorio = _ler_inicio_diretorio(arquivo)
+    arquivo.seek(0)
+    with zipfile.ZipFile(arquivo) as arquivo_zip:
+        membros = [MembroZip(info.filename, info.date_time, info.external_attr, info.create_system,
+                             info.compress_type, info.flag_bits, info.CRC, info.compress_size,
+                             info.file_size, info.header_offset)
+                   for info in arquivo_zip.infolist()]
+        return membros, inicio_diretorio, arquivo_zip.comment
+
+
+class EscritorZip:
+    """
+    Grava membros já comprimidos e o diretório central de um ZIP, com os
+    registros ZIP64 quando tamanhos, posições ou a quantidade de membros
+    passam dos limites do formato original.
+    """
+
+    def __init__(self, arquivo: BinaryIO, membros: Iterable[MembroZip] = (), inicio_diretorio: int = 0):
+        """
+        Args:
+            arquivo: Arquivo aberto para gravação (com seek)
+            membros: Membros que já estão no arquivo (ZIP existente)
+            inicio_diretorio: Posição do diretório central atual, onde o próximo membro é gravado
+        """
+        self.arquivo = arquivo
+        self.membros: Dict[str, MembroZip] = {membro.nome: membro for membro in membros}
+        self.inicio_diretorio = inicio_diretorio
+
+    def gravar(self, membro: MembroZip, dados: bytes) -> MembroZip:
+        """
+        Grava o cabeçalho local e os dados depois do último membro e inclui o
+        membro no diretório central (no lugar de um de mesmo nome).
+
+        Args:
+            membro: Metadados do membro (tamanho comprimido e posição são definidos aqui)
+            dados: Conteúdo já comprimido pelo método do membro
+
+        Returns:
+            Membro como ficou no diretório central
+        """
+        # Os tamanhos vão no cabeçalho local, então não há descritor depois dos dados
+        membro = membro._replace(flags=membro.flags & ~FLAG_DESCRITOR, tamanho_comprimido=len(dados),
+                                 inicio=self.inicio_diretorio)
+        cabecalho = _cabecalho_local(membro)
+        self.arquivo.seek(self.inicio_diretorio)
+        self.arquivo.write(cabecalho)
+        self.arquivo.write(dados)
+        self.inicio_diretorio += len(cabecalho) + len(dados)
+        self.membros.pop(membro.nome, None)
+        self.membros[membro.nome] = membro
+        return membro
+
+    def remover(self, nome: str) -> None:
+        """Tira um membro do diretório central (os dados viram espaço descartado)"""
+        self.membros.pop(nome, None)
+
+    def espaco_ocupado(self) -> int:
+        """Bytes ocupados pelos membros do diretório central (cabeçalhos sem extensões)"""
+        return sum(FORMATO_LOCAL.size + len(_codificar_nome(membro.nome, membro.flags))
+                   + membro.tamanho_comprimido for membro in self.membros.values())
+
+    def gravar_diretorio(self, comentario: bytes = b'') -> None:
+        """
+        Grava o diretório central e o registro de fim depois do último membro
+        e descarta o que havia depois deles no arquivo.
+
+        Args:
+            comentario: Comentário do ZIP (até 65535 bytes)
+        """
+        inicio = self.inicio_diretorio
+        self.arquivo.seek(inicio)
+        tamanho = 0
+        for membro in self.membros.values():
+            entrada = _entrada_central(membro)
+            self.arquivo.write(entrada)
+            tamanho += len(entrada)
+
+        quantidade = len(self.membros)
+        if quantidade > LIMITE_MEMBROS or inicio > LIMITE_ZIP64 or tamanho > LIMITE_ZIP64:
+            self.arquivo.write(FORMATO_FIM_ZIP64.pack(
+                ASSINATURA_FIM_ZIP64, FORMATO_FIM_ZIP64.size - 12, VERSAO_ZIP64, VERSAO_ZIP64,
+                0, 0, quantidade, quantidade, tamanho, inicio))
+            self.arquivo.write(FORMATO_LOCALIZADOR_ZIP64.pack(ASSINATURA_LOCALIZADOR_ZIP64, 0, inicio + tamanho, 1))
+            # No registro de fim comum ficam só os marcadores de "valor no registro ZIP64"
+            quantidade = min(quantidade, LIMITE_MEMBROS)
+            tamanho = min(tamanho, 0xFFFFFFFF)
+            inicio = min(inicio, 0xFFFFFFFF)
+        self.arquivo.write(FORMATO_FIM.pack(ASSINATURA_FIM, 0, 0, quantidade, quantidade, tamanho, inicio,
+                                            len(comentario)) + comentario)
+        self.arquivo.truncate()
+
+
+def restaurar_journal(caminho_zip: str) -> bool:
+    """
+    Desfaz uma atualização interrompida: devolve ao ZIP o diretório central
+    guardado no journal e o tamanho original.
+
+    Returns:
+        True se o ZIP foi restaurado
+    """
+    caminho_journal = caminho_zip + SUFIXO_JOURNAL
+    if not os.path.exists(caminho_journal):
+        return False
+    with open(caminho_journal, 'rb') as journal:
+        cabecalho = journal.read(struct.calcsize(FORMATO_JOURNAL))
+        cauda = journal.read()
+
+    restaurado = False
+    if len(cabecalho) == struct.calcsize(FORMATO_JOURNAL):
+        assinatura, tamanho_original, inicio_diretorio = struct.unpack(FORMATO_JOURNAL, cabecalho)
+        # Journal incompleto: a queda foi antes de o ZIP ser alterado
+        if (assinatura == ASSINATURA_JOURNAL and inicio_diretorio + len(cauda) == tamanho_original
+                and os.path.exists(caminho_zip)):
+            with open(caminho_zip, 'r+b') as arquivo:
+                arquivo.seek(inicio_diretorio)
+                arquivo.write(cauda)
+                arquivo.truncate(tamanho_original)
+                arquivo.flush()
+                os.fsync(arquivo.fileno())
+            restaurado = True
+    os.remove(caminho_journal)
+    return restaurado
+
+
+def nomes_no_zip(caminho_zip: str) -> Set[str]:
+    """Nomes dos membros de um ZIP existente (vazio se ele não existe ou está corrompido)"""
+    restaurar_journal(caminho_zip)
+    if not os.path.exists(caminho_zip):
+        return set()
+    try:
+        with zipfile.ZipFile(caminho_zip, 'r') as arquivo_zip:
+            return set(arquivo_zip.namelist())
+    except zipfile.BadZipFile:
+        return set()
+
+
+def _ler_dados_comprimidos(arquivo: BinaryIO, membro: MembroZip) -> bytes:
+    """Lê os dados comprimidos de um membro, sem descomprimir"""
+    arquivo.seek(membro.inicio)
+    cabecalho = arquivo.read(FORMATO_LOCAL.size)
+    tamanho_nome, tamanho_extra = struct.unpack('<HH', cabecalho[26:30])
+    arquivo.seek(membro.inicio + FORMATO_LOCAL.size + tamanho_nome + tamanho_extra)
+    return arquivo.read(membro.tamanho_comprimido)
+
+
+class ZipService:
+    """ZIP do mês aberto para gravação (novo, acrescentando ou atualizando membros)"""
+
+    def __init__(self, caminho_zip: str, modo: str = MODO_ZIP_NOVO, workers: Optional[int] = None):
+        """
+        Args:
+            caminho_zip: Caminho do arquivo ZIP
+            modo: MODO_ZIP_NOVO, MODO_ZIP_ANEXAR ou MODO_ZIP_ATUALIZAR
+            workers: Threads de compressão (padrão: WORKERS_COMPRESSAO_PADRAO; 1 = sem pool)
+        """
+        self.caminho = caminho_zip
+        self.modo = modo
+        self.workers = workers or WORKERS_COMPRESSAO_PADRAO
+        self.nomes: Set[str] = set()  # Membros já presentes no ZIP (ou a caminho dele)
+        self.existentes: Dict[str, MembroZip] = {}  # Membros antigos ainda não conferidos
+        self.comentario = b''  # Comentário do ZIP, mantido de um ZIP existente
+        self.membros_gravados = 0
+        self.membros_mantidos = 0
+        self.membros_removidos = 0
+        self._escritor: Optional[EscritorZip] = None
+        self._arquivo = None
+        self._caminho_gravacao = caminho_zip  # Temporário quando o ZIP é recriado
+        self._journal = False
+        self._comentario_original = b''
+        self._alterado = False  # Algum membro gravado ou descartado
+        self._executor = None
+        self._pendentes = deque()  # (MembroZip, Future) na ordem de adição
+
+    def __enter__(self) -> 'ZipService':
+        self.abrir()
+        return self
+
+    def __exit__(self, tipo_excecao, excecao, rastreamento) -> None:
+        if tipo_excecao is None:
+            self.fechar()
+        else:
+            self.desfazer()
+
+    def abrir(self) -> None:
+        """
+        Abre o ZIP. Nos modos anexar e atualizar, um ZIP existente é aberto no
+        lugar (com journal); sem ZIP válido, ele é recriado.
+        """
+        restaurar_journal(self.caminho)
+        if self.modo != MODO_ZIP_NOVO and os.path.exists(self.caminho):
+            self._arquivo = open(self.caminho, 'r+b')
+            try:
+                membros, inicio_diretorio, self.comentario = ler_diretorio(self._arquivo)
+                self._escritor = EscritorZip(self._arquivo, membros, inicio_diretorio)
+            except (zipfile.BadZipFile, struct.error):
+                # ZIP corrompido: é recriado do zero
+                self._arquivo.close()
+                self.comentario = b''
+
+        if self._escritor is not None:
+            self._comentario_original = self.comentario
+            self._gravar_journal()
+            if self.modo == MODO_ZIP_ATUALIZAR:
+                self.existentes = dict(self._escritor.membros)
+            else:
+                self.nomes = set(self._escritor.membros)
+        else:
+            self._caminho_gravacao = self.caminho + '.tmp'
+            self._arquivo = open(self._caminho_gravacao, 'w+b')
+            self._escritor = EscritorZip(self._arquivo)
+            self._alterado = True
+
+        if self.workers > 1:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    def _gravar_journal(self) -> None:
+        """Guarda o diretório central atual antes de qualquer alteração no ZIP"""
+        inicio_diretorio = self._escritor.inicio_diretorio
+        tamanho = self._arquivo.seek(0, os.SEEK_END)
+        self._arquivo.seek(inicio_diretorio)
+        cauda = self._arquivo.read()
+        with open(self.caminho + SUFIXO_JOURNAL, 'wb') as journal:
+            journal.write(struct.pack(FORMATO_JOURNAL, ASSINATURA_JOURNAL, tamanho, inicio_diretorio))
+            journal.write(cauda)
+            journal.flush()
+            os.fsync(journal.fileno())
+        self._journal = True
+
+    def contem(self, nome: str) -> bool:
+        return nome in self.nomes
+
+    def manter_inalterados(self, caminhos: Iterable[str]) -> Set[str]:
+        """
+        No modo atualizar, mantém sem ler os membros cujo arquivo tem o mesmo
+        nome, tamanho e data de modificação (na resolução de 2 s do ZIP).
+
+        Args:
+            caminhos: Arquivos que vão para o ZIP
+
+        Returns:
+            Caminhos mantidos (não precisam ser lidos nem adicionados)
+        """
+        mantidos = set()
+        for caminho in caminhos:
+            nome = os.path.basename(caminho)
+            existente = self.existentes.get(nome)
+            if existente is None or nome in self.nomes:
+                continue
+            try:
+                estado = os.stat(caminho)
+            except OSError:
+                continue
+            if existente.tamanho == estado.st_size and existente.data_hora == data_hora_zip(estado.st_mtime):
+                del self.existentes[nome]
+                self.nomes.add(nome)
+                self.membros_mantidos += 1
+                mantidos.add(caminho)
+        return mantidos
+
+    def adicionar_conteudo(self, caminho_origem: str, conteudo: bytes,
+                           nome: Optional[str] = None) -> bool:
+        """
+        Grava um membro a partir dos bytes já lidos. Data e permissões vêm do
+        arquivo de origem (só os metadados são consultados).
+
+        Args:
+            caminho_origem: Arquivo de onde o conteúdo foi lido
+            conteudo: Bytes do arquivo
+            nome: Nome do membro (padrão: nome do arquivo)
+
+        Returns:
+            False se o membro não foi gravado (nome repetido ou, no modo
+            atualizar, igual ao que já estava no ZIP)
+        """
+        nome = nome or os.path.basename(caminho_origem)
+        if nome in self.nomes:
+            return False
+        self.nomes.add(nome)
+
+        existente = self.existentes.pop(nome, None)
+        if existente is not None:
+            if existente.tamanho == len(conteudo) and existente.crc == zlib.crc32(conteudo):
+                self.membros_mantidos += 1
+                return False
+            self._descartar(nome)
+        info = zipfile.ZipInfo.from_file(caminho_origem, nome)
+        membro = MembroZip(nome, info.date_time[:5] + (info.date_time[5] // 2 * 2,),
+                           info.external_attr or ATRIBUTOS_PADRAO, info.create_system,
+                           zipfile.ZIP_DEFLATED, 0 if nome.isascii() else FLAG_UTF8,
+                           0, 0, len(conteudo))
+
+        if self._executor is None:
+            self._gravar(membro, *comprimir_membro(conteudo))
+            return True
+
+        self._pendentes.append((membro, self._executor.submit(comprimir_membro, conteudo)))
+        self._gravar_prontos(self.workers * MEMBROS_PENDENTES_POR_WORKER)
+        return True
+
+    def adicionar_arquivo(self, caminho_origem: str, nome: Optional[str] = None) -> bool:
+        """
+        Grava um membro lendo o arquivo de origem.
+
+        Returns:
+            False se o membro não foi gravado (ver adicionar_conteudo)
+        """
+        nome = nome or os.path.basename(caminho_origem)
+        if nome in self.nomes:
+            return False
+        with open(caminho_origem, 'rb') as arquivo:
+            conteudo = arquivo.read()
+        return self.adicionar_conteudo(caminho_origem, conteudo, nome)
+
+    def _descartar(self, nome: str) -> None:
+        """Tira um membro antigo do diretório central (os dados viram espaço descartado)"""
+        self._escritor.remover(nome)
+        self._alterado = True
+
+    def _gravar(self, membro: MembroZip, crc: int, dados: bytes) -> None:
+        self._escritor.gravar(membro._replace(crc=crc), dados)
+        self._alterado = True
+        self.membros_gravados += 1
+
+    def _gravar_prontos(self, maximo_pendentes: int = 0) -> None:
+        """
+        Grava, em ordem, os membros cuja compressão terminou; espera pelos
+        mais antigos enquanto houver mais que maximo_pendentes na fila.
+        """
+        while self._pendentes:
+            membro, futuro = self._pendentes[0]
+            if len(self._pendentes) <= maximo_pendentes and not futuro.done():
+                break
+            self._pendentes.popleft()
+            self._gravar(membro, *futuro.result())
+
+    def adicionar_faltantes(self, caminhos: Iterable[str]) -> List[Tuple[str, str]]:
+        """
+        Grava, lendo do disco, os arquivos que ainda não estão no ZIP (ex.: os
+        que a extração não conseguiu ler).
+
+        Returns:
+            Lista de tuplas (caminho, mensagem de erro) dos arquivos que falharam
+        """
+        falhas = []
+        for caminho in caminhos:
+            if os.path.basename(caminho) in self.nomes:
+                continue
+            try:
+                self.adicionar_arquivo(caminho)
+            except (OSError, ValueError) as e:
+                falhas.append((caminho, str(e)))
+        return falhas
+
+    def fechar(self) -> None:
+        """
+        Grava os membros pendentes e o novo diretório central (no modo
+        atualizar, sem os membros que não vieram nesta execução) e fecha o ZIP.
+        Sem nenhuma alteração, o arquivo não é regravado. Se algo falhar, o ZIP
+        volta ao estado anterior.
+        """
+        if self._escritor is None:
+            return
+        try:
+            self._gravar_prontos()
+            if self.modo == MODO_ZIP_ATUALIZAR:
+                for nome in self.existentes:
+                    self._descartar(nome)
+                self.membros_removidos = len(self.existentes)
+                self.existentes = {}
+
+            # Espaço de membros descartados (nesta ou em execuções anteriores)
+            inicio_diretorio = self._escritor.inicio_diretorio
+            ocupado = self._escritor.espaco_ocupado()
+            if self._alterado or self.comentario != self._comentario_original:
+                self._escritor.gravar_diretorio(self.comentario)
+                self._arquivo.flush()
+                os.fsync(self._arquivo.fileno())
+            self._escritor = None
+            self._arquivo.close()
+            self._arquivo = None
+        except BaseException:
+            self.desfazer()
+            raise
+        finally:
+            self._encerrar_executor()
+
+        if self._caminho_gravacao != self.caminho:
+            os.replace(self._caminho_gravacao, self.caminho)
+        if self._journal:
+            os.remove(self.caminho + SUFIXO_JOURNAL)
+            self._journal = False
+
+        if inicio_diretorio - ocupado > LIMITE_ESPACO_DESCARTADO * inicio_diretorio:
+            self.compactar()
+
+    def desfazer(self) -> None:
+        """Abandona as alterações: descarta o ZIP novo ou restaura o anterior pelo journal"""
+        self._encerrar_executor()
+        self._escritor = None
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+        if self._caminho_gravacao != self.caminho:
+            if os.path.exists(self._caminho_gravacao):
+                os.remove(self._caminho_gravacao)
+        elif self._journal:
+            restaurar_journal(self.caminho)
+            self._journal = False
+
+    def compactar(self) -> None:
+        """
+        Regrava o ZIP só com os membros do diretório central, copiando os dados
+        já comprimidos (sem recomprimir), e troca o arquivo de uma só vez.
+        """
+        temporario = self.caminho + '.tmp'
+        try:
+            with open(self.caminho, 'rb') as origem, open(temporario, 'wb') as destino:
+                membros, _, comentario = ler_diretorio(origem)
+                escritor = EscritorZip(destino)
+                for membro in membros:
+                    escritor.gravar(membro, _ler_dados_comprimidos(origem, membro))
+                escritor.gravar_diretorio(comentario)
+                destino.flush()
+                os.fsync(destino.fileno())
+            os.replace(temporario, self.caminho)
+        except BaseException:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+
+    def _encerrar_executor(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._pendentes.clear()